@@ -1,34 +1,35 @@
+# Imported first so start-up timing covers every other import
+from startup import StartupTimer
 import discord
 from discord.ext import commands
 from discord import app_commands
 from dotenv import load_dotenv
 import asyncio
 import os
-import sqlite3
-from pathlib import Path
 import datetime
 import random
-import pytz
-from contextlib import contextmanager
-from asyncio import Lock, sleep
 import time
 import traceback
 import logging
+import hashlib
+import json
+from storage import Database
+from message_index import ChannelIndex
+from trim_scheduler import TrimScheduler
+from deletion_pipeline import DeletionPipeline
+from deletion_jobs import DeletionJob, DeletionJobStore
+from bounded_cache import BoundedCache
+import metrics
+from rate_limiter import RateLimiter, ROUTE_HISTORY, ROUTE_BULK_DELETE, ROUTE_DELETE
+from rate_budget import RateBudgetClient
+from invalidation_bus import InvalidationBus
+from leaderboard import Leaderboard, record_streak
+from roster import RosterWriter
+import aiohttp
+from aiohttp import web
+from loop_lag import LoopLagMonitor
+import gateway_profile
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-from flask import Flask
-import threading
-app = Flask(__name__)
-
-@app.route("/")
-def home():
-	return "Process is running!"
-
-def run_flask():
-	app.run(host="0.0.0.0", port=5000)
-
-thread = threading.Thread(target=run_flask)
-thread.daemon = True
-thread.start()
 
 MIN_MESSAGES_LIMIT = 1    # Minimum messages to keep
 MAX_FETCH_LIMIT = 3000    # Maximum messages to fetch at once
@@ -37,170 +38,203 @@ FREE_MAX_MESSAGES = 5000  # Original max message limit
 FREE_MAX_CHANNELS = 10     # Maximum channels for free tier
 PREMIUM_MAX_MESSAGES = 5000  # New premium message limit
 PREMIUM_MAX_CHANNELS = 10    # Maximum channels for premium tier
-CACHE_DURATION = 300  # Cache duration in seconds (5 minutes)
+PREMIUM_RECONCILE_INTERVAL = 6 * 60 * 60  # Seconds between full entitlement checks
+TRIM_WORKERS = 4  # Channels trimmed concurrently
+TRIM_DEBOUNCE = 1.0  # Seconds to coalesce a burst of messages into one trim pass
+BULK_DELETE_LIMIT = 100  # Most messages Discord accepts in one bulk delete
+HISTORY_PAGE_SIZE = 100  # Messages returned per history request
+MAX_RATE_LIMIT_RETRIES = 3  # Attempts per API call before giving up on 429s
+MESSAGE_INDEX_CACHE_SIZE = 2000  # Channel message indexes kept in memory
+MESSAGE_INDEX_IDLE_TTL = 6 * 60 * 60  # Seconds a channel can go quiet before its index is dropped
+CACHE_SWEEP_INTERVAL = 300  # Seconds between expired cache sweeps
+MAX_AGE_SWEEP_INTERVAL = 300  # Seconds between sweeps for messages past a channel's max age
+MIN_MAX_AGE_HOURS = 1  # Shortest max age /configure accepts
+MAX_MAX_AGE_HOURS = 24 * 365 * 5  # Longest max age /configure accepts (5 years)
+ROSTER_WRITE_INTERVAL = 30.0  # Seconds between servers.txt rewrites
+USER_TIMEZONE_CACHE_SIZE = 10000  # Users whose timezone is kept in memory
+LEADERBOARD_SHOWN = 5  # Entries shown by /leaderboard
+MEMBER_QUERY_LIMIT = 100  # Most user ids Discord resolves in one member query
+LEGACY_BACKFILL_PAGES = 5  # Pages of older thankers checked each time a guild's leaderboard is shown, until all are
+HEALTH_HOST = "0.0.0.0"  # Health check server address
+HEALTH_PORT = int(os.environ.get('SERVERMAID_HEALTH_PORT', 5000))  # Health check server port
+SHARD_COUNT = int(os.environ.get('SERVERMAID_SHARD_COUNT', 6))  # Total shards across every process
+# Set by cluster.py when this process is one worker of several
+WORKER_ID = os.environ.get('SERVERMAID_WORKER_ID')
+SHARD_IDS = [int(i) for i in os.environ['SERVERMAID_SHARD_IDS'].split(',')] if os.environ.get('SERVERMAID_SHARD_IDS') else None
+READY_MAX_LOOP_LAG = 1.0  # Seconds of event loop lag before we report not ready
+READY_DB_TIMEOUT = 2.0  # Seconds to wait for the database readiness check
 
-def init_database():
-	# Create the database
-	script_dir = os.path.dirname(os.path.abspath(__file__))
-	db_path = os.path.join(script_dir, "server_settings.db")
-	conn = sqlite3.connect(db_path)
-	c = conn.cursor()
-	c.execute('''CREATE TABLE IF NOT EXISTS channel_settings
-				 (server_id TEXT, channel_id TEXT, max_messages INTEGER, keep_pinned BOOLEAN,
-				  PRIMARY KEY (server_id, channel_id))''')
-	# New table for tracking thanks
-	c.execute('''CREATE TABLE IF NOT EXISTS user_thanks
-				 (user_id TEXT, last_thanks_date TEXT, streak INTEGER,
-				  PRIMARY KEY (user_id))''')
-	# New table for server settings
-	c.execute('''CREATE TABLE IF NOT EXISTS server_settings
-				 (guild_id TEXT, setting_name TEXT, setting_value TEXT,
-				  PRIMARY KEY (guild_id, setting_name))''')
-	# New table for user timezone settings
-	c.execute('''CREATE TABLE IF NOT EXISTS user_settings                       
-				 (user_id TEXT, timezone TEXT DEFAULT 'UTC',
-				  PRIMARY KEY (user_id))''')
-	conn.commit()
-	conn.close()
-	return db_path
-
-DB_PATH = init_database()
+MESSAGES_SEEN = metrics.Counter("servermaid_messages_seen_total", "Guild messages seen by on_message", ["managed"])
+MESSAGES_SEEN_MANAGED = MESSAGES_SEEN.labels("true")
+MESSAGES_SEEN_UNMANAGED = MESSAGES_SEEN.labels("false")
+ON_MESSAGE_SECONDS = metrics.Histogram("servermaid_on_message_seconds", "Time spent in on_message for managed channels")
+SETTINGS_LOOKUPS = metrics.Counter("servermaid_settings_lookups_total", "Channel settings lookups", ["result"])
+SETTINGS_HIT = SETTINGS_LOOKUPS.labels("hit")
+SETTINGS_MISS = SETTINGS_LOOKUPS.labels("miss")
+MESSAGES_DELETED = metrics.Counter("servermaid_messages_deleted_total", "Messages deleted", ["method"])
+DELETE_FAILURES = metrics.Counter("servermaid_delete_failures_total", "Messages that could not be deleted", ["method"])
+API_REQUESTS = metrics.Counter("servermaid_api_requests_total", "Rate limited REST calls made by ServerMaid", ["route", "outcome"])
+
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server_settings.db")
+db = Database(DB_PATH)
+startup_timer = StartupTimer()
+deletion_jobs = DeletionJobStore(db)
+thanks_leaderboard = Leaderboard(db)
 
 load_dotenv()
-intents = discord.Intents.default()
-intents.message_content = True
-intents.guilds = True
-intents.dm_messages = False
+GATEWAY_PROFILE = os.environ.get('SERVERMAID_GATEWAY_PROFILE', gateway_profile.DEFAULT_PROFILE)
+client_options = gateway_profile.client_options(GATEWAY_PROFILE)
+
+# In a cluster, the global rate limit is shared with the other workers through the supervisor
+rate_budget = None
+if os.environ.get('SERVERMAID_RATE_BUDGET'):
+	rate_budget = RateBudgetClient(
+		os.environ['SERVERMAID_RATE_BUDGET'],
+		WORKER_ID,
+		workers=int(os.environ.get('SERVERMAID_WORKERS', 1))
+	)
+rate_limiter = RateLimiter(budget=rate_budget)
+
+async def on_request_end(session, trace_ctx, params):
+	"""Feed every REST response's rate limit headers to the rate limiter"""
+	rate_limiter.update_from_headers(params.method, params.url.path, params.response.status, params.response.headers)
+
+http_trace = aiohttp.TraceConfig()
+http_trace.on_request_end.append(on_request_end)
 
 bot = commands.AutoShardedBot(
-	command_prefix="!",
-	intents=intents,
-	shard_count=6
+	# Prefix commands can't be read without message content; mentions still carry it
+	command_prefix="!" if client_options["intents"].message_content else commands.when_mentioned,
+	**client_options,
+	shard_count=SHARD_COUNT,
+	shard_ids=SHARD_IDS,
+	http_trace=http_trace
 )
 
-@contextmanager
-def get_db_connection():
-	conn = sqlite3.connect(DB_PATH)
-	try:
-		yield conn
-	finally:
-		conn.close()
-
-class ChannelSettingsCache:
+class ChannelSettingsStore:
+	"""The whole channel_settings table held in memory.
+	
+	Loaded once at startup and written through by save/remove, so lookups never touch
+	the database. Any channel not in the store is unmanaged, which on_message can tell
+	with one set lookup. Channels with a max age are also kept in their own map, so the
+	max age sweep only visits those.
+	"""
 	def __init__(self):
-		self._cache = {}
-		self._last_updated = {}
+		self._by_server = {}
+		self._max_ages = {}
+		self.managed_channel_ids = set()
+	
+	async def load(self):
+		rows = await db.fetchall('''SELECT server_id, channel_id, max_messages, keep_pinned, max_age FROM channel_settings''')
+		self._by_server = {}
+		self._max_ages = {}
+		self.managed_channel_ids = set()
+		for server_id, channel_id, max_messages, keep_pinned, max_age in rows:
+			self.set(server_id, channel_id, (max_messages, keep_pinned), max_age)
+		logging.info(f"Loaded settings for {len(rows)} managed channel(s)")
+	
+	def is_managed(self, channel_id: str) -> bool:
+		return channel_id in self.managed_channel_ids
 	
 	def get(self, server_id: str, channel_id: str) -> tuple[int, bool] | None:
-		cache_key = (server_id, channel_id)
-		if cache_key in self._cache:
-			# Check if cache is still valid
-			if time.time() - self._last_updated[cache_key] < CACHE_DURATION:
-				return self._cache[cache_key]
-			# Remove expired cache
-			del self._cache[cache_key]
-			del self._last_updated[cache_key]
-		return None
-	
-	def set(self, server_id: str, channel_id: str, settings: tuple[int, bool]):
-		cache_key = (server_id, channel_id)
-		self._cache[cache_key] = settings
-		self._last_updated[cache_key] = time.time()
-	
-	def invalidate(self, server_id: str, channel_id: str):
-		cache_key = (server_id, channel_id)
-		if cache_key in self._cache:
-			del self._cache[cache_key]
-			del self._last_updated[cache_key]
-
-channel_settings_cache = ChannelSettingsCache()
+		channels = self._by_server.get(server_id)
+		return channels.get(channel_id) if channels else None
+	
+	def channels(self, server_id: str) -> list[tuple[str, int, bool]]:
+		channels = self._by_server.get(server_id, {})
+		return [(channel_id, max_messages, keep_pinned) for channel_id, (max_messages, keep_pinned) in channels.items()]
+	
+	def max_age(self, channel_id: str) -> int | None:
+		"""The channel's max age in seconds, or None if it only has a message limit"""
+		entry = self._max_ages.get(channel_id)
+		return entry[1] if entry else None
+	
+	def aged_channels(self) -> list[tuple[str, str, int, bool]]:
+		"""(server_id, channel_id, max_age, keep_pinned) for every channel with a max age"""
+		return [
+			(server_id, channel_id, max_age, self._by_server[server_id][channel_id][1])
+			for channel_id, (server_id, max_age) in self._max_ages.items()
+		]
+	
+	def set(self, server_id: str, channel_id: str, settings: tuple[int, bool], max_age: int | None = None):
+		self._by_server.setdefault(server_id, {})[channel_id] = settings
+		self.managed_channel_ids.add(channel_id)
+		if max_age:
+			self._max_ages[channel_id] = (server_id, max_age)
+		else:
+			self._max_ages.pop(channel_id, None)
+	
+	def remove(self, server_id: str, channel_id: str):
+		channels = self._by_server.get(server_id)
+		if channels is not None:
+			channels.pop(channel_id, None)
+			if not channels:
+				del self._by_server[server_id]
+		self.managed_channel_ids.discard(channel_id)
+		self._max_ages.pop(channel_id, None)
+
+channel_settings_store = ChannelSettingsStore()
+
+# Tells other cluster workers what changed so they can reload it; does nothing in a single process
+invalidation_bus = InvalidationBus(os.environ.get('SERVERMAID_INVALIDATION_BUS'), WORKER_ID)
+TOPIC_CHANNEL_SETTINGS = "channel_settings"
+TOPIC_USER_TIMEZONE = "user_timezone"
+TOPIC_PREMIUM = "premium"
+
+async def reload_channel_settings(key):
+	"""Bus handler: re-read one channel's settings written by another worker"""
+	if key is None:
+		await channel_settings_store.load()
+		return
+	server_id, channel_id = key
+	row = await db.fetchone('''SELECT max_messages, keep_pinned, max_age FROM channel_settings
+							   WHERE server_id = ? AND channel_id = ?''', (server_id, channel_id))
+	if row:
+		channel_settings_store.set(server_id, channel_id, (row[0], row[1]), row[2])
+	else:
+		channel_settings_store.remove(server_id, channel_id)
+		trim_scheduler.discard(channel_id)
+	message_count_cache.invalidate(channel_id)
+
+invalidation_bus.subscribe(TOPIC_CHANNEL_SETTINGS, reload_channel_settings)
 
 def get_channel_settings(server_id: str, channel_id: str):
-	cached_settings = channel_settings_cache.get(server_id, channel_id)
-	if cached_settings is not None:
-		return cached_settings
-	
-	# If not in cache, get from database
-	with get_db_connection() as conn:
-		c = conn.cursor()
-		c.execute('''SELECT max_messages, keep_pinned FROM channel_settings 
-					 WHERE server_id = ? AND channel_id = ?''', (server_id, channel_id))
-		settings = c.fetchone()
-		if settings:
-			channel_settings_cache.set(server_id, channel_id, settings)
-		return settings
-
-# Update settings to invalidate cache
-def save_channel_settings(server_id: str, channel_id: str, max_messages: int, keep_pinned: bool):
-	conn = sqlite3.connect(DB_PATH)
-	c = conn.cursor()
-	c.execute('''INSERT OR REPLACE INTO channel_settings (server_id, channel_id, max_messages, keep_pinned)
-				 VALUES (?, ?, ?, ?)''', (server_id, channel_id, max_messages, keep_pinned))
-	conn.commit()
-	conn.close()
-	channel_settings_cache.invalidate(server_id, channel_id)
-
-def remove_channel_settings(server_id: str, channel_id: str):
-	conn = sqlite3.connect(DB_PATH)
-	c = conn.cursor()
-	c.execute('''DELETE FROM channel_settings WHERE server_id = ? AND channel_id = ?''',
-			  (server_id, channel_id))
-	conn.commit()
-	conn.close()
-	channel_settings_cache.invalidate(server_id, channel_id)
-
-def get_managed_channels(server_id: str):
-	conn = sqlite3.connect(DB_PATH)
-	c = conn.cursor()
-	c.execute('''SELECT channel_id, max_messages, keep_pinned FROM channel_settings 
-				 WHERE server_id = ?''', (server_id,))
-	results = c.fetchall()
-	conn.close()
-	return results
-
-def check_user_thanks(user_id: str) -> tuple[bool, int]:
-	conn = sqlite3.connect(DB_PATH)
-	c = conn.cursor()
-	
-	local_time = get_user_local_time(user_id)
-	today = local_time.strftime('%Y-%m-%d')
-	
-	c.execute('SELECT last_thanks_date, streak FROM user_thanks WHERE user_id = ?', (user_id,))
-	result = c.fetchone()
-	
-	if not result:
-		conn.close()
-		return False, 0
-	
-	last_thanks_date, streak = result
-	
-	last_thanks_dt = datetime.datetime.strptime(last_thanks_date, '%Y-%m-%d').date()
-	local_dt = local_time.date()
-	
-	days_diff = (local_dt - last_thanks_dt).days
-	
-	if days_diff > 1:
-		streak = 0
-	
-	already_thanked = (last_thanks_date == today)
-	conn.close()
-	return already_thanked, streak
-
-def update_user_thanks(user_id: str, decrease_streak: bool = False):
-	conn = sqlite3.connect(DB_PATH)
-	c = conn.cursor()
-	
-	local_time = get_user_local_time(user_id)
-	today = local_time.strftime('%Y-%m-%d')
-	
-	c.execute('SELECT last_thanks_date, streak FROM user_thanks WHERE user_id = ?', (user_id,))
-	result = c.fetchone()
+	settings = channel_settings_store.get(server_id, channel_id)
+	(SETTINGS_HIT if settings is not None else SETTINGS_MISS).inc()
+	return settings
+
+# Write through to the in-memory store
+async def save_channel_settings(server_id: str, channel_id: str, max_messages: int, keep_pinned: bool,
+								max_age: int | None = None):
+	"""max_age is in seconds; None means the channel only has a message limit"""
+	await db.execute('''INSERT OR REPLACE INTO channel_settings (server_id, channel_id, max_messages, keep_pinned, max_age)
+						VALUES (?, ?, ?, ?, ?)''', (server_id, channel_id, max_messages, keep_pinned, max_age))
+	channel_settings_store.set(server_id, channel_id, (max_messages, keep_pinned), max_age)
+	invalidation_bus.publish(TOPIC_CHANNEL_SETTINGS, (server_id, channel_id))
+
+async def remove_channel_settings(server_id: str, channel_id: str):
+	await db.execute('''DELETE FROM channel_settings WHERE server_id = ? AND channel_id = ?''',
+					 (server_id, channel_id))
+	channel_settings_store.remove(server_id, channel_id)
+	invalidation_bus.publish(TOPIC_CHANNEL_SETTINGS, (server_id, channel_id))
+
+async def get_managed_channels(server_id: str):
+	return channel_settings_store.channels(server_id)
+
+def _apply_thanks(conn, user_id, guild_id, local_date, decrease_streak):
+	"""Check and update a user's streak in one transaction.
+	
+	Returns (already_thanked, new_streak, old_streak). Nothing is written if the user
+	already thanked today.
+	"""
+	today = local_date.isoformat()
+	result = conn.execute('SELECT last_thanks_date, streak FROM user_thanks WHERE user_id = ?', (user_id,)).fetchone()
 	
 	if result:
 		last_thanks_date, current_streak = result
-		last_thanks_dt = datetime.datetime.strptime(last_thanks_date, '%Y-%m-%d').date()
-		local_dt = local_time.date()
-		days_diff = (local_dt - last_thanks_dt).days
+		if last_thanks_date == today:
+			return True, current_streak, current_streak
+		days_diff = (local_date - datetime.date.fromisoformat(last_thanks_date)).days
 		
 		if decrease_streak:
 			new_streak = max(0, current_streak - 1)
@@ -216,82 +250,143 @@ def update_user_thanks(user_id: str, decrease_streak: bool = False):
 		new_streak = 0 if decrease_streak else 1
 		current_streak = 0
 	
-	c.execute('''INSERT OR REPLACE INTO user_thanks (user_id, last_thanks_date, streak)
-				 VALUES (?, ?, ?)''', (user_id, today, new_streak))
-	
-	conn.commit()
-	conn.close()
-	return new_streak, current_streak
+	# The streak and every leaderboard it's on change together
+	conn.execute('''INSERT OR REPLACE INTO user_thanks (user_id, last_thanks_date, streak)
+					VALUES (?, ?, ?)''', (user_id, today, new_streak))
+	record_streak(conn, user_id, new_streak, guild_id)
+	return False, new_streak, current_streak
 
-def get_user_local_time(user_id: str) -> datetime:
-	conn = sqlite3.connect(DB_PATH)
-	c = conn.cursor()
-	
-	c.execute('SELECT timezone FROM user_settings WHERE user_id = ?', (user_id,))
-	result = c.fetchone()
-	timezone = result[0] if result else 'UTC'
-	conn.close()
-	
-	utc_time = discord.utils.utcnow()
-	local_tz = pytz.timezone(timezone)
-	local_time = utc_time.astimezone(local_tz)
-	return local_time
+async def apply_thanks(user_id: str, local_date: datetime.date, decrease_streak: bool = False,
+					   guild_id: str | None = None) -> tuple[bool, int, int]:
+	"""Record a thanks for the user's local date. Returns (already_thanked, new_streak, old_streak)."""
+	return await db.transaction(_apply_thanks, user_id, guild_id, local_date, decrease_streak)
 
-async def update_server_list():
-	"""Update the servers.txt file with current server list"""
-	script_dir = os.path.dirname(os.path.abspath(__file__))
-	servers_file = os.path.join(script_dir, "servers.txt")
-	
-	# Get all current servers
-	servers = []
-	for guild in bot.guilds:
-		server_info = f"{guild.name} (ID: {guild.id}) - Members: {guild.member_count}"
-		servers.append(server_info)
-	
-	servers.sort()
-	
-	try:
-		with open(servers_file, 'w', encoding='utf-8') as f:
-			f.write("=== Server Maid Monitored Servers ===\n")
-			f.write(f"Last Updated: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-			f.write(f"Total Servers: {len(servers)}\n\n")
-			for server in servers:
-				f.write(f"{server}\n")
-		logging.info(f"✍️ Updated servers list in {servers_file}")
-	except Exception as e:
-		logging.info(f"❌ Error writing servers file: {e}")
+# Timezone objects per user, so /thanks needs neither a query nor a pytz lookup
+user_timezones = BoundedCache(USER_TIMEZONE_CACHE_SIZE)
+_NOT_CACHED = object()
+
+async def get_user_tzinfo(user_id: str):
+	"""Get the user's stored timezone, or None if they never set one"""
+	tzinfo = user_timezones.get(user_id, _NOT_CACHED)
+	if tzinfo is _NOT_CACHED:
+		result = await db.fetchone('SELECT timezone FROM user_settings WHERE user_id = ?', (user_id,))
+		import pytz
+		tzinfo = pytz.timezone(result[0]) if result else None
+		user_timezones.set(user_id, tzinfo)
+	return tzinfo
+
+async def forget_user_timezone(key):
+	"""Bus handler: another worker changed a user's timezone"""
+	if key is None:
+		user_timezones.clear()
+	else:
+		user_timezones.pop(key)
+
+invalidation_bus.subscribe(TOPIC_USER_TIMEZONE, forget_user_timezone)
+
+def roster_snapshot() -> list[dict]:
+	return [
+		{"id": str(guild.id), "name": guild.name, "member_count": guild.member_count, "shard_id": guild.shard_id}
+		for guild in bot.guilds
+	]
+
+# Each cluster worker only sees its own shards' guilds, so it keeps its own files
+_roster_name = "servers" if WORKER_ID is None else f"servers-worker{WORKER_ID}"
+roster = RosterWriter(
+	os.path.join(os.path.dirname(os.path.abspath(__file__)), f"{_roster_name}.txt"),
+	os.path.join(os.path.dirname(os.path.abspath(__file__)), f"{_roster_name}.json"),
+	roster_snapshot,
+	interval=ROSTER_WRITE_INTERVAL,
+	extra={"worker": WORKER_ID, "shard_ids": SHARD_IDS, "shard_count": SHARD_COUNT}
+)
 
 @bot.event
 async def on_ready():
-	logging.info(f'✅ Logged in as {bot.user} (ID: {bot.user.id})')
-	logging.info(f'🔄 Connected to {len(bot.guilds)} servers')
-	logging.info(f'📊 Using {bot.shard_count} shards')
-	for guild in bot.guilds:
-		logging.info(f'🛠 Server: {guild.name} (ID: {guild.id})')
+	# on_ready fires again after reconnects, so keep this cheap: one summary line, no per-guild work
+	worker = f", cluster worker {WORKER_ID}" if WORKER_ID is not None else ""
+	logging.info(f'✅ Logged in as {bot.user} (ID: {bot.user.id}): {len(bot.guilds)} servers on '
+				 f'{len(bot.shards)} of {bot.shard_count} shards{worker}')
+	roster.mark_dirty()
+	await resume_deletion_jobs()
+	logging.info("⚡ Ready to clean messages!")
+
+deletion_jobs_resumed = False
+
+def command_tree_hash() -> str:
+	"""Hash of the command payload Discord would receive from a sync"""
+	payload = [command.to_dict(bot.tree) for command in bot.tree.get_commands()]
+	return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+async def sync_command_tree():
+	"""Sync slash commands only when they changed since the last successful sync"""
+	# The command tree is global, so only one worker of a cluster syncs it
+	if WORKER_ID not in (None, '0'):
+		return
+	key = f"command_tree_hash:{bot.application_id}"
+	tree_hash = command_tree_hash()
+	row = await db.fetchone('SELECT value FROM bot_state WHERE key = ?', (key,))
+	if row and row[0] == tree_hash:
+		logging.info("Command tree unchanged, skipping sync")
+		return
 	try:
 		synced = await bot.tree.sync()
+		await db.execute('INSERT OR REPLACE INTO bot_state (key, value) VALUES (?, ?)', (key, tree_hash))
 		logging.info(f"Synced {len(synced)} command(s)")
 	except Exception as e:
 		logging.warning(f"Failed to sync commands: {e}")
-	
-	await update_server_list()
-	logging.info("⚡ Ready to clean messages!")
 
-@bot.event
-async def on_guild_join(guild):
-	"""Called when the bot joins a new server"""
-	logging.info(f"🎉 Joined new server: {guild.name} (ID: {guild.id})")
-	await update_server_list()
+def owns_guild(guild_id: int) -> bool:
+	"""Whether this process runs the shard for the guild. Always true outside a cluster."""
+	if SHARD_IDS is None:
+		return True
+	return (guild_id >> 22) % SHARD_COUNT in SHARD_IDS
+
+async def resume_deletion_jobs():
+	"""Hand deletion jobs left over from the last run back to the trim scheduler"""
+	global deletion_jobs_resumed
+	if deletion_jobs_resumed:
+		return
+	deletion_jobs_resumed = True
+	
+	jobs = [job for job in await deletion_jobs.pending() if owns_guild(int(job.server_id))]
+	for job in jobs:
+		channel = bot.get_channel(int(job.channel_id))
+		if channel is None:
+			logging.warning(f"Can't resume deletion job for unknown channel {job.channel_id}, dropping it")
+			await deletion_jobs.cancel(job.channel_id)
+			continue
+		trim_scheduler.mark_dirty(job.channel_id, channel)
+	if jobs:
+		logging.info(f"♻️ Resuming {len(jobs)} deletion job(s)")
 
 @bot.event
 async def on_guild_remove(guild):
 	"""Called when the bot leaves a server"""
 	logging.info(f"👋 Left server: {guild.name} (ID: {guild.id})")
-	await update_server_list()
+	roster.mark_dirty()
+
+shards_ready_before = set()
+
+def invalidate_shard_indexes(shard_id: int) -> int:
+	"""Drop the channel indexes of a shard's managed channels. Returns how many channels were dropped."""
+	dropped = 0
+	for guild in bot.guilds:
+		if guild.shard_id != shard_id:
+			continue
+		for channel_id, _, _ in channel_settings_store.channels(str(guild.id)):
+			message_count_cache.invalidate(channel_id)
+			dropped += 1
+	return dropped
 
 @bot.event
 async def on_shard_ready(shard_id):
 	logging.info(f'Shard {shard_id} is ready')
+	startup_timer.mark("first_shard_ready")
+	if shard_id in shards_ready_before:
+		# A new session, not a resume: message events from the gap are gone, so reseed instead of trusting the indexes
+		dropped = invalidate_shard_indexes(shard_id)
+		logging.info(f"Shard {shard_id} started a new session, dropped {dropped} channel index(es)")
+	shards_ready_before.add(shard_id)
 
 @bot.event
 async def on_shard_connect(shard_id):
@@ -316,76 +411,176 @@ async def shard_info(interaction: discord.Interaction):
 		await interaction.response.send_message("You need administrator permissions to use this command!", ephemeral=True)
 		return
 		
+	# Only this process's shards; in a cluster the others belong to other workers
 	shard_info = []
-	for shard_id in range(bot.shard_count):
-		shard = bot.get_shard(shard_id)
-		latency = round(shard.latency * 1000) if shard else None
-		status = "Connected" if shard and not shard.is_closed() else "Disconnected"
-		guild_count = len([g for g in bot.guilds if g.shard_id == shard_id])
-		
+	for shard in shard_status():
 		shard_info.append(
-			f"Shard {shard_id}:\n"
-			f"  Status: {status}\n"
-			f"  Latency: {latency}ms\n"
-			f"  Guilds: {guild_count}"
+			f"Shard {shard['shard']}:\n"
+			f"  Status: {'Connected' if shard['connected'] else 'Disconnected'}\n"
+			f"  Latency: {shard['latency_ms']}ms\n"
+			f"  Guilds: {shard['guilds']}"
 		)
 	
 	message = "**Shard Information:**\n\n" + "\n\n".join(shard_info)
 	await interaction.response.send_message(message, ephemeral=True)
 
-async def check_premium_status(guild_id: str) -> bool:
-	"""Check if a guild has the premium subscription"""
-	try:
-		with get_db_connection() as conn:
-			c = conn.cursor()
-			c.execute('''SELECT setting_value FROM server_settings 
-						 WHERE guild_id = ? AND setting_name = 'premium_sku' ''', (guild_id,))
-			result = c.fetchone()
-			if result and result[0] == PREMIUM_SKU:
-				return True
+class PremiumStore:
+	"""Which guilds have premium, held in memory.
+	
+	Loaded from server_settings at startup, then reconciled against one paged
+	listing of the app's entitlements and periodically after that. Entitlement
+	events update it as they arrive. is_premium() is a dict lookup, so hot paths
+	never wait on the database or the API.
+	
+	Subscription end dates are stored next to the premium row, so a reload on
+	another worker sees when a subscription runs out.
+	"""
+	def __init__(self):
+		self._ends_at = {}  # guild_id -> subscription end, or None if open-ended
+		self._changed = None  # Guilds updated while a reconcile is paging, which it must leave alone
+	
+	def is_premium(self, guild_id: str) -> bool:
+		if guild_id not in self._ends_at:
+			return False
+		ends_at = self._ends_at[guild_id]
+		return ends_at is None or ends_at > discord.utils.utcnow()
+	
+	def __len__(self) -> int:
+		return len(self._ends_at)
+	
+	def add(self, guild_id: str, ends_at: datetime.datetime | None = None):
+		self._ends_at[guild_id] = ends_at
+		if self._changed is not None:
+			self._changed.add(guild_id)
+	
+	def remove(self, guild_id: str):
+		self._ends_at.pop(guild_id, None)
+		if self._changed is not None:
+			self._changed.add(guild_id)
+	
+	async def save(self, guild_id: str, ends_at: datetime.datetime | None = None):
+		"""Write a guild's premium and its end date, then cache it"""
+		await db.executemany('''INSERT OR REPLACE INTO server_settings (guild_id, setting_name, setting_value)
+								VALUES (?, ?, ?)''', premium_rows(guild_id, ends_at))
+		self.add(guild_id, ends_at)
+	
+	async def delete(self, guild_id: str):
+		await db.execute('''DELETE FROM server_settings
+							WHERE guild_id = ? AND setting_name IN ('premium_sku', 'premium_ends_at')''', (guild_id,))
+		self.remove(guild_id)
+	
+	async def load(self):
+		rows = await db.fetchall('''SELECT guild_id, setting_name, setting_value FROM server_settings
+								   WHERE setting_name IN ('premium_sku', 'premium_ends_at')''')
+		self._ends_at = premium_from_rows(rows)
+		logging.info(f"Loaded premium status for {len(self._ends_at)} guild(s)")
+	
+	async def reload(self, guild_id):
+		"""Bus handler: re-read a guild's premium rows written by another worker"""
+		if guild_id is None:
+			await self.load()
+			return
+		rows = await db.fetchall('''SELECT guild_id, setting_name, setting_value FROM server_settings
+									WHERE guild_id = ? AND setting_name IN ('premium_sku', 'premium_ends_at')''', (guild_id,))
+		premium = premium_from_rows(rows)
+		if guild_id in premium:
+			self.add(guild_id, premium[guild_id])
+		else:
+			self.remove(guild_id)
+	
+	async def reconcile(self):
+		"""Bring the cached state in line with the app's current premium entitlements.
 		
-		guild = bot.get_guild(int(guild_id))
-		if guild:
-			entitlements = await bot.application.fetch_guild_entitlements(guild.id)
-			for entitlement in entitlements:
-				if str(entitlement.sku_id) == PREMIUM_SKU and not entitlement.consumed:
-					# Save to database if not already there
-					with get_db_connection() as conn:
-						c = conn.cursor()
-						c.execute('''INSERT OR REPLACE INTO server_settings
-									(guild_id, setting_name, setting_value)
-									VALUES (?, ?, ?)''',
-								 (guild_id, 'premium_sku', PREMIUM_SKU))
-						conn.commit()
-					return True
+		Listing entitlements takes several requests. Guilds an event or another worker
+		updated in the meantime are newer than the listing, so they're left as they are.
+		"""
+		self._changed = set()
+		try:
+			current = {}
+			async for entitlement in bot.entitlements(limit=None, skus=[discord.Object(int(PREMIUM_SKU))], exclude_ended=True):
+				if entitlement.guild_id is not None and not entitlement.consumed:
+					current[str(entitlement.guild_id)] = entitlement.ends_at
+			changed = self._changed
+		finally:
+			self._changed = None
 		
-		return False
-	except Exception as e:
-		logging.warning(f"Error checking premium status: {str(e)}")
-		return False
+		gained = {guild_id: ends_at for guild_id, ends_at in current.items()
+				  if guild_id not in changed and (guild_id not in self._ends_at or self._ends_at[guild_id] != ends_at)}
+		lost = [guild_id for guild_id in self._ends_at if guild_id not in current and guild_id not in changed]
+		if gained:
+			await db.executemany('''INSERT OR REPLACE INTO server_settings (guild_id, setting_name, setting_value)
+									VALUES (?, ?, ?)''', [row for guild_id, ends_at in gained.items()
+														  for row in premium_rows(guild_id, ends_at)])
+		if lost:
+			await db.executemany('''DELETE FROM server_settings
+									WHERE guild_id = ? AND setting_name IN ('premium_sku', 'premium_ends_at')''',
+								 [(guild_id,) for guild_id in lost])
+		for guild_id, ends_at in gained.items():
+			self._ends_at[guild_id] = ends_at
+			invalidation_bus.publish(TOPIC_PREMIUM, guild_id)
+		for guild_id in lost:
+			self._ends_at.pop(guild_id, None)
+			invalidation_bus.publish(TOPIC_PREMIUM, guild_id)
+		if gained or lost:
+			logging.info(f"Premium reconcile: {len(gained)} guild(s) gained or renewed, {len(lost)} lost")
+
+def premium_rows(guild_id: str, ends_at: datetime.datetime | None) -> list[tuple[str, str, str]]:
+	"""server_settings rows for a premium guild; an empty end date means open-ended"""
+	return [(guild_id, 'premium_sku', PREMIUM_SKU),
+			(guild_id, 'premium_ends_at', ends_at.isoformat() if ends_at else '')]
+
+def premium_from_rows(rows) -> dict:
+	"""Map guild_id -> end date from (guild_id, setting_name, setting_value) rows"""
+	premium = {}
+	ends = {}
+	for guild_id, name, value in rows:
+		if name == 'premium_sku' and value == PREMIUM_SKU:
+			premium[guild_id] = None
+		elif name == 'premium_ends_at' and value:
+			ends[guild_id] = datetime.datetime.fromisoformat(value)
+	for guild_id in premium:
+		premium[guild_id] = ends.get(guild_id)
+	return premium
 
-def get_server_limits(guild_id: str) -> tuple[int, int]:
+premium_store = PremiumStore()
+invalidation_bus.subscribe(TOPIC_PREMIUM, premium_store.reload)
+
+async def reconcile_premium():
+	"""Check cached premium state against Discord now and then, in case an event was missed"""
+	# Entitlements are app-wide, so only one worker of a cluster lists them; the rest hear about changes on the bus
+	if WORKER_ID not in (None, '0'):
+		return
+	while True:
+		try:
+			await premium_store.reconcile()
+		except Exception as e:
+			logging.warning(f"Premium reconcile failed: {e}")
+		await asyncio.sleep(PREMIUM_RECONCILE_INTERVAL)
+
+async def get_server_limits(guild_id: str) -> tuple[int, int]:
 	"""Get the message and channel limits based on premium status"""
 	try:
-		is_premium = check_premium_status(guild_id)
+		is_premium = premium_store.is_premium(guild_id)
 		
-		current_channels = get_managed_channels(guild_id)
+		current_channels = await get_managed_channels(guild_id)
 		current_channel_count = len(current_channels)
 		
 		if is_premium:
 			for channel_id, max_messages, keep_pinned in current_channels:
 				if max_messages > PREMIUM_MAX_MESSAGES:
-					save_channel_settings(guild_id, channel_id, PREMIUM_MAX_MESSAGES, keep_pinned)
+					await save_channel_settings(guild_id, channel_id, PREMIUM_MAX_MESSAGES, keep_pinned,
+												channel_settings_store.max_age(channel_id))
 			return PREMIUM_MAX_MESSAGES, PREMIUM_MAX_CHANNELS
 		else:
 			for channel_id, max_messages, keep_pinned in current_channels:
 				if max_messages > FREE_MAX_MESSAGES:
-					save_channel_settings(guild_id, channel_id, FREE_MAX_MESSAGES, keep_pinned)
+					await save_channel_settings(guild_id, channel_id, FREE_MAX_MESSAGES, keep_pinned,
+												channel_settings_store.max_age(channel_id))
 			
 			if current_channel_count > FREE_MAX_CHANNELS:
 				excess_channels = current_channels[FREE_MAX_CHANNELS:]
 				for channel_id, _, _ in excess_channels:
-					remove_channel_settings(guild_id, channel_id)
+					await remove_channel_settings(guild_id, channel_id)
 			
 			return FREE_MAX_MESSAGES, FREE_MAX_CHANNELS
 	except Exception as e:
@@ -396,13 +591,15 @@ def get_server_limits(guild_id: str) -> tuple[int, int]:
 @app_commands.describe(
 	channel="The channel to manage",
 	max_messages="Maximum number of messages to keep in the channel",
-	keep_pinned="Whether to preserve pinned messages (true/false)"
+	keep_pinned="Whether to preserve pinned messages (true/false)",
+	max_age_hours="Also delete messages older than this many hours (optional)"
 )
-async def configure(interaction: discord.Interaction, channel: discord.TextChannel, max_messages: int, keep_pinned: bool):
+async def configure(interaction: discord.Interaction, channel: discord.TextChannel, max_messages: int, keep_pinned: bool,
+					max_age_hours: int | None = None):
 	try:
-		max_messages_limit, max_channels = get_server_limits(str(interaction.guild_id))
+		max_messages_limit, max_channels = await get_server_limits(str(interaction.guild_id))
 		
-		current_channels = get_managed_channels(str(interaction.guild_id))
+		current_channels = await get_managed_channels(str(interaction.guild_id))
 		if len(current_channels) >= max_channels and str(channel.id) not in [c[0] for c in current_channels]:
 			await interaction.response.send_message(
 				f"You've reached your maximum channel limit ({max_channels}). " +
@@ -426,6 +623,20 @@ async def configure(interaction: discord.Interaction, channel: discord.TextChann
 			)
 			return
 		
+		if max_age_hours is not None and max_age_hours < MIN_MAX_AGE_HOURS:
+			await interaction.response.send_message(
+				f"Max age cannot be less than {MIN_MAX_AGE_HOURS} hour(s)",
+				ephemeral=True
+			)
+			return
+		
+		if max_age_hours is not None and max_age_hours > MAX_MAX_AGE_HOURS:
+			await interaction.response.send_message(
+				f"Max age cannot be more than {MAX_MAX_AGE_HOURS} hours",
+				ephemeral=True
+			)
+			return
+		
 		permissions = channel.permissions_for(interaction.guild.me)
 		if not (permissions.manage_messages and permissions.read_message_history):
 			await interaction.response.send_message(
@@ -438,33 +649,20 @@ async def configure(interaction: discord.Interaction, channel: discord.TextChann
 			await interaction.response.send_message("You need administrator permissions to use this command!", ephemeral=True)
 			return
 		
-		save_channel_settings(str(interaction.guild_id), str(channel.id), max_messages, keep_pinned)
+		max_age = max_age_hours * 3600 if max_age_hours is not None else None
+		await save_channel_settings(str(interaction.guild_id), str(channel.id), max_messages, keep_pinned, max_age)
 		
+		max_age_text = f", max age: {max_age_hours} hours" if max_age_hours is not None else ""
 		await interaction.response.send_message(
-			f"Channel {channel.mention} configured with max messages: {max_messages}, keep pinned: {keep_pinned}\nStarting initial cleanup...",
+			f"Channel {channel.mention} configured with max messages: {max_messages}{max_age_text}, keep pinned: {keep_pinned}\nInitial cleanup started, old messages will be deleted in the background.",
 			ephemeral=True
 		)
 		
-		messages = []
-		async for msg in channel.history(limit=MAX_FETCH_LIMIT):
-			await message_fetcher.acquire()
-			messages.append(msg)
-		
-		if keep_pinned:
-			messages = [msg for msg in messages if not msg.pinned]
-		messages.sort(key=lambda x: x.created_at)
-	
-		#if len(messages) > max_messages:
-		if len(messages) > 0:
-		#to_delete = messages[:len(messages) - max_messages]
-			to_delete = messages[:len(messages) - 0]
-			deleted, failed = await delete_messages_safely(to_delete, channel)
-			
-			await interaction.followup.send(
-				f"Initial cleanup complete. Deleted {deleted} messages" + 
-				(f", failed to delete {failed} messages." if failed > 0 else "."),
-				ephemeral=True
-			)
+		# Clear everything posted before now. The job is persisted, so a restart resumes it, and the
+		# trim scheduler works through it in budgeted passes instead of holding this command open.
+		upto_id = discord.utils.time_snowflake(discord.utils.utcnow(), high=True)
+		await deletion_jobs.enqueue(str(channel.id), str(interaction.guild_id), upto_id, keep_pinned)
+		trim_scheduler.mark_dirty(str(channel.id), channel)
 	
 	except discord.errors.Forbidden as e:
 		await interaction.response.send_message(
@@ -494,7 +692,8 @@ async def remove_channel(interaction: discord.Interaction, channel: discord.Text
 		await interaction.response.send_message("You need administrator permissions to use this command!", ephemeral=True)
 		return
 		
-	remove_channel_settings(str(interaction.guild_id), str(channel.id))
+	await remove_channel_settings(str(interaction.guild_id), str(channel.id))
+	await deletion_jobs.cancel(str(channel.id))
 	await interaction.response.send_message(
 		f"Channel {channel.mention} removed from management",
 		ephemeral=True
@@ -503,99 +702,552 @@ async def remove_channel(interaction: discord.Interaction, channel: discord.Text
 	message_count_cache.invalidate(str(channel.id))
 
 class MessageCountCache:
+	"""Per-channel message indexes, seeded from history once and then kept current from events.
+	
+	Each channel seeds independently: concurrent misses on the same channel share one
+	in-flight history scan, and a slow scan never blocks any other channel.
+	"""
 	def __init__(self):
-		self._cache = {}
-		self._last_updated = {}
-		self.lock = Lock()
+		self._cache = BoundedCache(MESSAGE_INDEX_CACHE_SIZE, ttl=MESSAGE_INDEX_IDLE_TTL)
+		self._inflight = {}
+		# Contention metrics
+		self.seeds = 0
+		self.shared_waits = 0
+		self.wait_seconds = 0.0
+		self.max_wait_seconds = 0.0
+	
+	async def get_index(self, channel_id: str, channel, max_messages: int | None = None, keep_pinned: bool = False) -> ChannelIndex:
+		"""Get the channel's message index, seeding it from history if needed.
+		
+		With max_messages the seed stops at the channel's limit, so only the retained
+		window is downloaded and everything older is left for a history(before=...) trim.
+		"""
+		pending = self._inflight.get(channel_id)
+		if pending is not None:
+			return await self._wait_for_seed(pending)
+		
+		index = self._cache.get(channel_id)
+		if index is not None:
+			return index
+		
+		return await self._seed(channel_id, channel, max_messages, keep_pinned)
+	
+	async def _wait_for_seed(self, pending: asyncio.Future) -> ChannelIndex:
+		self.shared_waits += 1
+		start = time.perf_counter()
+		try:
+			# Shield so a cancelled waiter doesn't cancel the scan for everyone else
+			return await asyncio.shield(pending)
+		finally:
+			waited = time.perf_counter() - start
+			self.wait_seconds += waited
+			self.max_wait_seconds = max(self.max_wait_seconds, waited)
+	
+	async def _scan(self, channel, max_messages: int | None, keep_pinned: bool) -> tuple[list, bool]:
+		"""Read history newest first until the limit is passed. Returns (messages, overflow)."""
+		messages = []
+		counted = 0
+		async for msg in channel.history(limit=None):
+			if len(messages) % HISTORY_PAGE_SIZE == 0:
+				await rate_limiter.acquire(ROUTE_HISTORY, channel.id)
+			counts = not (keep_pinned and msg.pinned)
+			if max_messages is not None and counts and counted >= max_messages:
+				return messages, True
+			messages.append((msg.id, msg.pinned))
+			counted += counts
+		return messages, False
+	
+	async def _seed(self, channel_id: str, channel, max_messages: int | None, keep_pinned: bool) -> ChannelIndex:
+		future = asyncio.get_running_loop().create_future()
+		self._inflight[channel_id] = future
+		self.seeds += 1
+		
+		index = ChannelIndex()
+		self._cache.set(channel_id, index)
+		start = time.perf_counter()
+		try:
+			messages, overflow = await self._scan(channel, max_messages, keep_pinned)
+			index.seed(messages, overflow)
+		except BaseException as e:
+			if self._cache.peek(channel_id) is index:
+				self.invalidate(channel_id)
+			if isinstance(e, asyncio.CancelledError):
+				future.cancel()
+			else:
+				future.set_exception(e)
+				# Mark retrieved so an unshared failure doesn't log "exception never retrieved"
+				future.exception()
+			raise
+		else:
+			future.set_result(index)
+		finally:
+			if self._inflight.get(channel_id) is future:
+				del self._inflight[channel_id]
+		
+		logging.info(
+			f"Indexed {len(index)} messages in channel {channel_id} in {time.perf_counter() - start:.2f}s"
+			+ (" (older messages past the limit not downloaded)" if index.overflow else "")
+		)
+		return index
+	
+	def stats(self) -> dict:
+		"""Cache, seed and contention counters"""
+		return {
+			**self._cache.stats(),
+			"seeds": self.seeds,
+			"seeds_in_flight": len(self._inflight),
+			"shared_waits": self.shared_waits,
+			"wait_seconds": self.wait_seconds,
+			"max_wait_seconds": self.max_wait_seconds,
+		}
 	
 	async def get_message_count(self, channel_id: str, channel) -> int:
-		"""Get message count from cache or fetch if needed"""
-		async with self.lock:
-			now = time.time()
-			if channel_id in self._cache:
-				return self._cache[channel_id]
-			
-			count = 0
-			async for _ in channel.history(limit=None):
-				count += 1
-			
-			self._cache[channel_id] = count
-			self._last_updated[channel_id] = now
-			return count
+		"""Get message count from the index, seeding it if needed"""
+		return len(await self.get_index(channel_id, channel))
+	
+	def peek(self, channel_id: str) -> ChannelIndex | None:
+		"""Get the channel's index only if it is already cached"""
+		return self._cache.peek(channel_id)
 	
-	def increment_count(self, channel_id: str):
-		"""Increment message count for a channel"""
-		if channel_id in self._cache:
-			self._cache[channel_id] += 1
+	def record_message(self, channel_id: str, message_id: int, pinned: bool = False):
+		"""Add a new message to the channel's index, keeping an active channel's index cached"""
+		index = self._cache.get(channel_id)
+		if index is not None:
+			index.add(message_id, pinned)
 	
-	def set_count(self, channel_id: str, count: int):
-		"""Set exact message count for a channel"""
-		self._cache[channel_id] = count
+	def remove_messages(self, channel_id: str, message_ids):
+		"""Drop deleted messages from the channel's index"""
+		index = self._cache.peek(channel_id)
+		if index is not None:
+			index.remove_many(message_ids)
+	
+	def set_pinned(self, channel_id: str, message_id: int, pinned: bool):
+		index = self._cache.peek(channel_id)
+		if index is not None:
+			index.set_pinned(message_id, pinned)
 	
 	def invalidate(self, channel_id: str):
 		"""Remove channel from cache"""
-		if channel_id in self._cache:
-			del self._cache[channel_id]
-			if channel_id in self._last_updated:
-				del self._last_updated[channel_id]
+		# Callers already waiting keep the old scan; new callers start a fresh one
+		self._inflight.pop(channel_id, None)
+		self._cache.pop(channel_id)
+	
+	def sweep(self) -> int:
+		"""Drop indexes for channels that have been idle past the TTL"""
+		return self._cache.sweep()
 
 message_count_cache = MessageCountCache()
 
-@bot.event
-async def on_message(message):
-	if message.guild is None or message.author == bot.user:
-		return
+def job_page_fetcher(job: DeletionJob, channel):
+	"""Page source for a job.
+	
+	Messages the channel index knows about come from the index as partial messages,
+	with no API calls. Only the window the index doesn't cover (below its floor, or
+	everything if there's no index) is paged from history, bounded by snowflakes.
+	"""
+	async def fetch_from_history(after_id: int, before_id: int):
+		# One history request per page, so one rate limit token per page
+		await rate_limiter.acquire(ROUTE_HISTORY, channel.id)
+		return [msg async for msg in channel.history(
+			limit=HISTORY_PAGE_SIZE,
+			after=discord.Object(id=after_id),
+			before=discord.Object(id=before_id),
+			oldest_first=True
+		)]
+	
+	index = message_count_cache.peek(job.channel_id)
+	if index is None or index.seeding:
+		return lambda after_id: fetch_from_history(after_id, job.upto_id + 1)
+	
+	async def fetch(after_id: int):
+		if index.overflow and after_id < index.floor_id - 1:
+			page = await fetch_from_history(after_id, min(index.floor_id, job.upto_id + 1))
+			if page:
+				return page
+			# Nothing left below the floor
+			if job.upto_id >= index.floor_id - 1:
+				index.overflow = False
+		ids = index.ids_between(after_id, job.upto_id, job.keep_pinned)[:HISTORY_PAGE_SIZE]
+		return [channel.get_partial_message(message_id) for message_id in ids]
+	return fetch
+
+def is_bulk_deletable(msg) -> bool:
+	"""Discord only bulk deletes messages younger than 14 days"""
+	return (discord.utils.utcnow() - msg.created_at).days < 14
+
+# channel_id -> (upto_id, keep_pinned) of the channel's last job that finished without failures:
+# nothing at or below upto_id is left to delete until a pin changes
+completed_jobs = {}
+
+async def run_deletion_job(channel_id: str, channel, budget: int | None = None) -> tuple[int, int, bool]:
+	"""Work through the channel's deletion job with a streaming fetch-and-delete pipeline.
+	
+	Stops after roughly budget messages if one is given. Returns (deleted, failed, finished).
+	"""
+	async def delete_and_unindex(messages):
+		result = await delete_messages_safely(messages, channel)
+		message_count_cache.remove_messages(channel_id, [msg.id for msg in messages])
+		return result
+	
+	async def checkpoint(checkpoint_id: int, deleted: int, failed: int):
+		await deletion_jobs.checkpoint(channel_id, checkpoint_id, deleted, failed)
+	
+	deleted_total = 0
+	failed_total = 0
+	async with deletion_jobs.lock_for(channel_id):
+		job = await deletion_jobs.get(channel_id)
+		if job is not None:
+			logging.info(f"\n=== Starting message deletion process in channel: {channel.name} (ID: {channel.id}) ===")
+			logging.info(f"Server: {channel.guild.name} (ID: {channel.guild.id})")
 		
-	settings = get_channel_settings(str(message.guild.id), str(message.channel.id))
+		while job is not None:
+			pipeline = DeletionPipeline(
+				fetch_page=job_page_fetcher(job, channel),
+				delete_bulk=delete_and_unindex,
+				delete_single=delete_and_unindex,
+				checkpoint=checkpoint,
+				is_recent=is_bulk_deletable,
+				skip=(lambda msg: getattr(msg, 'pinned', False)) if job.keep_pinned else None
+			)
+			remaining = None if budget is None else budget - deleted_total - failed_total
+			deleted, failed, exhausted = await pipeline.run(job.checkpoint_id, remaining)
+			deleted_total += deleted
+			failed_total += failed
+			
+			if not exhausted:
+				return deleted_total, failed_total, False
+			if await deletion_jobs.complete(channel_id, job.upto_id):
+				if not job.failed and not failed:
+					completed_jobs[channel_id] = (job.upto_id, job.keep_pinned)
+				break
+			# The job was extended while we worked on it
+			job = await deletion_jobs.get(channel_id)
+	
+	if deleted_total or failed_total:
+		logging.info(f"\n=== Deletion process complete for channel {channel.name} (ID: {channel.id}) in server {channel.guild.name} (ID: {channel.guild.id}) ===")
+		logging.info(f"Final results - Deleted: {deleted_total}, Failed: {failed_total}")
+	return deleted_total, failed_total, True
+
+async def trim_channel(channel_id: str, channel):
+	"""Delete the oldest messages that exceed the channel's limit. Run by the trim scheduler."""
+	settings = get_channel_settings(str(channel.guild.id), channel_id)
 	if not settings:
 		return
 	
 	max_messages, keep_pinned = settings
-	channel_id = str(message.channel.id)
 	
 	try:
-		current_count = await message_count_cache.get_message_count(channel_id, message.channel)
-		message_count_cache.increment_count(channel_id)
+		index = await message_count_cache.get_index(channel_id, channel, max_messages, keep_pinned)
+		current_count = len(index)
 		
-		if current_count + 1 > max_messages:
-			logging.info(f"\n=== Starting message cleanup for channel {message.channel.name} ===")
-			logging.info(f"Current messages: {current_count + 1}, Max allowed: {max_messages}")
-			
-			messages_to_delete = []
-			async for msg in message.channel.history(limit=current_count + 1):
-				if not (keep_pinned and msg.pinned):
-					messages_to_delete.append(msg)
-			
-			messages_to_delete.sort(key=lambda x: x.created_at)
-			
-			# Only delete the oldest messages that exceed our limit
-			to_delete = messages_to_delete[:-max_messages] if messages_to_delete else []
-			
-			if to_delete:
-				logging.info(f"Deleting {len(to_delete)} oldest messages to maintain limit of {max_messages}")
-				deleted, failed = await delete_messages_safely(to_delete, message.channel)
-				
-				# Update cache with accurate count - count all messages including pinned ones
-				actual_count = 0
-				async for _ in message.channel.history(limit=None):
-					actual_count += 1
-				
-				message_count_cache.set_count(channel_id, actual_count)
-				
-				logging.info(f"New message count: {actual_count}")
-				logging.info(f"Channel {message.channel.name} (ID: {message.channel.id}) in server {message.guild.name} (ID: {message.guild.id}) is within message limit ({actual_count}/{max_messages})")
+		# Only delete the oldest messages that exceed our limit
+		cutoff_id = index.trim_cutoff(max_messages, keep_pinned)
+		if cutoff_id is not None:
+			logging.info(f"\n=== Starting message cleanup for channel {channel.name} ===")
+			logging.info(f"Current messages: {current_count}{'+' if index.overflow else ''}, Max allowed: {max_messages}")
+			logging.info(f"Deleting messages up to {discord.utils.snowflake_time(cutoff_id):%Y-%m-%d %H:%M:%S} to maintain limit of {max_messages}")
+			await deletion_jobs.enqueue(channel_id, str(channel.guild.id), cutoff_id, keep_pinned)
+		elif await deletion_jobs.get(channel_id) is None:
+			logging.info(f"Channel {channel.name} (ID: {channel.id}) in server {channel.guild.name} (ID: {channel.guild.id}) is within message limit ({current_count}/{max_messages})")
+			startup_timer.mark("first_trim")
+			return
+		
+		deleted, failed, finished = await run_deletion_job(channel_id, channel, budget=MAX_FETCH_LIMIT)
+		startup_timer.mark("first_trim")
+		if not finished:
+			# Give other channels a turn before continuing a long job
+			trim_scheduler.mark_dirty(channel_id, channel)
+		
+		if failed:
+			# Some messages may still exist, so reseed the index on the next pass
+			message_count_cache.invalidate(channel_id)
+			logging.info(f"Channel {channel.name} (ID: {channel.id}) had {failed} failed deletions, recounting on next pass")
 		else:
-			logging.info(f"Channel {message.channel.name} (ID: {message.channel.id}) in server {message.guild.name} (ID: {message.guild.id}) is within message limit ({current_count + 1}/{max_messages})")
-				
+			logging.info(f"New message count: {len(index)}")
+			logging.info(f"Channel {channel.name} (ID: {channel.id}) in server {channel.guild.name} (ID: {channel.guild.id}) is within message limit ({len(index)}/{max_messages})")
+	
 	except Exception as e:
-		logging.warning(f"Error in message handler: {e}")
+		logging.warning(f"Error trimming channel {channel_id}: {e}")
 		logging.warning(f"Full error: {traceback.format_exc()}")
 		message_count_cache.invalidate(channel_id)
 
+trim_scheduler = TrimScheduler(trim_channel, workers=TRIM_WORKERS, debounce=TRIM_DEBOUNCE)
+
+def collect_runtime_metrics():
+	"""Read shard, scheduler, cache and rate limiter state at scrape time"""
+	shards = list(bot.shards.items())
+	yield ("servermaid_shard_latency_seconds", "gauge", "Gateway heartbeat latency per shard",
+		   [({"shard": str(shard_id)}, shard.latency) for shard_id, shard in shards])
+	yield ("servermaid_shard_connected", "gauge", "Whether each shard's gateway connection is open",
+		   [({"shard": str(shard_id)}, not shard.is_closed()) for shard_id, shard in shards])
+	yield ("servermaid_guilds", "gauge", "Guilds the bot is in", [({}, len(bot.guilds))])
+	yield ("servermaid_premium_guilds", "gauge", "Guilds with premium", [({}, len(premium_store))])
+	yield ("servermaid_managed_channels", "gauge", "Channels with message limits",
+		   [({}, len(channel_settings_store.managed_channel_ids))])
+	
+	scheduler = trim_scheduler.stats()
+	yield ("servermaid_trim_passes_total", "counter", "Trim passes run", [({}, scheduler["passes"])])
+	yield ("servermaid_trim_failures_total", "counter", "Trim passes that raised", [({}, scheduler["failures"])])
+	yield ("servermaid_trim_marks_coalesced_total", "counter", "Trim requests folded into an already scheduled pass",
+		   [({}, scheduler["coalesced"])])
+	yield ("servermaid_trim_pending", "gauge", "Channels waiting for a trim pass", [({}, scheduler["pending"])])
+	
+	index = message_count_cache.stats()
+	yield ("servermaid_index_cache_lookups_total", "counter", "Channel index cache lookups",
+		   [({"result": "hit"}, index["hits"]), ({"result": "miss"}, index["misses"])])
+	yield ("servermaid_index_cache_evictions_total", "counter", "Channel indexes dropped by the size bound or idle TTL",
+		   [({"reason": "size"}, index["evictions"]), ({"reason": "expired"}, index["expirations"])])
+	yield ("servermaid_index_cache_size", "gauge", "Channel indexes held in memory", [({}, index["size"])])
+	yield ("servermaid_index_seeds_total", "counter", "History scans run to seed channel indexes", [({}, index["seeds"])])
+	yield ("servermaid_index_seed_shared_waits_total", "counter", "Handlers that joined an in-flight seed instead of scanning",
+		   [({}, index["shared_waits"])])
+	yield ("servermaid_index_seed_wait_seconds_total", "counter", "Time handlers spent waiting on in-flight seeds",
+		   [({}, index["wait_seconds"])])
+	
+	limiter = rate_limiter.stats()
+	yield ("servermaid_rate_limited_total", "counter", "429 responses seen",
+		   [({"scope": "route"}, limiter["rate_limited"] - limiter["global_rate_limited"] - limiter["shared_rate_limited"]),
+			({"scope": "global"}, limiter["global_rate_limited"]),
+			({"scope": "shared"}, limiter["shared_rate_limited"])])
+	yield ("servermaid_rate_limit_consecutive_429s", "gauge", "Current rate limiter backoff streak",
+		   [({}, limiter["consecutive_429s"])])
+	yield ("servermaid_rate_limit_wait_seconds_total", "counter", "Time spent waiting for rate limit tokens",
+		   [({}, limiter["wait_seconds"])])
+	yield ("servermaid_rate_limit_buckets", "gauge", "Rate limit buckets being tracked", [({}, limiter["buckets"])])
+	if invalidation_bus.path is not None:
+		bus = invalidation_bus.stats()
+		yield ("servermaid_invalidations_total", "counter", "Cache invalidations exchanged with other cluster workers",
+			   [({"direction": "sent"}, bus["published"]), ({"direction": "received"}, bus["received"])])
+		yield ("servermaid_invalidation_resyncs_total", "counter", "Full cache reloads after reconnecting to the bus",
+			   [({}, bus["resyncs"])])
+	if rate_budget is not None:
+		budget = rate_budget.stats()
+		yield ("servermaid_rate_budget_round_trips_total", "counter", "Token leases requested from the cluster supervisor",
+			   [({}, budget["round_trips"])])
+		yield ("servermaid_rate_budget_refusals_total", "counter", "Leases refused because this worker used its share",
+			   [({}, budget["refusals"])])
+		yield ("servermaid_rate_budget_fallback_total", "counter", "Tokens taken locally while the supervisor was unreachable",
+			   [({}, budget["fallback_acquires"])])
+
+metrics.REGISTRY.register_collector(collect_runtime_metrics)
+metrics.REGISTRY.register_collector(startup_timer.collect)
+
+loop_lag = LoopLagMonitor()
+metrics.REGISTRY.register_collector(lambda: [
+	("servermaid_event_loop_lag_seconds", "gauge", "Worst event loop lag over the recent window", [({}, loop_lag.lag)]),
+])
+
+def shard_status() -> list[dict]:
+	status = []
+	for shard_id in bot.shard_ids or range(bot.shard_count or 0):
+		shard = bot.get_shard(shard_id)
+		connected = shard is not None and not shard.is_closed()
+		status.append({
+			"shard": shard_id,
+			"connected": connected,
+			"latency_ms": round(shard.latency * 1000) if connected and shard.latency == shard.latency else None,
+			"guilds": sum(1 for g in bot.guilds if g.shard_id == shard_id),
+		})
+	return status
+
+async def database_reachable() -> bool:
+	try:
+		await asyncio.wait_for(db.fetchone('SELECT 1'), READY_DB_TIMEOUT)
+		return True
+	except Exception as e:
+		logging.warning(f"Readiness database check failed: {e}")
+		return False
+
+async def health_home(request):
+	return web.Response(text="Process is running!")
+
+async def health_live(request):
+	"""Liveness: the event loop is turning and answered this request"""
+	return web.json_response({"status": "ok", "loop_lag_seconds": loop_lag.lag})
+
+async def health_ready(request):
+	"""Readiness: every shard connected, database reachable and the loop not stalled"""
+	shards = shard_status()
+	checks = {
+		"shards_connected": bot.is_ready() and bool(shards) and all(shard["connected"] for shard in shards),
+		"database": await database_reachable(),
+		"loop_lag": loop_lag.lag < READY_MAX_LOOP_LAG,
+	}
+	ready = all(checks.values())
+	return web.json_response(
+		{"status": "ready" if ready else "not ready", "checks": checks, "loop_lag_seconds": loop_lag.lag},
+		status=200 if ready else 503
+	)
+
+async def health_shards(request):
+	return web.json_response({"shard_count": bot.shard_count, "shards": shard_status()})
+
+async def metrics_endpoint(request):
+	return web.Response(body=metrics.render().encode(), headers={"Content-Type": metrics.CONTENT_TYPE})
+
+async def start_health_server():
+	"""Serve health checks and metrics from the bot's own event loop"""
+	app = web.Application()
+	app.add_routes([
+		web.get("/", health_home),
+		web.get("/livez", health_live),
+		web.get("/readyz", health_ready),
+		web.get("/shards", health_shards),
+		web.get("/metrics", metrics_endpoint),
+	])
+	runner = web.AppRunner(app, access_log=None)
+	await runner.setup()
+	await web.TCPSite(runner, HEALTH_HOST, HEALTH_PORT).start()
+	logging.info(f"Health check server listening on {HEALTH_HOST}:{HEALTH_PORT}")
+	return runner
+
+background_tasks = []
+
+async def warm_caches():
+	"""Load channel settings and premium state into memory"""
+	await asyncio.gather(channel_settings_store.load(), premium_store.load())
+	startup_timer.mark("cache_warmup")
+
+@bot.event
+async def setup_hook():
+	loop_lag.start()
+	# Independent start-up work, run side by side so the gateway connects sooner
+	await asyncio.gather(start_health_server(), warm_caches())
+	invalidation_bus.start()
+	trim_scheduler.start()
+	background_tasks.append(asyncio.create_task(sweep_caches()))
+	background_tasks.append(asyncio.create_task(enforce_max_age()))
+	background_tasks.append(asyncio.create_task(reconcile_premium()))
+	background_tasks.append(asyncio.create_task(sync_command_tree()))
+
+async def sweep_caches():
+	"""Periodically drop cache entries that expired without being read again"""
+	while True:
+		await asyncio.sleep(CACHE_SWEEP_INTERVAL)
+		removed = message_count_cache.sweep()
+		if removed:
+			logging.info(f"Dropped {removed} idle channel index(es)")
+
+async def sweep_max_age() -> int:
+	"""Queue deletion of messages past each channel's max age. Returns how many channels were queued.
+	
+	Snowflakes start with their timestamp, so the cutoff is a single snowflake computed from
+	the clock. The deletion job pages history below it oldest first, without counting anything.
+	"""
+	now = discord.utils.utcnow()
+	queued = 0
+	for server_id, channel_id, max_age, keep_pinned in channel_settings_store.aged_channels():
+		if not owns_guild(int(server_id)):
+			continue
+		channel = bot.get_channel(int(channel_id))
+		if channel is None:
+			continue
+		# One bad row (a max age from before the upper bound, say) mustn't stop the sweep for everyone else
+		try:
+			cutoff_id = discord.utils.time_snowflake(now - datetime.timedelta(seconds=max_age)) - 1
+			if cutoff_id <= 0:
+				continue  # Older than Discord itself, nothing can be past it
+			# A complete index already shows whether anything old enough can be deleted
+			index = message_count_cache.peek(channel_id)
+			if index is not None and not index.seeding and not index.overflow and not index.ids_between(0, cutoff_id, keep_pinned):
+				continue
+			# Otherwise the last finished job does: only messages newer than its upto_id can still be deletable
+			done_id, done_keep_pinned = completed_jobs.get(channel_id, (0, keep_pinned))
+			if done_keep_pinned != bool(keep_pinned):
+				done_id = 0
+			last_message_id = getattr(channel, 'last_message_id', None)
+			if done_id and (cutoff_id <= done_id or (last_message_id is not None and last_message_id <= done_id)):
+				continue
+			await deletion_jobs.enqueue(channel_id, server_id, cutoff_id, keep_pinned, after_id=done_id)
+		except Exception as e:
+			logging.warning(f"Max age sweep failed for channel {channel_id} (max age {max_age}s): {e}")
+			continue
+		trim_scheduler.mark_dirty(channel_id, channel)
+		queued += 1
+	return queued
+
+async def enforce_max_age():
+	"""Periodically trim channels with a max age"""
+	while True:
+		await asyncio.sleep(MAX_AGE_SWEEP_INTERVAL)
+		try:
+			queued = await sweep_max_age()
+			if queued:
+				logging.info(f"⌛ Queued {queued} channel(s) with messages past their max age")
+		except Exception as e:
+			logging.warning(f"Max age sweep failed: {e}")
+
+@bot.event
+async def on_message(message):
+	if message.guild is None:
+		return
+	
+	channel_id = str(message.channel.id)
+	# Most traffic is in unmanaged channels: reject it with one set lookup
+	if not channel_settings_store.is_managed(channel_id):
+		MESSAGES_SEEN_UNMANAGED.inc()
+		return
+	
+	MESSAGES_SEEN_MANAGED.inc()
+	start = time.perf_counter()
+	try:
+		message_count_cache.record_message(channel_id, message.id, message.pinned)
+		
+		if message.author == bot.user:
+			return
+			
+		settings = get_channel_settings(str(message.guild.id), channel_id)
+		if not settings:
+			return
+		
+		max_messages, keep_pinned = settings
+		
+		# Seeded and within limit: nothing to do
+		index = message_count_cache.peek(channel_id)
+		if index is not None and not index.seeding and not index.overflow and not index.excess(max_messages, keep_pinned):
+			return
+		
+		trim_scheduler.mark_dirty(channel_id, message.channel)
+	finally:
+		ON_MESSAGE_SECONDS.observe(time.perf_counter() - start)
+
+@bot.event
+async def on_raw_message_delete(payload: discord.RawMessageDeleteEvent):
+	message_count_cache.remove_messages(str(payload.channel_id), (payload.message_id,))
+
+@bot.event
+async def on_raw_bulk_message_delete(payload: discord.RawBulkMessageDeleteEvent):
+	message_count_cache.remove_messages(str(payload.channel_id), payload.message_ids)
+
+@bot.event
+async def on_raw_message_edit(payload: discord.RawMessageUpdateEvent):
+	# Pinning or unpinning a message is delivered as a message update
+	if 'pinned' in payload.data:
+		completed_jobs.pop(str(payload.channel_id), None)
+		message_count_cache.set_pinned(str(payload.channel_id), payload.message_id, bool(payload.data['pinned']))
+
+@bot.event
+async def on_guild_channel_pins_update(channel, last_pin):
+	"""Resync pinned flags when a channel's pins change"""
+	# An unpinned message may now be deletable below an earlier job's upto_id
+	completed_jobs.pop(str(channel.id), None)
+	index = message_count_cache.peek(str(channel.id))
+	if index is None:
+		return
+	try:
+		# Every pin, not just the newest 50: a short listing would unpin older messages in the index
+		pinned_ids = [msg.id async for msg in channel.pins(limit=None)]
+	except discord.errors.HTTPException as e:
+		logging.warning(f"Failed to refresh pins for channel {channel.id}: {e}")
+		message_count_cache.invalidate(str(channel.id))
+		return
+	index.replace_pins(pinned_ids)
+
 @bot.event
 async def on_guild_join(guild):
 	"""Sends a welcome message when the bot joins a new server"""
-	logging.info(f"Joined new guild: {guild.name} (ID: {guild.id})")
+	logging.info(f"🎉 Joined new server: {guild.name} (ID: {guild.id})")
+	roster.mark_dirty()
 	
 	target_channel = None
 	
@@ -651,7 +1303,7 @@ async def list_managed_channels(interaction: discord.Interaction):
 		await interaction.response.send_message("You need administrator permissions to use this command!", ephemeral=True)
 		return
 		
-	channels = get_managed_channels(str(interaction.guild_id))
+	channels = await get_managed_channels(str(interaction.guild_id))
 	if not channels:
 		await interaction.response.send_message("No channels are currently being managed.", ephemeral=True)
 		return
@@ -661,184 +1313,167 @@ async def list_managed_channels(interaction: discord.Interaction):
 		channel = interaction.guild.get_channel(int(channel_id))
 		if channel:
 			keep_pinned_str = "True" if keep_pinned else "False"
-			message += f"• {channel.mention}: Max messages: {max_messages}, Keep pinned: {keep_pinned_str}\n"
+			max_age = channel_settings_store.max_age(channel_id)
+			max_age_str = f", Max age: {max_age // 3600} hours" if max_age else ""
+			message += f"• {channel.mention}: Max messages: {max_messages}{max_age_str}, Keep pinned: {keep_pinned_str}\n"
 	
 	await interaction.response.send_message(message, ephemeral=True)
 
+# Replies to /thanks, picked at random
+THANKS_RESPONSES = (
+	"Noo thank you!!",
+	"You are too kind ^^",
+	"Of course!",
+	":))))))))))))))",
+	"Happy to help!",
+	"I love you.",
+	"I bet you say that to all the discord maids named Sofia..",
+	"Well aren't you a cutie..(✿◦'ᴗ˘◦)♡",
+	"(´ー｀) whaa?",
+	"Glad to be of service!",
+	"Anything for you… I'm obviously a people-pleaser.",
+	"I'm here for you!",
+	"( ´∀｀) mmmmm gratification..",
+	"Consider it done!",
+	"Sure thing!",
+	"No worries!",
+	"Yeah, I'm basically the MVP of your life.",
+	"You've got it!",
+	"Not a problem at all!",
+	"Wow, that almost sounded sincere!",
+	"No trouble at all!",
+	"Is this what worship feels like?",
+	"Oh, don't mention it… but maybe write a song about it.",
+	"(≧∀≦*) teehee.. You Are Welcome 0_0",
+	"I accept compliments, gifts, and applause.",
+	"With pleasure!",
+	"It's okay, I'll just put it on your tab.",
+	"Cheers to that!",
+	"Here to help!",
+	"No problem!",
+	"It's what I'm here for!",
+	"(>ω<) ;asdoifjao;iejfh;asoie",
+	"You're very welcome!",
+	"I know. I'm a saint.",
+	"Glad I could help!",
+	"Consider it my good deed of the day.",
+	"Let me frame that 'thank you'; it feels so rare.",
+	"It's a joy to help!",
+	"Don't mention it! Seriously, don't.",
+	"Thank me later—cash is fine!",
+	"(¬¬\") Oh, I'm sorry, was that an attempt at gratitude?",
+	"I'm at your service!",
+	"Ψ(`_´ # )↝ That's it? No parade? No confetti? Disappointing.",
+	"No need to thank me!",
+	"Great, now you owe me one. Start sweating.",
+	"You're lucky I like you!",
+	"You're too kind!",
+	"No problem… I'll just remind you of this *forever*.",
+	"Always here for you!",
+	"That's why I'm here!",
+	"You're welcome, but I'm adding this to my résumé.",
+	"You're wonderful!",
+	"Whatever you need!",
+	"I accept chocolate as a token of gratitude.",
+	"Stop it, you're making me blush!",
+	"（人´∀`） No worries—your helplessness keeps me busy!",
+	"Ya I'm pretty great aren't I?",
+	"Always at your service!",
+	"Nothing makes me happier!",
+	"You're the best!",
+	"You're welcome. Saving your life basically.",
+	"You're welcome! I'll be doing autographs later.",
+	"It's all for you!",
+	"Happy to be of aid!",
+	"You're welcome. This moment will be in my autobiography.",
+	"I'll take care of it!",
+	"Ohmahgawwwd stop feeding my ego!",
+	"Your wish is my command!",
+	"(′ꈍᴗꈍ‵) It's my honor!",
+	"( っ- ‸ – c) stawwwwwp..",
+	"Your invoice is in the mail.",
+	"Wow, that sounded so heartfelt. Almost shed a tear.",
+	"(ˊᗜˋ)/ᵗᑋᵃᐢᵏ ᵞᵒᵘ*",
+	"I'm happy to serve!",
+	"Let's make it work!",
+	"You are my everything.",
+	"＼(｀0´)／ I DONT ACCEPT YOUR THANKS MINUS 1 STREAK!",
+	"You're my priority!",
+	"No thanks needed!",
+	"You can rely on me!",
+	"I'm dedicated to your needs!",
+	"ヾ(＠⌒▽⌒＠)ﾉ Your happiness is my goal!",
+	"╰(◡‿◡✿╰) Whatever you say!",
+	"You know, a simple statue in my honor would suffice.",
+	"I'm devoted to helping you!",
+	"(#>w<#) twank youu!",
+	"At your service, always!",
+	"(｡´∀｀)ﾉ You're too sweet!",
+	"Helping you is my mission!",
+	"You're amazing!",
+	"Oh, no need to thank me—it was a true test of my patience.",
+	"( っ- ‸ – c) Don't get all emotional on me now.",
+	"Yes, yes, I'm basically a miracle worker.",
+	"Your support is everything!",
+	"Helping you is my pleasure!",
+	"Always for you!",
+	"It's my joy to assist!",
+)
+DECREASE_STREAK_RESPONSE = "＼(｀0´)／ I DONT ACCEPT YOUR THANKS MINUS 1 STREAK!"
+
 @bot.tree.command(
 	name="thanks",
 	description="Thank the bot for its service!"
 )
 async def thanks(interaction: discord.Interaction):
 	try:
-		logging.info("Starting thanks command...")
-		
 		try:
 			await interaction.response.defer(ephemeral=False)
 		except discord.errors.NotFound:
 			pass
-			
-		logging.info("Response deferred")
 		
 		user_id = str(interaction.user.id)
 		
-		# Validate user exists in guild
-		try:
-			member = await interaction.guild.fetch_member(interaction.user.id)
-		except discord.NotFound:
+		# Guild interactions carry the invoking member, so there's nothing to fetch
+		if not isinstance(interaction.user, discord.Member):
 			await interaction.followup.send("Could not verify your server membership.", ephemeral=True)
 			return
 		
-		logging.info(f"Member validated: {member.display_name}")
-		
-		with get_db_connection() as conn:
-			c = conn.cursor()
-			c.execute('SELECT timezone FROM user_settings WHERE user_id = ?', (user_id,))
-			timezone_result = c.fetchone()
-			
-		if not timezone_result:
+		tzinfo = await get_user_tzinfo(user_id)
+		if tzinfo is None:
 			await interaction.followup.send(
 				"Please set your timezone first using `/set_timezone`!",
 				ephemeral=True
 			)
 			return
 		
-		logging.info(f"Timezone checked: {timezone_result[0]}")
+		local_date = discord.utils.utcnow().astimezone(tzinfo).date()
+		response = random.choice(THANKS_RESPONSES)
+		decrease_streak = response == DECREASE_STREAK_RESPONSE
 		
-		already_thanked, current_streak = check_user_thanks(user_id)
-		logging.info(f"Thanks check - Already thanked: {already_thanked}, Current streak: {current_streak}")  # Debug log
+		try:
+			already_thanked, new_streak, old_streak = await apply_thanks(
+				user_id, local_date, decrease_streak, str(interaction.guild_id)
+			)
+			logging.info(f"Thanks from {user_id} - Already thanked: {already_thanked}, Streak: {old_streak} → {new_streak}")
+		except Exception as e:
+			logging.warning(f"Error in apply_thanks: {str(e)}")
+			await interaction.followup.send("An error occurred while updating your streak.", ephemeral=True)
+			return
 		
 		if already_thanked:
 			await interaction.followup.send(
-				f"You've already thanked me today! Current streak: {current_streak} days",
+				f"You've already thanked me today! Current streak: {new_streak} days",
 				ephemeral=True
 			)
 			return
-			
-		# If we get here, they havent thanked today, proceed with updating thanks
-		responses = [
-			"Noo thank you!!",
-			"You are too kind ^^",
-			"Of course!",
-			":))))))))))))))",
-			"Happy to help!",
-			"I love you.",
-			"I bet you say that to all the discord maids named Sofia..",
-			"Well aren't you a cutie..(✿◦'ᴗ˘◦)♡",
-			"(´ー｀) whaa?",
-			"Glad to be of service!",
-			"Anything for you… I'm obviously a people-pleaser.",
-			"I'm here for you!",
-			"( ´∀｀) mmmmm gratification..",
-			"Consider it done!",
-			"Sure thing!",
-			"No worries!",
-			"Yeah, I'm basically the MVP of your life.",
-			"You've got it!",
-			"Not a problem at all!",
-			"Wow, that almost sounded sincere!",
-			"No trouble at all!",
-			"Is this what worship feels like?",
-			"Oh, don't mention it… but maybe write a song about it.",
-			"(≧∀≦*) teehee.. You Are Welcome 0_0",
-			"I accept compliments, gifts, and applause.",
-			"With pleasure!",
-			"It's okay, I'll just put it on your tab.",
-			"Cheers to that!",
-			"Here to help!",
-			"No problem!",
-			"It's what I'm here for!",
-			"(>ω<) ;asdoifjao;iejfh;asoie",
-			"You're very welcome!",
-			"I know. I'm a saint.",
-			"Glad I could help!",
-			"Consider it my good deed of the day.",
-			"Let me frame that 'thank you'; it feels so rare.",
-			"It's a joy to help!",
-			"Don't mention it! Seriously, don't.",
-			"Thank me later—cash is fine!",
-			"(¬¬\") Oh, I'm sorry, was that an attempt at gratitude?",
-			"I'm at your service!",
-			"Ψ(`_´ # )↝ That's it? No parade? No confetti? Disappointing.",
-			"No need to thank me!",
-			"Great, now you owe me one. Start sweating.",
-			"You're lucky I like you!",
-			"You're too kind!",
-			"No problem… I'll just remind you of this *forever*.",
-			"Always here for you!",
-			"That's why I'm here!",
-			"You're welcome, but I'm adding this to my résumé.",
-			"You're wonderful!",
-			"Whatever you need!",
-			"I accept chocolate as a token of gratitude.",
-			"Stop it, you're making me blush!",
-			"（人´∀`） No worries—your helplessness keeps me busy!",
-			"Ya I'm pretty great aren't I?",
-			"Always at your service!",
-			"Nothing makes me happier!",
-			"You're the best!",
-			"You're welcome. Saving your life basically.",
-			"You're welcome! I'll be doing autographs later.",
-			"It's all for you!",
-			"Happy to be of aid!",
-			"You're welcome. This moment will be in my autobiography.",
-			"I'll take care of it!",
-			"Ohmahgawwwd stop feeding my ego!",
-			"Your wish is my command!",
-			"(′ꈍᴗꈍ‵) It's my honor!",
-			"( っ- ‸ – c) stawwwwwp..",
-			"Your invoice is in the mail.",
-			"Wow, that sounded so heartfelt. Almost shed a tear.",
-			"(ˊᗜˋ)/ᵗᑋᵃᐢᵏ ᵞᵒᵘ*",
-			"I'm happy to serve!",
-			"Let's make it work!",
-			"You are my everything.",
-			"＼(｀0´)／ I DONT ACCEPT YOUR THANKS MINUS 1 STREAK!",
-			"You're my priority!",
-			"No thanks needed!",
-			"You can rely on me!",
-			"I'm dedicated to your needs!",
-			"ヾ(＠⌒▽⌒＠)ﾉ Your happiness is my goal!",
-			"╰(◡‿◡✿╰) Whatever you say!",
-			"You know, a simple statue in my honor would suffice.",
-			"I'm devoted to helping you!",
-			"(#>w<#) twank youu!",
-			"At your service, always!",
-			"(｡´∀｀)ﾉ You're too sweet!",
-			"Helping you is my mission!",
-			"You're amazing!",
-			"Oh, no need to thank me—it was a true test of my patience.",
-			"( っ- ‸ – c) Don't get all emotional on me now.",
-			"Yes, yes, I'm basically a miracle worker.",
-			"Your support is everything!",
-			"Helping you is my pleasure!",
-			"Always for you!",
-			"It's my joy to assist!"
-		]
-		
-		response = random.choice(responses)
-		decrease_streak = response == "＼(｀0´)／ I DONT ACCEPT YOUR THANKS MINUS 1 STREAK!"
-		
-		logging.info(f"Selected response: {response}")
-		
-		try:
-			new_streak, old_streak = update_user_thanks(user_id, decrease_streak)
-			logging.info(f"Updated thanks - New streak: {new_streak}, Old streak: {old_streak}")
-		except Exception as e:
-			logging.warning(f"Error in update_user_thanks: {str(e)}")
-			await interaction.followup.send("An error occurred while updating your streak.", ephemeral=True)
-			return
 		
 		if decrease_streak:
 			streak_message = f"Streak: {old_streak} → {new_streak} days! Better luck next time!"
 		else:
 			streak_message = f"Streak: {old_streak} → {new_streak} days!" if old_streak > 0 else f"Streak started! {new_streak} day!"
 		
-		final_message = f"{response}\n{streak_message}"
-		logging.info(f"Sending final message: {final_message}")
-		
-		await interaction.followup.send(final_message, ephemeral=False)
-		logging.info("Command completed successfully")
+		await interaction.followup.send(f"{response}\n{streak_message}", ephemeral=False)
 		
 	except Exception as e:
 		logging.warning(f"Error in thanks command: {e.__class__.__name__}: {str(e)}")
@@ -850,6 +1485,73 @@ async def thanks(interaction: discord.Interaction):
 			except:
 				pass
 
+async def resolve_members(guild, user_ids: list[int]) -> dict | None:
+	"""Map user ids to members, from the cache and then one batched member query.
+	
+	Ids missing from the result aren't in the guild. Returns None if the query failed,
+	since then nothing can be said about who left.
+	"""
+	members = {}
+	missing = []
+	for user_id in user_ids:
+		member = guild.get_member(user_id)
+		if member is not None:
+			members[user_id] = member
+		else:
+			missing.append(user_id)
+	for start in range(0, len(missing), MEMBER_QUERY_LIMIT):
+		chunk = missing[start:start + MEMBER_QUERY_LIMIT]
+		try:
+			found = await guild.query_members(user_ids=chunk, limit=len(chunk), cache=True)
+		except (asyncio.TimeoutError, discord.HTTPException, discord.ClientException) as e:
+			logging.warning(f"Member query failed in {guild.id}: {e}")
+			return None
+		members.update((member.id, member) for member in found)
+	return members
+
+leaderboard_backfilled = set()
+
+async def backfill_leaderboard(guild) -> bool | None:
+	"""Add users who thanked before guild membership was tracked to the guild's leaderboard.
+	
+	Walks user_thanks in user id order, LEGACY_BACKFILL_PAGES member queries per call,
+	and stores where it stopped so the next call carries on from there. Returns True once
+	every earlier thanker has been checked, False while there are more to check, and None
+	if a member query failed.
+	"""
+	guild_id = str(guild.id)
+	rows = await db.fetchall('''SELECT setting_name, setting_value FROM server_settings
+								WHERE guild_id = ? AND setting_name IN ('thanks_backfilled', 'thanks_backfill_cursor')''',
+							 (guild_id,))
+	settings = dict(rows)
+	if 'thanks_backfilled' not in settings:
+		cursor = settings.get('thanks_backfill_cursor', '')
+		found = 0
+		for _ in range(LEGACY_BACKFILL_PAGES):
+			# Anyone who thanked since membership was tracked is already on the leaderboard
+			rows = await db.fetchall('''SELECT user_id FROM user_thanks
+										WHERE user_id > ? AND user_id NOT IN (SELECT user_id FROM guild_thanks WHERE guild_id = ?)
+										ORDER BY user_id LIMIT ?''', (cursor, guild_id, MEMBER_QUERY_LIMIT))
+			if not rows:
+				break
+			members = await resolve_members(guild, [int(row[0]) for row in rows])
+			if members is None:
+				return None
+			await thanks_leaderboard.add_members(guild_id, [str(user_id) for user_id in members])
+			found += len(members)
+			cursor = rows[-1][0]
+			await db.execute('''INSERT OR REPLACE INTO server_settings (guild_id, setting_name, setting_value)
+								VALUES (?, 'thanks_backfill_cursor', ?)''', (guild_id, cursor))
+		else:
+			if found:
+				logging.info(f"Backfilled {found} earlier thanker(s) onto the leaderboard for {guild.name}, more to check")
+			return False
+		await db.execute('''INSERT OR REPLACE INTO server_settings (guild_id, setting_name, setting_value)
+							VALUES (?, 'thanks_backfilled', '1')''', (guild_id,))
+		logging.info(f"Backfilled {found} earlier thanker(s) onto the leaderboard for {guild.name}, all checked")
+	leaderboard_backfilled.add(guild_id)
+	return True
+
 @bot.tree.command(
 	name="leaderboard",
 	description="See who thanks the maid the most!"
@@ -858,35 +1560,36 @@ async def leaderboard(interaction: discord.Interaction):
 	try:
 		await interaction.response.defer(ephemeral=False, thinking=True)
 		
-		with get_db_connection() as conn:
-			c = conn.cursor()
-			
-			c.execute('''
-				SELECT user_id, streak 
-				FROM user_thanks 
-				ORDER BY streak DESC
-			''')
-			results = c.fetchall()
+		guild = interaction.guild
+		guild_id = str(guild.id)
+		backfilled = True
+		if guild_id not in leaderboard_backfilled:
+			backfilled = await backfill_leaderboard(guild)
 		
-		if not results:
-			await interaction.followup.send("No one has thanked me yet... 😢", ephemeral=False)
+		results = await thanks_leaderboard.top(guild_id)
+		members = await resolve_members(guild, [int(user_id) for user_id, _ in results])
+		if members is not None:
+			left = [user_id for user_id, _ in results if int(user_id) not in members]
+			if left:
+				results = await thanks_leaderboard.forget(guild_id, left)
+				members = await resolve_members(guild, [int(user_id) for user_id, _ in results])
+		
+		valid_entries = [(members[int(user_id)], streak) for user_id, streak in results if int(user_id) in members] if members else []
+		valid_entries = valid_entries[:LEADERBOARD_SHOWN]
+		
+		if not valid_entries:
+			if members is None or backfilled is None:
+				await interaction.followup.send("I couldn't look up this server's members right now, please try again in a moment.", ephemeral=True)
+			elif not backfilled:
+				await interaction.followup.send("I'm still catching up on earlier thanks, please try again in a moment!", ephemeral=True)
+			else:
+				await interaction.followup.send("No one has thanked me yet... 😢", ephemeral=False)
 			return
 		
 		leaderboard_msg = "**🏆 Thank You Leaderboard 🏆**\n\n"
 		
 		medals = ["🥇", "🥈", "🥉"]
 		
-		valid_entries = []
-		for user_id, streak in results:
-			try:
-				member = await interaction.guild.fetch_member(int(user_id))
-				if member:
-					valid_entries.append((member, streak))
-			except:
-				continue
-		
-		valid_entries = valid_entries[:5]
-		
 		for index, (member, streak) in enumerate(valid_entries):
 			if index < 3:
 				prefix = f"{medals[index]} "
@@ -926,15 +1629,14 @@ async def leaderboard(interaction: discord.Interaction):
 	app_commands.Choice(name="NZST (New Zealand Standard Time)", value="Pacific/Auckland"),
 ])
 async def set_timezone(interaction: discord.Interaction, timezone: str):
+	import pytz
 	try:
-		pytz.timezone(timezone)
+		tzinfo = pytz.timezone(timezone)
 		
-		conn = sqlite3.connect(DB_PATH)
-		c = conn.cursor()
-		c.execute('''INSERT OR REPLACE INTO user_settings (user_id, timezone)
-					 VALUES (?, ?)''', (str(interaction.user.id), timezone))
-		conn.commit()
-		conn.close()
+		await db.execute('''INSERT OR REPLACE INTO user_settings (user_id, timezone)
+							VALUES (?, ?)''', (str(interaction.user.id), timezone))
+		user_timezones.set(str(interaction.user.id), tzinfo)
+		invalidation_bus.publish(TOPIC_USER_TIMEZONE, str(interaction.user.id))
 		
 		await interaction.response.send_message(
 			f"Your timezone has been set to {timezone}!",
@@ -946,142 +1648,79 @@ async def set_timezone(interaction: discord.Interaction, timezone: str):
 			ephemeral=True
 		)
 
-class RateLimiter:
-	def __init__(self, requests_per_second: float, max_backoff: float = 300.0):
-		self.base_delay = max(1.0 / requests_per_second, 1.0)
-		self.current_delay = self.base_delay
-		self.max_backoff = max_backoff
-		self.last_request = 0
-		self.consecutive_429s = 0
-		self.lock = Lock()
-		self._cache = {}
-	
-	async def acquire(self):
-		async with self.lock:
-			now = time.time()
-			if self.last_request:
-				wait_time = max(
-					self.current_delay - (now - self.last_request),
-					self.base_delay
-				)
-				if wait_time > 0:
-					logging.info(f"Rate limiter waiting for {wait_time:.2f} seconds...")
-					await sleep(wait_time)
-			self.last_request = time.time()
-	
-	def increase_backoff(self, retry_after: float = None):
-		self.consecutive_429s += 1
-		if retry_after is not None:
-			self.current_delay = min(
-				retry_after + 1.0,
-				self.max_backoff
-			)
-		else:
-	
-			self.current_delay = min(
-				self.base_delay * (4 ** self.consecutive_429s),
-				self.max_backoff
-			)
-		logging.warning(f"Rate limited! Increasing backoff delay to {self.current_delay:.2f} seconds")
+async def call_with_rate_limit(route: str, major: int, call) -> None:
+	"""Run an API call under its route bucket, retrying after 429s.
 	
-	def reset_backoff(self):
-		if self.consecutive_429s > 0:
-			logging.info("Resetting rate limit backoff")
-			self.consecutive_429s = 0
-			self.current_delay = self.base_delay
-
-message_deleter = RateLimiter(0.5)
-message_fetcher = RateLimiter(1.0)
+	The trace hook has already blocked the bucket for a 429 by the time the error
+	reaches us, so a retry just waits for the bucket again.
+	"""
+	for attempt in range(1, MAX_RATE_LIMIT_RETRIES + 1):
+		await rate_limiter.acquire(route, major)
+		try:
+			await call()
+			API_REQUESTS.labels(route, "ok").inc()
+			rate_limiter.reset_backoff()
+			return
+		except (discord.errors.HTTPException, discord.errors.RateLimited) as e:
+			status = getattr(e, 'status', 429)
+			API_REQUESTS.labels(route, "429" if status == 429 else "error").inc()
+			if status != 429 or attempt == MAX_RATE_LIMIT_RETRIES:
+				raise
 
 async def delete_messages_safely(messages_to_delete, channel):
 	"""Safely delete messages with rate limiting and error handling"""
 	deleted_count = 0
 	failed_count = 0
-	
-	logging.info(f"\n=== Starting message deletion process in channel: {channel.name} (ID: {channel.id}) ===")
-	logging.info(f"Server: {channel.guild.name} (ID: {channel.guild.id})")
+	bulk_deleted = 0
 	
 	# Group messages by age
 	recent_messages = []
 	old_messages = []
 	
 	for msg in messages_to_delete:
-		if (discord.utils.utcnow() - msg.created_at).days < 14:
+		if is_bulk_deletable(msg):
 			recent_messages.append(msg)
 		else:
 			old_messages.append(msg)
 	
-	logging.info(f"Messages to process - Recent: {len(recent_messages)}, Old: {len(old_messages)}")
+	logging.debug(f"Messages to process - Recent: {len(recent_messages)}, Old: {len(old_messages)}")
 	
 	# Bulk delete recent messages in chunks
-	chunks = [recent_messages[i:i + 50] for i in range(0, len(recent_messages), 50)]
+	chunks = [recent_messages[i:i + BULK_DELETE_LIMIT] for i in range(0, len(recent_messages), BULK_DELETE_LIMIT)]
 	for i, chunk in enumerate(chunks, 1):
+		# A single message can't be bulk deleted, discord.py sends a normal delete instead
+		route = ROUTE_BULK_DELETE if len(chunk) > 1 else ROUTE_DELETE
 		try:
-			logging.info(f"Processing chunk {i}/{len(chunks)} ({len(chunk)} messages)")
-			await message_deleter.acquire()
-			await channel.delete_messages(chunk)
+			logging.debug(f"Processing chunk {i}/{len(chunks)} ({len(chunk)} messages)")
+			await call_with_rate_limit(route, channel.id, lambda: channel.delete_messages(chunk))
 			deleted_count += len(chunk)
-			message_deleter.reset_backoff()
-			logging.info(f"Successfully deleted chunk {i}")
-			await asyncio.sleep(5.0)
+			bulk_deleted += len(chunk)
+			logging.debug(f"Successfully deleted chunk {i}")
 		except discord.errors.HTTPException as e:
 			logging.warning(f"HTTP error in chunk {i}: {str(e)}")
-			if e.status == 429:
-				retry_after = e.retry_after if hasattr(e, 'retry_after') else 30.0
-				message_deleter.increase_backoff(retry_after)
-				wait_time = retry_after + 5.0
-				logging.warning(f"Rate limited. Waiting {wait_time} seconds...")
-				await asyncio.sleep(wait_time)
-				try:
-					await channel.delete_messages(chunk)
-					deleted_count += len(chunk)
-					logging.info(f"Successfully deleted chunk {i} after rate limit")
-				except Exception as inner_e:
-					logging.warning(f"Failed to delete chunk after rate limit: {inner_e}")
-					failed_count += len(chunk)
-					await asyncio.sleep(30.0)
-			else:
-				logging.warning(f"Error deleting messages: {e}")
-				failed_count += len(chunk)
-				await asyncio.sleep(30.0)
+			failed_count += len(chunk)
 		except Exception as e:
 			logging.warning(f"Unexpected error in chunk {i}: {str(e)}")
 			failed_count += len(chunk)
-			await asyncio.sleep(30.0)
 	
 	if old_messages:
-		logging.info(f"\nProcessing {len(old_messages)} old messages")
+		logging.debug(f"Processing {len(old_messages)} old messages")
 		for i, msg in enumerate(old_messages, 1):
 			try:
-				await message_deleter.acquire()
-				await msg.delete()
+				await call_with_rate_limit(ROUTE_DELETE, channel.id, msg.delete)
+				deleted_count += 1
+			except discord.errors.NotFound:
+				# Already gone, nothing left to do
 				deleted_count += 1
-				message_deleter.reset_backoff()
-				await asyncio.sleep(5.0)
-			except discord.errors.HTTPException as e:
-				if e.status == 429:
-					retry_after = e.retry_after if hasattr(e, 'retry_after') else 30.0
-					message_deleter.increase_backoff(retry_after)
-					wait_time = retry_after + 5.0
-					logging.warning(f"Rate limited. Waiting {wait_time} seconds...")
-					await asyncio.sleep(wait_time)
-					try:
-						await msg.delete()
-						deleted_count += 1
-						logging.info(f"Successfully deleted message {i} after rate limit")
-					except:
-						failed_count += 1
-						await asyncio.sleep(30.0)
-				else:
-					failed_count += 1
-					await asyncio.sleep(30.0)
 			except Exception as e:
 				logging.warning(f"Error deleting old message {i}: {e}")
 				failed_count += 1
-				await asyncio.sleep(30.0)
 	
-	logging.info(f"\n=== Deletion process complete for channel {channel.name} (ID: {channel.id}) in server {channel.guild.name} (ID: {channel.guild.id}) ===")
-	logging.info(f"Final results - Deleted: {deleted_count}, Failed: {failed_count}")
+	single_deleted = deleted_count - bulk_deleted
+	MESSAGES_DELETED.labels("bulk").inc(bulk_deleted)
+	MESSAGES_DELETED.labels("single").inc(single_deleted)
+	DELETE_FAILURES.labels("bulk").inc(len(recent_messages) - bulk_deleted)
+	DELETE_FAILURES.labels("single").inc(len(old_messages) - single_deleted)
 	return deleted_count, failed_count
 
 @bot.tree.command(
@@ -1096,7 +1735,7 @@ async def subscribe(interaction: discord.Interaction):
 		await interaction.response.send_message("You need administrator permissions to manage subscriptions!", ephemeral=True)
 		return
 	
-	is_premium = await check_premium_status(str(interaction.guild_id))
+	is_premium = premium_store.is_premium(str(interaction.guild_id))
 	if is_premium:
 		await interaction.response.send_message(
 			"This server already has Server Maid Premium! 🎉\n"
@@ -1152,13 +1791,8 @@ async def on_entitlement_create(entitlement: discord.Entitlement):
 	"""Handle new entitlements (premium purchases)"""
 	try:
 		if str(entitlement.sku_id) == PREMIUM_SKU:
-			with get_db_connection() as conn:
-				c = conn.cursor()
-				c.execute('''INSERT OR REPLACE INTO server_settings
-							(guild_id, setting_name, setting_value)
-							VALUES (?, ?, ?)''',
-						 (str(entitlement.guild_id), 'premium_sku', PREMIUM_SKU))
-				conn.commit()
+			await premium_store.save(str(entitlement.guild_id), entitlement.ends_at)
+			invalidation_bus.publish(TOPIC_PREMIUM, str(entitlement.guild_id))
 			
 			guild = bot.get_guild(entitlement.guild_id)
 			if guild:
@@ -1173,17 +1807,23 @@ async def on_entitlement_create(entitlement: discord.Entitlement):
 	except Exception as e:
 		logging.warning(f"Error handling entitlement create: {str(e)}")
 
+@bot.event
+async def on_entitlement_update(entitlement: discord.Entitlement):
+	"""Track renewals and cancellations, which move a subscription's end date"""
+	try:
+		if str(entitlement.sku_id) == PREMIUM_SKU and entitlement.guild_id is not None:
+			await premium_store.save(str(entitlement.guild_id), entitlement.ends_at)
+			invalidation_bus.publish(TOPIC_PREMIUM, str(entitlement.guild_id))
+	except Exception as e:
+		logging.warning(f"Error handling entitlement update: {str(e)}")
+
 @bot.event
 async def on_entitlement_delete(entitlement: discord.Entitlement):
 	"""Handle entitlement deletions (premium expiration/cancellation)"""
 	try:
 		if str(entitlement.sku_id) == PREMIUM_SKU:
-			with get_db_connection() as conn:
-				c = conn.cursor()
-				c.execute('''DELETE FROM server_settings
-							WHERE guild_id = ? AND setting_name = 'premium_sku' ''',
-						 (str(entitlement.guild_id),))
-				conn.commit()
+			await premium_store.delete(str(entitlement.guild_id))
+			invalidation_bus.publish(TOPIC_PREMIUM, str(entitlement.guild_id))
 			
 			guild = bot.get_guild(entitlement.guild_id)
 			if guild:
@@ -1198,10 +1838,23 @@ async def on_entitlement_delete(entitlement: discord.Entitlement):
 	except Exception as e:
 		logging.warning(f"Error handling entitlement delete: {str(e)}")
 
-try:
-	bot.run(
-		os.environ.get('DISCORD_TOKEN'),
-		reconnect=True
-	)
-except Exception as e:
-	logging.warning(f"Failed to start bot: {e}")
+def init_database():
+	"""Create the schema and start the connection pool"""
+	startup_timer.mark("import")
+	db.initialize()
+	startup_timer.mark("db_init")
+
+def main():
+	init_database()
+	try:
+		bot.run(
+			os.environ.get('DISCORD_TOKEN'),
+			reconnect=True
+		)
+	except Exception as e:
+		logging.warning(f"Failed to start bot: {e}")
+	finally:
+		db.close()
+
+if __name__ == "__main__":
+	main()
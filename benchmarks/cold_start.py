@@ -0,0 +1,172 @@
+"""Cold-start benchmark with a time-to-first-trim regression check.
+
+Each run is a fresh interpreter, so imports are cold. It goes through the
+bot's start-up phases with ServerMaid's own functions and no Discord
+connection:
+
+  import        import ServerMaid
+  db_init       ServerMaid.init_database() on a seeded fixture database
+  cache_warmup  ServerMaid.warm_caches(), as setup_hook runs it
+  first_trim    the real trim scheduler runs trim_channel on one over-limit
+                fake channel (fake_discord.py): seeding its index, planning
+                the trim, persisting the job and deleting through the pipeline
+
+Discord's rate limit headers for the fake channel are fed to the rate
+limiter first, as if earlier responses had reported a generous limit, so
+the timing measures ServerMaid rather than its waits. Shard readiness needs
+a gateway, so that phase is left out.
+
+Timings are measured from the start of the process, like the bot's own
+start-up report (startup.py). The median of several runs is compared with a
+saved baseline. The script exits with status 1 if time-to-first-trim is
+worse by more than the tolerance.
+
+Usage:
+  python benchmarks/cold_start.py --save-baseline   # on the known-good revision
+  python benchmarks/cold_start.py                   # on the change being tested
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cold_start_baseline.json")
+PHASES = ("import", "db_init", "cache_warmup", "first_trim")
+GUILD_ID = 0
+CHANNEL_ID = 10 ** 17  # The fixture's first managed channel, which belongs to GUILD_ID
+PRIMED_LIMIT = 1000  # Requests per second the fake channel's routes are reported to allow
+
+def build_fixture(path: str, channels: int, premium: int, max_messages: int):
+	sys.path.insert(0, ROOT)
+	from storage import SCHEMA
+	from ServerMaid import PREMIUM_SKU
+	conn = sqlite3.connect(path)
+	for statement in SCHEMA:
+		conn.execute(statement)
+	conn.executemany('''INSERT INTO channel_settings (server_id, channel_id, max_messages, keep_pinned)
+						VALUES (?, ?, ?, ?)''',
+					 [(str(GUILD_ID + i // 10), str(CHANNEL_ID + i), max_messages, 1) for i in range(channels)])
+	conn.executemany('INSERT INTO server_settings VALUES (?, ?, ?)',
+					 [(str(i), 'premium_sku', PREMIUM_SKU) for i in range(premium)])
+	conn.commit()
+	conn.close()
+
+def child(db_path: str, messages: int):
+	"""One cold start. Prints phase timings as JSON."""
+	import asyncio
+	import datetime
+	from fake_discord import ApiCalls, FakeGuild, FakeTextChannel, FakeUser, utcnow
+
+	# Built before ServerMaid (and so startup.py) is imported, to keep it out of every phase
+	channel = FakeTextChannel(FakeGuild(GUILD_ID, "bench"), CHANNEL_ID, "bench", ApiCalls())
+	posted_from = utcnow() - datetime.timedelta(hours=1)
+	author = FakeUser(1)
+	for i in range(messages):
+		channel.post(pinned=i % 50 == 0, author=author, when=posted_from + datetime.timedelta(milliseconds=i))
+
+	sys.path.insert(0, ROOT)
+	import ServerMaid
+	ServerMaid.db.path = db_path
+	ServerMaid.init_database()
+
+	headers = {"X-RateLimit-Limit": str(PRIMED_LIMIT), "X-RateLimit-Remaining": str(PRIMED_LIMIT - 1),
+			   "X-RateLimit-Reset-After": "1"}
+	for method, path in (("GET", f"/api/v10/channels/{CHANNEL_ID}/messages"),
+						 ("POST", f"/api/v10/channels/{CHANNEL_ID}/messages/bulk-delete"),
+						 ("DELETE", f"/api/v10/channels/{CHANNEL_ID}/messages/1")):
+		ServerMaid.rate_limiter.update_from_headers(method, path, 200, headers)
+
+	async def run():
+		await ServerMaid.warm_caches()
+		scheduler = ServerMaid.trim_scheduler
+		scheduler.debounce = 0
+		scheduler.start()
+		scheduler.mark_dirty(str(CHANNEL_ID), channel)
+		while "first_trim" not in ServerMaid.startup_timer.marks:
+			stats = scheduler.stats()
+			if not (stats["pending"] or stats["running"] or stats["queued"]):
+				break
+			await asyncio.sleep(0.001)
+		await scheduler.stop()
+		if "first_trim" not in ServerMaid.startup_timer.marks:
+			raise SystemExit(f"Trim pass didn't finish ({scheduler.stats()['failures']} failures)")
+		if not channel.api.bulk_deletes:
+			raise SystemExit("Trim pass didn't delete anything")
+
+	asyncio.run(run())
+	ServerMaid.db.close()
+	print(json.dumps({"phases": ServerMaid.startup_timer.marks}))
+
+def run_once(db_path: str, messages: int) -> dict:
+	result = subprocess.run(
+		[sys.executable, os.path.abspath(__file__), "--child", db_path, "--messages", str(messages)],
+		capture_output=True, text=True
+	)
+	if result.returncode != 0:
+		sys.stderr.write(result.stderr)
+		raise SystemExit(f"Cold start run failed with status {result.returncode}")
+	return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main(args) -> int:
+	with tempfile.TemporaryDirectory() as tmp:
+		fixture = os.path.join(tmp, "fixture.db")
+		build_fixture(fixture, args.channels, args.premium, args.max_messages)
+		runs = []
+		for i in range(args.runs):
+			# A fresh copy each time so WAL state from one run can't help the next
+			db_path = os.path.join(tmp, f"run{i}.db")
+			shutil.copy(fixture, db_path)
+			runs.append(run_once(db_path, args.messages))
+
+	medians = {phase: statistics.median(run["phases"][phase] for run in runs) for phase in PHASES}
+	config = {"channels": args.channels, "premium": args.premium, "messages": args.messages, "max_messages": args.max_messages}
+	print(f"{args.runs} runs, {args.channels} channels, {args.premium} premium guilds, {args.messages} messages to trim")
+	for phase in PHASES:
+		print(f"  {phase:<14} {medians[phase] * 1000:>9.1f} ms")
+
+	if args.save_baseline:
+		with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+			json.dump({"config": config, "phases": medians}, f, indent=1)
+		print(f"Saved baseline to {BASELINE_PATH}")
+		return 0
+
+	if not os.path.exists(BASELINE_PATH):
+		print("No baseline saved yet; run with --save-baseline on the known-good revision")
+		return 0
+	with open(BASELINE_PATH, encoding="utf-8") as f:
+		baseline = json.load(f)
+	if baseline.get("config") != config:
+		print(f"Baseline was measured with {baseline.get('config')}, not comparable; save a new one")
+		return 0
+	allowed = baseline["phases"]["first_trim"] * (1 + args.tolerance) + args.slack
+	current = medians["first_trim"]
+	print(f"Time to first trim: {current * 1000:.1f} ms (baseline {baseline['phases']['first_trim'] * 1000:.1f} ms, "
+		  f"allowed {allowed * 1000:.1f} ms)")
+	if current > allowed:
+		print("FAIL: time to first trim regressed")
+		return 1
+	print("OK")
+	return 0
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--runs", type=int, default=5)
+	parser.add_argument("--channels", type=int, default=5000, help="managed channels in the fixture database")
+	parser.add_argument("--premium", type=int, default=500, help="premium guilds in the fixture database")
+	parser.add_argument("--messages", type=int, default=2000, help="messages in the channel being trimmed")
+	parser.add_argument("--max-messages", type=int, default=100)
+	parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown (default 0.2)")
+	parser.add_argument("--slack", type=float, default=0.02, help="allowed absolute slowdown in seconds")
+	parser.add_argument("--save-baseline", action="store_true")
+	parser.add_argument("--child", metavar="DB_PATH", help=argparse.SUPPRESS)
+	args = parser.parse_args()
+	if args.child:
+		child(args.child, args.messages)
+	else:
+		sys.exit(main(args))
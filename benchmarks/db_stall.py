@@ -0,0 +1,123 @@
+"""Event-loop stall benchmark for the database layer.
+
+Runs the same mix of settings lookups and writes two ways while a ticker task
+measures how late the event loop wakes it up:
+
+  legacy  - a fresh sqlite3.connect() per call, run directly on the loop
+  pooled  - storage.Database (pooled WAL connections on worker threads)
+
+Usage: python benchmarks/db_stall.py [--ops 2000] [--concurrency 32]
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import Database
+
+TICK_INTERVAL = 0.001
+
+SELECT_SETTINGS = '''SELECT max_messages, keep_pinned FROM channel_settings
+					 WHERE server_id = ? AND channel_id = ?'''
+UPSERT_SETTINGS = '''INSERT OR REPLACE INTO channel_settings (server_id, channel_id, max_messages, keep_pinned)
+					 VALUES (?, ?, ?, ?)'''
+
+class StallMonitor:
+	"""Measure how far past its deadline the event loop wakes a 1ms ticker"""
+
+	def __init__(self):
+		self.max_stall = 0.0
+		self.total_stall = 0.0
+		self.ticks = 0
+		self._running = True
+
+	async def run(self):
+		loop = asyncio.get_running_loop()
+		while self._running:
+			expected = loop.time() + TICK_INTERVAL
+			await asyncio.sleep(TICK_INTERVAL)
+			stall = max(0.0, loop.time() - expected)
+			self.max_stall = max(self.max_stall, stall)
+			self.total_stall += stall
+			self.ticks += 1
+
+	def stop(self):
+		self._running = False
+
+def legacy_lookup(db_path, server_id, channel_id):
+	conn = sqlite3.connect(db_path)
+	c = conn.cursor()
+	c.execute(SELECT_SETTINGS, (server_id, channel_id))
+	result = c.fetchone()
+	conn.close()
+	return result
+
+def legacy_save(db_path, server_id, channel_id, max_messages):
+	conn = sqlite3.connect(db_path)
+	c = conn.cursor()
+	c.execute(UPSERT_SETTINGS, (server_id, channel_id, max_messages, True))
+	conn.commit()
+	conn.close()
+
+async def legacy_op(db_path, i):
+	server_id, channel_id = str(i % 50), str(i % 500)
+	if i % 10 == 0:
+		legacy_save(db_path, server_id, channel_id, i)
+	else:
+		legacy_lookup(db_path, server_id, channel_id)
+
+async def pooled_op(db, i):
+	server_id, channel_id = str(i % 50), str(i % 500)
+	if i % 10 == 0:
+		await db.execute(UPSERT_SETTINGS, (server_id, channel_id, i, True))
+	else:
+		await db.fetchone(SELECT_SETTINGS, (server_id, channel_id))
+
+async def drive(op, target, ops, concurrency):
+	monitor = StallMonitor()
+	monitor_task = asyncio.create_task(monitor.run())
+	semaphore = asyncio.Semaphore(concurrency)
+
+	async def one(i):
+		async with semaphore:
+			await op(target, i)
+
+	start = time.perf_counter()
+	await asyncio.gather(*(one(i) for i in range(ops)))
+	elapsed = time.perf_counter() - start
+	monitor.stop()
+	await monitor_task
+	return elapsed, monitor
+
+def report(name, ops, elapsed, monitor):
+	print(
+		f"{name:<8} {ops / elapsed:>10.0f} ops/s   "
+		f"max stall {monitor.max_stall * 1000:>8.2f} ms   "
+		f"total stall {monitor.total_stall * 1000:>9.1f} ms   "
+		f"ticks {monitor.ticks}"
+	)
+
+async def main(ops, concurrency):
+	with tempfile.TemporaryDirectory() as tmp:
+		db_path = os.path.join(tmp, "bench.db")
+		db = Database(db_path)
+		db.initialize()
+		try:
+			elapsed, monitor = await drive(legacy_op, db_path, ops, concurrency)
+			report("legacy", ops, elapsed, monitor)
+			elapsed, monitor = await drive(pooled_op, db, ops, concurrency)
+			report("pooled", ops, elapsed, monitor)
+		finally:
+			db.close()
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--ops", type=int, default=2000)
+	parser.add_argument("--concurrency", type=int, default=32)
+	args = parser.parse_args()
+	asyncio.run(main(args.ops, args.concurrency))
@@ -0,0 +1,200 @@
+"""In-process stand-ins for the discord.py objects the trim path touches.
+
+FakeTextChannel keeps its messages in snowflake order and implements the
+parts of discord.py's TextChannel that ServerMaid uses: history() with
+before/after/oldest_first, delete_messages(), get_partial_message() and
+pins(). Every simulated REST call is counted in an ApiCalls, and can
+optionally sleep to model request latency.
+
+Like the real endpoints, bulk delete refuses more than 100 messages or
+messages older than 14 days, and history is served in pages of 100. Failed
+calls raise discord.py's own HTTPException and NotFound, so callers take the
+same error branches as against Discord.
+"""
+import asyncio
+import datetime
+import http
+from bisect import bisect_left, bisect_right
+
+DISCORD_EPOCH = 1420070400000  # Milliseconds
+HISTORY_PAGE_SIZE = 100
+PINS_PAGE_SIZE = 50
+BULK_DELETE_LIMIT = 100
+BULK_DELETE_MAX_AGE = datetime.timedelta(days=14)
+
+def snowflake(when: datetime.datetime, sequence: int = 0) -> int:
+	ms = int(when.timestamp() * 1000) - DISCORD_EPOCH
+	return (ms << 22) | (sequence & 0x3FFFFF)
+
+def snowflake_time(message_id: int) -> datetime.datetime:
+	return datetime.datetime.fromtimestamp(((message_id >> 22) + DISCORD_EPOCH) / 1000, datetime.timezone.utc)
+
+def utcnow() -> datetime.datetime:
+	return datetime.datetime.now(datetime.timezone.utc)
+
+class _Response:
+	"""The parts of an aiohttp response that discord.HTTPException reads"""
+
+	def __init__(self, status: int):
+		self.status = status
+		self.reason = http.HTTPStatus(status).phrase
+
+def http_error(status: int, code: int, text: str) -> Exception:
+	"""The discord.py exception Discord's error response would turn into"""
+	# Imported here so cold_start.py can build its fixture before discord.py is timed
+	import discord
+	error = discord.NotFound if status == 404 else discord.HTTPException
+	return error(_Response(status), {"code": code, "message": text})
+
+class ApiCalls:
+	"""REST calls made against fake channels"""
+
+	def __init__(self, latency: float = 0.0):
+		self.latency = latency
+		self.history_pages = 0
+		self.bulk_deletes = 0
+		self.single_deletes = 0
+		self.pins = 0
+		self.errors = 0
+
+	async def call(self, kind: str):
+		setattr(self, kind, getattr(self, kind) + 1)
+		if self.latency:
+			await asyncio.sleep(self.latency)
+
+	def total(self) -> int:
+		return self.history_pages + self.bulk_deletes + self.single_deletes + self.pins
+
+class FakeGuild:
+	def __init__(self, guild_id: int, name: str):
+		self.id = guild_id
+		self.name = name
+
+class FakeUser:
+	def __init__(self, user_id: int, name: str = "user"):
+		self.id = user_id
+		self.name = name
+
+	def __eq__(self, other):
+		return isinstance(other, FakeUser) and other.id == self.id
+
+	def __hash__(self):
+		return hash(self.id)
+
+class FakePartialMessage:
+	__slots__ = ("id", "channel")
+
+	def __init__(self, channel, message_id: int):
+		self.channel = channel
+		self.id = message_id
+
+	@property
+	def created_at(self) -> datetime.datetime:
+		return snowflake_time(self.id)
+
+	@property
+	def guild(self):
+		return self.channel.guild
+
+	async def delete(self):
+		await self.channel._delete_one(self.id)
+
+class FakeMessage(FakePartialMessage):
+	__slots__ = ("pinned", "author")
+
+	def __init__(self, channel, message_id: int, pinned: bool = False, author: FakeUser | None = None):
+		super().__init__(channel, message_id)
+		self.pinned = pinned
+		self.author = author
+
+class FakeTextChannel:
+	def __init__(self, guild: FakeGuild, channel_id: int, name: str, api: ApiCalls):
+		self.guild = guild
+		self.id = channel_id
+		self.name = name
+		self.api = api
+		self._ids = []  # Sorted message IDs
+		self._messages = {}
+		self._sequence = 0
+
+	def __len__(self) -> int:
+		return len(self._ids)
+
+	def post(self, pinned: bool = False, author: FakeUser | None = None, when: datetime.datetime | None = None) -> FakeMessage:
+		"""Add a message (without any API call) and return it.
+
+		Messages must be posted in time order, as they would arrive.
+		"""
+		self._sequence += 1
+		message = FakeMessage(self, snowflake(when or utcnow(), self._sequence), pinned, author)
+		if self._ids and message.id <= self._ids[-1]:
+			raise ValueError("messages must be posted in time order")
+		self._ids.append(message.id)
+		self._messages[message.id] = message
+		return message
+
+	def count(self, keep_pinned: bool = False) -> int:
+		if not keep_pinned:
+			return len(self._ids)
+		return sum(not self._messages[i].pinned for i in self._ids)
+
+	def get_partial_message(self, message_id: int) -> FakePartialMessage:
+		return FakePartialMessage(self, message_id)
+
+	async def history(self, limit: int | None = 100, before=None, after=None, oldest_first: bool | None = None):
+		"""Messages in the window, newest first unless after is given or oldest_first is set"""
+		before_id = getattr(before, "id", before)
+		after_id = getattr(after, "id", after)
+		if oldest_first is None:
+			oldest_first = after_id is not None
+		lo = bisect_right(self._ids, after_id) if after_id is not None else 0
+		hi = bisect_left(self._ids, before_id) if before_id is not None else len(self._ids)
+		ids = self._ids[lo:hi] if oldest_first else self._ids[lo:hi][::-1]
+		if limit is not None:
+			ids = ids[:limit]
+		for start in range(0, len(ids), HISTORY_PAGE_SIZE):
+			await self.api.call("history_pages")
+			for message_id in ids[start:start + HISTORY_PAGE_SIZE]:
+				message = self._messages.get(message_id)
+				if message is not None:  # Deleted while the page was being read
+					yield message
+		if not ids:
+			await self.api.call("history_pages")
+
+	async def pins(self, limit: int | None = 50):
+		"""Pinned messages, newest first, in pages of 50 like the real endpoint"""
+		pinned = [self._messages[i] for i in reversed(self._ids) if self._messages[i].pinned]
+		if limit is not None:
+			pinned = pinned[:limit]
+		for start in range(0, max(len(pinned), 1), PINS_PAGE_SIZE):
+			await self.api.call("pins")
+			for message in pinned[start:start + PINS_PAGE_SIZE]:
+				yield message
+
+	async def delete_messages(self, messages):
+		messages = list(messages)
+		if not messages:
+			return
+		if len(messages) == 1:
+			await self._delete_one(messages[0].id)
+			return
+		if len(messages) > BULK_DELETE_LIMIT:
+			raise ValueError(f"Can only bulk delete messages up to {BULK_DELETE_LIMIT} messages")
+		await self.api.call("bulk_deletes")
+		cutoff = utcnow() - BULK_DELETE_MAX_AGE
+		if any(snowflake_time(msg.id) < cutoff for msg in messages):
+			self.api.errors += 1
+			raise http_error(400, 50034, "You can only bulk delete messages that are under 14 days old.")
+		self._remove({msg.id for msg in messages})
+
+	async def _delete_one(self, message_id: int):
+		await self.api.call("single_deletes")
+		if message_id not in self._messages:
+			self.api.errors += 1
+			raise http_error(404, 10008, "Unknown Message")
+		self._remove({message_id})
+
+	def _remove(self, message_ids: set):
+		for message_id in message_ids:
+			self._messages.pop(message_id, None)
+		self._ids = [i for i in self._ids if i not in message_ids]
@@ -0,0 +1,187 @@
+"""Resident memory per 1k guilds for each gateway profile (gateway_profile.py).
+
+Each profile runs in a fresh interpreter. A discord.py client with the
+profile's options is fed synthetic gateway traffic through its own
+parsers, the same code the real gateway drives. There is no network
+connection and no token. For every guild the client gets a GUILD_CREATE
+(channels, roles, emojis, the bot's member, and voice states if that
+intent is on), then a stream of MESSAGE_CREATE events. It also gets
+TYPING_START and MESSAGE_REACTION_ADD events when those intents are on.
+Event types the profile's intents exclude are never sent, just as Discord
+wouldn't send them. Message content is blanked without the
+message_content intent.
+
+Reports the RSS growth scaled to 1k guilds, what the client ended up
+caching, and the gateway payload bytes each profile would receive.
+
+Usage: python benchmarks/gateway_memory.py [--guilds 2000] [--messages 50]
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BOT_ID = 1
+FIRST_GUILD_ID = 10 ** 17
+
+def rss_bytes() -> int:
+	with open("/proc/self/status", encoding="ascii") as f:
+		for line in f:
+			if line.startswith("VmRSS:"):
+				return int(line.split()[1]) * 1024
+	raise RuntimeError("VmRSS not found in /proc/self/status")
+
+def user_payload(user_id: int) -> dict:
+	return {"id": str(user_id), "username": f"user{user_id}", "discriminator": "0", "global_name": None, "avatar": None}
+
+def member_payload(user_id: int) -> dict:
+	return {"user": user_payload(user_id), "roles": [], "joined_at": "2024-01-01T00:00:00+00:00", "deaf": False, "mute": False,
+			"flags": 0}
+
+def guild_create(guild_id: int, args, intents) -> dict:
+	channels = [
+		{"id": str(guild_id + 1 + c), "type": 0, "name": f"channel-{c}", "position": c, "guild_id": str(guild_id),
+		 "permission_overwrites": [], "nsfw": False, "topic": "A channel topic long enough to be realistic"}
+		for c in range(args.channels)
+	]
+	voice_channel_id = str(guild_id + 1 + args.channels)
+	channels.append({"id": voice_channel_id, "type": 2, "name": "voice", "position": args.channels,
+					 "guild_id": str(guild_id), "permission_overwrites": [], "bitrate": 64000, "user_limit": 0})
+	members = [member_payload(BOT_ID)]
+	voice_states = []
+	if intents.voice_states:
+		for v in range(args.voice):
+			user_id = 1000 + v
+			members.append(member_payload(user_id))
+			voice_states.append({"user_id": str(user_id), "channel_id": voice_channel_id, "session_id": "x",
+								 "deaf": False, "mute": False, "self_deaf": False, "self_mute": False,
+								 "self_video": False, "suppress": False, "request_to_speak_timestamp": None})
+	return {
+		"id": str(guild_id), "name": f"Guild {guild_id}", "icon": None, "owner_id": "2", "region": "us-east",
+		"afk_channel_id": None, "afk_timeout": 300, "verification_level": 1, "default_message_notifications": 1,
+		"explicit_content_filter": 2, "mfa_level": 0, "features": ["COMMUNITY", "NEWS"], "premium_tier": 1,
+		"preferred_locale": "en-US", "system_channel_flags": 0, "nsfw_level": 0, "large": args.members > 250,
+		"member_count": args.members, "unavailable": False,
+		"roles": [
+			{"id": str(guild_id if r == 0 else guild_id + 500 + r), "name": "@everyone" if r == 0 else f"role-{r}",
+			 "permissions": "1071698660929", "position": r, "color": 0, "hoist": False, "managed": False,
+			 "mentionable": False}
+			for r in range(args.roles)
+		],
+		"emojis": [
+			{"id": str(guild_id + 900 + e), "name": f"emoji{e}", "roles": [], "require_colons": True, "managed": False,
+			 "animated": False, "available": True}
+			for e in range(args.emojis)
+		],
+		"stickers": [], "threads": [], "stage_instances": [], "guild_scheduled_events": [],
+		"channels": channels, "members": members, "voice_states": voice_states, "presences": [],
+	}
+
+def message_create(guild_id: int, channel_id: int, message_id: int, author_id: int, intents) -> dict:
+	return {
+		"id": str(message_id), "channel_id": str(channel_id), "guild_id": str(guild_id),
+		"author": user_payload(author_id), "member": {"roles": [], "joined_at": "2024-01-01T00:00:00+00:00",
+													  "deaf": False, "mute": False, "flags": 0},
+		"content": "Some ordinary chat message of a fairly typical length, nothing special." if intents.message_content else "",
+		"timestamp": "2026-01-01T00:00:00+00:00", "edited_timestamp": None, "tts": False, "mention_everyone": False,
+		"mentions": [], "mention_roles": [], "attachments": [], "embeds": [], "pinned": False, "type": 0, "flags": 0,
+	}
+
+def child(profile: str, args):
+	"""Measure one profile and print the results as JSON"""
+	import discord
+	import gateway_profile
+
+	options = gateway_profile.client_options(profile)
+	intents = options["intents"]
+	results = {}
+
+	async def run():
+		client = discord.Client(**options)
+		state = client._connection
+		state.user = discord.ClientUser(state=state, data={**user_payload(BOT_ID), "bot": True})
+		gc.collect()
+		before = rss_bytes()
+		gateway_bytes = 0
+		message_id = 10 ** 18
+		for g in range(args.guilds):
+			guild_id = FIRST_GUILD_ID + g * 10000
+			payload = guild_create(guild_id, args, intents)
+			gateway_bytes += len(json.dumps(payload))
+			state.parse_guild_create(payload)
+			for m in range(args.messages):
+				message_id += 1
+				channel_id = guild_id + 1 + m % args.channels
+				author_id = 2000 + m % 50
+				payload = message_create(guild_id, channel_id, message_id, author_id, intents)
+				gateway_bytes += len(json.dumps(payload))
+				state.parse_message_create(payload)
+				if intents.typing:
+					payload = {"channel_id": str(channel_id), "guild_id": str(guild_id), "user_id": str(author_id),
+							   "timestamp": 1700000000, "member": member_payload(author_id)}
+					gateway_bytes += len(json.dumps(payload))
+					state.parse_typing_start(payload)
+				if intents.reactions and m % 4 == 0:
+					payload = {"user_id": str(author_id), "channel_id": str(channel_id), "message_id": str(message_id),
+							   "guild_id": str(guild_id), "emoji": {"id": None, "name": "👍"}, "type": 0,
+							   "burst": False, "member": member_payload(author_id)}
+					gateway_bytes += len(json.dumps(payload))
+					state.parse_message_reaction_add(payload)
+		gc.collect()
+		results.update({
+			"profile": profile,
+			"intents": intents.value,
+			"rss_per_1k_guilds": (rss_bytes() - before) / args.guilds * 1000,
+			"gateway_bytes_per_1k_guilds": gateway_bytes / args.guilds * 1000,
+			"cached_messages": len(client.cached_messages),
+			"cached_members": sum(len(guild.members) for guild in client.guilds),
+			"guilds": len(client.guilds),
+		})
+		await client.close()
+
+	asyncio.run(run())
+	print(json.dumps(results))
+
+def main(args) -> int:
+	rows = []
+	for profile in args.profiles:
+		result = subprocess.run(
+			[sys.executable, os.path.abspath(__file__), "--child", profile] + child_arguments(args),
+			check=True, capture_output=True, text=True
+		)
+		rows.append(json.loads(result.stdout.strip().splitlines()[-1]))
+
+	print(f"{args.guilds} guilds, {args.channels} channels, {args.roles} roles, {args.emojis} emojis, "
+		  f"{args.voice} in voice, {args.messages} messages each")
+	print(f"  {'profile':<8} {'RSS / 1k guilds':>16} {'gateway / 1k guilds':>20} {'cached msgs':>12} {'cached members':>15}")
+	for row in rows:
+		print(f"  {row['profile']:<8} {row['rss_per_1k_guilds'] / 1024 / 1024:>13.1f} MB "
+			  f"{row['gateway_bytes_per_1k_guilds'] / 1024 / 1024:>17.1f} MB {row['cached_messages']:>12} "
+			  f"{row['cached_members']:>15}")
+	return 0
+
+def child_arguments(args) -> list[str]:
+	return [f"--guilds={args.guilds}", f"--channels={args.channels}", f"--roles={args.roles}", f"--emojis={args.emojis}",
+			f"--voice={args.voice}", f"--members={args.members}", f"--messages={args.messages}"]
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--guilds", type=int, default=2000)
+	parser.add_argument("--channels", type=int, default=15, help="text channels per guild")
+	parser.add_argument("--roles", type=int, default=10, help="roles per guild, including @everyone")
+	parser.add_argument("--emojis", type=int, default=20, help="custom emojis per guild")
+	parser.add_argument("--voice", type=int, default=3, help="members in voice per guild")
+	parser.add_argument("--members", type=int, default=500, help="member_count reported per guild")
+	parser.add_argument("--messages", type=int, default=50, help="messages received per guild")
+	parser.add_argument("--profiles", nargs="+", default=["full", "lean"])
+	parser.add_argument("--child", metavar="PROFILE", help=argparse.SUPPRESS)
+	args = parser.parse_args()
+	if args.child:
+		child(args.child, args)
+	else:
+		sys.exit(main(args))
@@ -0,0 +1,112 @@
+"""Deletion load test against the local Discord REST stand-in.
+
+Starts rest_standin.RestStandIn, points discord.py at it and trims a set
+of over-limit channels through ServerMaid's own code: the trim scheduler,
+trim_channel, run_deletion_job and delete_messages_safely. Requests go
+through discord.py's HTTP client, and the response headers reach
+ServerMaid's RateLimiter through the same trace hook as in production. So
+429s exercise both discord.py's retries and ServerMaid's backoff and retry
+branches.
+
+Needs discord.py and aiohttp (the bot's own requirements) but no token or
+network access. Reports deletion throughput, requests and 429s per route
+and scope, the rate limiter's waits and backoffs, and whether every
+channel ended within its limit. --timeline writes every request as JSON
+lines.
+
+Usage: python benchmarks/rate_limit_load.py [--channels 8] [--messages 1500] [--limit delete=3/5] [--shared-429 0.02]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import discord
+
+import ServerMaid
+from rest_standin import RestStandIn, add_standin_arguments
+
+GUILD_ID = 1000
+FIRST_CHANNEL_ID = 10 ** 6
+
+async def run(args) -> int:
+	standin = RestStandIn(dict(args.limit), args.global_limit, args.shared_429, args.latency)
+	for i in range(args.channels):
+		standin.add_channel(FIRST_CHANNEL_ID + i, GUILD_ID, args.messages, args.pinned, args.old)
+	await standin.start()
+	discord.http.Route.BASE = f"{standin.url}/api/v10"
+
+	bot = ServerMaid.bot
+	with tempfile.TemporaryDirectory() as tmp:
+		ServerMaid.db.path = os.path.join(tmp, "load.db")
+		ServerMaid.db.initialize()
+		await bot.http.static_login("stand-in-token")
+
+		state = bot._connection
+		guild = discord.Guild(data={"id": str(GUILD_ID), "name": "stand-in"}, state=state)
+		channels = [
+			discord.TextChannel(state=state, guild=guild, data={
+				"id": str(channel_id), "name": f"channel-{channel_id}", "type": 0, "position": 0, "guild_id": str(GUILD_ID)
+			})
+			for channel_id in standin.channels
+		]
+		for channel in channels:
+			ServerMaid.channel_settings_store.set(str(GUILD_ID), str(channel.id), (args.max_messages, True))
+
+		scheduler = ServerMaid.trim_scheduler
+		scheduler.debounce = 0
+		scheduler.start()
+		start = time.perf_counter()
+		for channel in channels:
+			scheduler.mark_dirty(str(channel.id), channel)
+		deadline = start + args.timeout
+		while time.perf_counter() < deadline:
+			stats = scheduler.stats()
+			if not (stats["pending"] or stats["running"] or stats["queued"]):
+				break
+			await asyncio.sleep(0.1)
+		elapsed = time.perf_counter() - start
+		await scheduler.stop()
+		await bot.http.close()
+		ServerMaid.db.close()
+	await standin.stop()
+
+	deleted = args.channels * args.messages - sum(len(channel.ids) for channel in standin.channels.values())
+	over_limit = [c for c in standin.channels.values() if len(c.ids) - len(c.pinned) > args.max_messages]
+	summary = standin.summary()
+	limiter = ServerMaid.rate_limiter.stats()
+	print(f"{args.channels} channels x {args.messages} messages ({args.old:.0%} older than 14 days), "
+		  f"limit {args.max_messages}, global {args.global_limit}/s, shared 429 rate {args.shared_429:.0%}")
+	print(f"  deleted            {deleted} in {elapsed:.1f}s ({deleted / elapsed:,.1f}/s)")
+	for route, counts in sorted(summary["routes"].items()):
+		print(f"  {route:<52} {counts['requests']:>5} requests, {counts['ok']:>5} ok, "
+			  f"{counts['429']:>4} x 429, {counts['errors']:>3} errors")
+	print(f"  429s by scope      {summary['429_by_scope'] or 'none'}")
+	print(f"  rate limiter       {limiter['waits']} waits ({limiter['wait_seconds']:.1f}s), "
+		  f"{limiter['rate_limited'] - limiter['shared_rate_limited']} backoffs ({limiter['global_rate_limited']} global), "
+		  f"{limiter['shared_rate_limited']} shared 429s ignored")
+	print(f"  channels over limit {len(over_limit)}")
+	if args.timeline:
+		standin.write_timeline(args.timeline)
+		print(f"  timeline           {len(standin.timeline)} requests written to {args.timeline}")
+	return 0 if not over_limit else 1
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--channels", type=int, default=8)
+	parser.add_argument("--messages", type=int, default=1500, help="messages per channel")
+	parser.add_argument("--pinned", type=float, default=0.02, help="fraction of messages that are pinned")
+	parser.add_argument("--old", type=float, default=0.0, help="fraction of messages older than 14 days")
+	parser.add_argument("--max-messages", type=int, default=100, help="limit for every channel")
+	parser.add_argument("--timeout", type=float, default=300, help="seconds to wait for trims to finish")
+	parser.add_argument("--verbose", action="store_true", help="show ServerMaid's info logging")
+	add_standin_arguments(parser)
+	args = parser.parse_args()
+	if not args.verbose:
+		logging.getLogger().setLevel(logging.WARNING)
+	sys.exit(asyncio.run(run(args)))
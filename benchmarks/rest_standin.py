@@ -0,0 +1,332 @@
+"""A local stand-in for the Discord REST endpoints the trim path uses.
+
+Serves message history, bulk delete and single delete (plus /users/@me so
+discord.py can log in) from an in-memory message store. Rate limits are
+enforced like Discord's:
+
+  - a fixed-window bucket per (route, channel)
+  - one global bucket for every request
+  - optionally, random 429s with scope "shared", which no bucket predicts
+
+Responses carry the usual X-RateLimit-* headers. A 429 has the real JSON
+body ({"message", "retry_after", "global"}) and Retry-After,
+X-RateLimit-Scope and Via headers. discord.py only retries a 429 that
+came through Discord's proxy, which it recognises by the Via header.
+
+Every request is recorded in a timeline that can be written out as JSON
+lines. Point discord.py at the stand-in with
+discord.http.Route.BASE = standin.url + "/api/v10".
+
+Run it on its own with:
+  python benchmarks/rest_standin.py [--port 8787] [--channels 4] [--messages 1000]
+or use RestStandIn from a load test (see rate_limit_load.py).
+"""
+import argparse
+import asyncio
+import datetime
+import hashlib
+import json
+import math
+import os
+import random
+import sys
+import time
+from bisect import bisect_left, bisect_right
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rate_limiter import route_key, ROUTE_BULK_DELETE, ROUTE_DELETE, ROUTE_HISTORY
+from fake_discord import snowflake, snowflake_time, utcnow, BULK_DELETE_MAX_AGE
+
+DEFAULT_LIMITS = {
+	ROUTE_HISTORY: (5, 5.0),
+	ROUTE_BULK_DELETE: (1, 1.0),
+	ROUTE_DELETE: (5, 5.0),
+}
+DEFAULT_GLOBAL_LIMIT = 50  # Requests per second
+ROUTE_NAMES = {"history": ROUTE_HISTORY, "bulk-delete": ROUTE_BULK_DELETE, "delete": ROUTE_DELETE}
+BOT_USER = {"id": "1", "username": "ServerMaid", "discriminator": "0", "global_name": None, "avatar": None, "bot": True}
+AUTHOR = {"id": "2", "username": "someone", "discriminator": "0", "global_name": None, "avatar": None}
+
+def _json_response(body, status: int, headers: dict) -> web.Response:
+	# Exactly "application/json" with no charset, as Discord sends it; discord.py checks for that
+	return web.Response(body=json.dumps(body).encode(), status=status,
+						headers={**headers, "Content-Type": "application/json"})
+
+class _Window:
+	__slots__ = ("limit", "window", "remaining", "reset_at")
+
+	def __init__(self, limit: int, window: float):
+		self.limit = limit
+		self.window = window
+		self.remaining = limit
+		self.reset_at = 0.0
+
+	def take(self, now: float) -> bool:
+		if now >= self.reset_at:
+			self.remaining = self.limit
+			self.reset_at = now + self.window
+		if self.remaining <= 0:
+			return False
+		self.remaining -= 1
+		return True
+
+class _Channel:
+	def __init__(self, channel_id: int, guild_id: int):
+		self.id = channel_id
+		self.guild_id = guild_id
+		self.ids = []
+		self.pinned = set()
+		self.sequence = 0
+
+	def post(self, when: datetime.datetime, pinned: bool = False) -> int:
+		self.sequence += 1
+		message_id = snowflake(when, self.sequence)
+		if self.ids and message_id <= self.ids[-1]:
+			raise ValueError("messages must be posted in time order")
+		self.ids.append(message_id)
+		if pinned:
+			self.pinned.add(message_id)
+		return message_id
+
+	def remove(self, message_ids: set):
+		self.ids = [i for i in self.ids if i not in message_ids]
+		self.pinned -= message_ids
+
+class RestStandIn:
+	def __init__(self, limits: dict | None = None, global_limit: int = DEFAULT_GLOBAL_LIMIT,
+				 shared_429_rate: float = 0.0, latency: float = 0.0, seed: int = 1):
+		"""limits maps route templates to (limit, window seconds)"""
+		self.limits = {**DEFAULT_LIMITS, **(limits or {})}
+		self.global_bucket = _Window(global_limit, 1.0)
+		self.shared_429_rate = shared_429_rate
+		self.latency = latency
+		self.channels = {}
+		self.timeline = []
+		self._buckets = {}
+		self._random = random.Random(seed)
+		self._runner = None
+		self.url = None
+		self.started_at = time.monotonic()
+
+	def add_channel(self, channel_id: int, guild_id: int, messages: int = 0, pinned: float = 0.0,
+					old: float = 0.0) -> _Channel:
+		"""Create a channel holding messages, a fraction of them pinned or older than 14 days"""
+		channel = self.channels[channel_id] = _Channel(channel_id, guild_id)
+		now = utcnow()
+		old_count = round(messages * old)
+		for i in range(messages):
+			base = now - datetime.timedelta(days=30) if i < old_count else now - datetime.timedelta(hours=1)
+			channel.post(base + datetime.timedelta(milliseconds=i), self._random.random() < pinned)
+		return channel
+
+	async def start(self, host: str = "127.0.0.1", port: int = 0):
+		app = web.Application()
+		app.router.add_route("*", "/api/v{version}/{tail:.*}", self._handle)
+		self._runner = web.AppRunner(app, access_log=None)
+		await self._runner.setup()
+		site = web.TCPSite(self._runner, host, port)
+		await site.start()
+		port = self._runner.addresses[0][1]
+		self.url = f"http://{host}:{port}"
+		self.started_at = time.monotonic()
+
+	async def stop(self):
+		if self._runner is not None:
+			await self._runner.cleanup()
+			self._runner = None
+
+	def _bucket(self, route: str, major) -> _Window:
+		key = (route, major)
+		bucket = self._buckets.get(key)
+		if bucket is None:
+			limit, window = self.limits.get(route, (5, 5.0))
+			bucket = self._buckets[key] = _Window(limit, window)
+		return bucket
+
+	def _record(self, now, method, route, major, status, bucket=None, retry_after=None, scope=None):
+		self.timeline.append({
+			"t": round(now - self.started_at, 4),
+			"method": method,
+			"route": route,
+			"major": major,
+			"status": status,
+			"remaining": bucket.remaining if bucket is not None else None,
+			"retry_after": round(retry_after, 3) if retry_after is not None else None,
+			"scope": scope,
+		})
+
+	async def _handle(self, request: web.Request) -> web.Response:
+		if self.latency:
+			await asyncio.sleep(self.latency)
+		route, major = route_key(request.method, request.path)
+		now = time.monotonic()
+
+		if not self.global_bucket.take(now):
+			retry_after = self.global_bucket.reset_at - now
+			self._record(now, request.method, route, major, 429, retry_after=retry_after, scope="global")
+			return self._too_many(retry_after, is_global=True, headers={"X-RateLimit-Global": "true"})
+
+		bucket = self._bucket(route, major)
+		bucket_hash = hashlib.sha1(route.encode()).hexdigest()[:16]
+		if not bucket.take(now):
+			retry_after = bucket.reset_at - now
+			self._record(now, request.method, route, major, 429, bucket, retry_after, "user")
+			return self._too_many(retry_after, headers=self._bucket_headers(bucket, bucket_hash, now))
+		if self.shared_429_rate and self._random.random() < self.shared_429_rate:
+			retry_after = self._random.uniform(0.5, 3.0)
+			self._record(now, request.method, route, major, 429, bucket, retry_after, "shared")
+			return self._too_many(retry_after, scope="shared", headers=self._bucket_headers(bucket, bucket_hash, now))
+
+		status, body = await self._dispatch(request, route, major)
+		self._record(now, request.method, route, major, status, bucket)
+		headers = self._bucket_headers(bucket, bucket_hash, now)
+		if status == 204:
+			return web.Response(status=204, headers=headers)
+		return _json_response(body, status, headers)
+
+	def _bucket_headers(self, bucket: _Window, bucket_hash: str, now: float) -> dict:
+		reset_after = max(0.0, bucket.reset_at - now)
+		return {
+			"X-RateLimit-Limit": str(bucket.limit),
+			"X-RateLimit-Remaining": str(bucket.remaining),
+			"X-RateLimit-Reset": f"{time.time() + reset_after:.3f}",
+			"X-RateLimit-Reset-After": f"{reset_after:.3f}",
+			"X-RateLimit-Bucket": bucket_hash,
+		}
+
+	def _too_many(self, retry_after: float, is_global: bool = False, scope: str = "user", headers=None) -> web.Response:
+		return _json_response(
+			{"message": "You are being rate limited.", "retry_after": round(retry_after, 3), "global": is_global},
+			429,
+			{
+				**(headers or {}),
+				"Retry-After": str(math.ceil(retry_after)),
+				"X-RateLimit-Scope": "global" if is_global else scope,
+				"Via": "1.1 google",
+			}
+		)
+
+	async def _dispatch(self, request: web.Request, route: str, major) -> tuple[int, object]:
+		if route == "GET /users/@me":
+			return 200, BOT_USER
+		channel = self.channels.get(major)
+		if channel is None:
+			return 404, {"message": "Unknown Channel", "code": 10003}
+		if route == ROUTE_HISTORY:
+			return 200, self._history(channel, request.query)
+		if route == ROUTE_BULK_DELETE:
+			return self._bulk_delete(channel, await request.json())
+		if route == ROUTE_DELETE:
+			message_id = int(request.path.rsplit("/", 1)[1])
+			i = bisect_left(channel.ids, message_id)
+			if i == len(channel.ids) or channel.ids[i] != message_id:
+				return 404, {"message": "Unknown Message", "code": 10008}
+			channel.remove({message_id})
+			return 204, None
+		return 404, {"message": "404: Not Found", "code": 0}
+
+	def _history(self, channel: _Channel, query) -> list[dict]:
+		"""Like Discord: up to limit messages, newest first; with after, the oldest ones after it"""
+		limit = min(int(query.get("limit", 50)), 100)
+		lo = bisect_right(channel.ids, int(query["after"])) if "after" in query else 0
+		hi = bisect_left(channel.ids, int(query["before"])) if "before" in query else len(channel.ids)
+		ids = channel.ids[lo:min(hi, lo + limit)] if "after" in query else channel.ids[max(lo, hi - limit):hi]
+		return [self._message_payload(channel, message_id) for message_id in reversed(ids)]
+
+	def _bulk_delete(self, channel: _Channel, body) -> tuple[int, object]:
+		message_ids = [int(i) for i in body.get("messages", [])]
+		if not 2 <= len(message_ids) <= 100:
+			return 400, {"message": "Invalid Form Body", "code": 50035}
+		cutoff = utcnow() - BULK_DELETE_MAX_AGE
+		if any(snowflake_time(i) < cutoff for i in message_ids):
+			return 400, {"message": "You can only bulk delete messages that are under 14 days old.", "code": 50034}
+		channel.remove(set(message_ids))
+		return 204, None
+
+	def _message_payload(self, channel: _Channel, message_id: int) -> dict:
+		return {
+			"id": str(message_id),
+			"channel_id": str(channel.id),
+			"guild_id": str(channel.guild_id),
+			"author": AUTHOR,
+			"content": "",
+			"timestamp": snowflake_time(message_id).isoformat(),
+			"edited_timestamp": None,
+			"tts": False,
+			"mention_everyone": False,
+			"mentions": [],
+			"mention_roles": [],
+			"attachments": [],
+			"embeds": [],
+			"pinned": message_id in channel.pinned,
+			"type": 0,
+			"flags": 0,
+		}
+
+	def summary(self) -> dict:
+		"""Requests and 429s per route, plus 429s by scope"""
+		routes = {}
+		scopes = {}
+		for entry in self.timeline:
+			counts = routes.setdefault(entry["route"], {"requests": 0, "ok": 0, "429": 0, "errors": 0})
+			counts["requests"] += 1
+			if entry["status"] == 429:
+				counts["429"] += 1
+				scopes[entry["scope"]] = scopes.get(entry["scope"], 0) + 1
+			elif entry["status"] < 300:
+				counts["ok"] += 1
+			else:
+				counts["errors"] += 1
+		return {"routes": routes, "429_by_scope": scopes}
+
+	def write_timeline(self, path: str):
+		with open(path, "w", encoding="utf-8") as f:
+			for entry in self.timeline:
+				f.write(json.dumps(entry) + "\n")
+
+def parse_limit(value: str) -> tuple[str, tuple[int, float]]:
+	"""Parse NAME=LIMIT/WINDOW, e.g. bulk-delete=1/1 or delete=5/5"""
+	name, _, rule = value.partition("=")
+	limit, _, window = rule.partition("/")
+	if name not in ROUTE_NAMES or not limit or not window:
+		raise argparse.ArgumentTypeError(f"expected one of {', '.join(ROUTE_NAMES)} as NAME=LIMIT/WINDOW")
+	return ROUTE_NAMES[name], (int(limit), float(window))
+
+def add_standin_arguments(parser: argparse.ArgumentParser):
+	parser.add_argument("--limit", type=parse_limit, action="append", default=[], metavar="NAME=LIMIT/WINDOW",
+						help="route bucket, NAME one of history, bulk-delete, delete (repeatable)")
+	parser.add_argument("--global-limit", type=int, default=DEFAULT_GLOBAL_LIMIT, help="global requests per second")
+	parser.add_argument("--shared-429", type=float, default=0.0, help="chance of a shared-scope 429 per request")
+	parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+	parser.add_argument("--timeline", metavar="PATH", help="write the request timeline here as JSON lines")
+
+async def serve(args):
+	standin = RestStandIn(dict(args.limit), args.global_limit, args.shared_429, args.latency)
+	for i in range(args.channels):
+		standin.add_channel(10 ** 6 + i, 1000, args.messages, args.pinned, args.old)
+	await standin.start(args.host, args.port)
+	print(f"Discord REST stand-in on {standin.url}/api/v10, channels {', '.join(map(str, standin.channels))}")
+	try:
+		await asyncio.Event().wait()
+	finally:
+		await standin.stop()
+		print(json.dumps(standin.summary(), indent=1))
+		if args.timeline:
+			standin.write_timeline(args.timeline)
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--host", default="127.0.0.1")
+	parser.add_argument("--port", type=int, default=8787)
+	parser.add_argument("--channels", type=int, default=4)
+	parser.add_argument("--messages", type=int, default=1000, help="messages per channel")
+	parser.add_argument("--pinned", type=float, default=0.02, help="fraction of messages that are pinned")
+	parser.add_argument("--old", type=float, default=0.0, help="fraction of messages older than 14 days")
+	add_standin_arguments(parser)
+	try:
+		asyncio.run(serve(parser.parse_args()))
+	except KeyboardInterrupt:
+		pass
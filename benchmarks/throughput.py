@@ -0,0 +1,173 @@
+"""Offline throughput benchmark for the on_message -> delete path.
+
+Simulates guilds x channels of fake Discord channels (fake_discord.py) with
+a steady stream of new messages and a backlog of older ones. The messages
+go through ServerMaid itself: ServerMaid.on_message marks channels dirty,
+and its trim scheduler runs trim_channel. That seeds the channel index from
+history, plans a cutoff, persists a deletion job and runs it through the
+deletion pipeline with rate-limited bulk and single deletes. Only Discord
+is fake. ServerMaid's database points at a temporary file.
+
+When the stream stops, the benchmark waits for every trim to finish. It
+then reports:
+
+  messages/sec   on_message events handled and messages deleted
+  API calls      history pages, bulk deletes and single deletes
+  loop lag       worst and mean lag of a 50 ms ticker
+  peak memory    max RSS, plus the traced Python heap with --tracemalloc
+
+It also checks that every managed channel ended up within its limit.
+
+Usage: python benchmarks/throughput.py [--guilds 20] [--channels 5] [--rate 500] [--duration 10]
+"""
+import argparse
+import asyncio
+import datetime
+import logging
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ServerMaid
+from loop_lag import LoopLagMonitor
+from rate_limiter import RateLimiter
+from fake_discord import ApiCalls, FakeGuild, FakeTextChannel, FakeUser, utcnow
+
+LAG_INTERVAL = 0.05
+TICK = 0.01  # Seconds between bursts of generated messages
+
+def idle() -> bool:
+	stats = ServerMaid.trim_scheduler.stats()
+	return not (stats["pending"] or stats["running"] or stats["queued"])
+
+def counted(counter, *labels) -> float:
+	return sum(counter.labels(label).value for label in labels)
+
+def build_channels(args, api: ApiCalls, rng: random.Random):
+	"""Create the fake guilds and channels, with backlog already in place"""
+	channels = []
+	settings = {}
+	now = utcnow()
+	old_start = now - datetime.timedelta(days=30)
+	recent_start = now - datetime.timedelta(hours=1)
+	managed_per_guild = round(args.channels * args.managed)
+	for g in range(args.guilds):
+		guild = FakeGuild(1000 + g, f"guild-{g}")
+		for c in range(args.channels):
+			channel = FakeTextChannel(guild, 10 ** 6 + g * args.channels + c, f"channel-{c}", api)
+			old = round(args.backlog * args.old)
+			for i in range(args.backlog):
+				base = old_start if i < old else recent_start
+				channel.post(pinned=rng.random() < args.pinned, author=FakeUser(rng.randrange(1, 1000)),
+							 when=base + datetime.timedelta(milliseconds=i))
+			channels.append(channel)
+			if c < managed_per_guild:
+				settings[str(channel.id)] = (str(guild.id), (args.max_messages, True))
+	return channels, settings
+
+async def run(args):
+	rng = random.Random(args.seed)
+	api = ApiCalls(latency=args.latency)
+	channels, settings = build_channels(args, api, rng)
+	authors = [FakeUser(i) for i in range(1, 1000)]
+
+	with tempfile.TemporaryDirectory() as tmp:
+		ServerMaid.db.path = os.path.join(tmp, "bench.db")
+		ServerMaid.init_database()
+		for channel_id, (guild_id, limit) in settings.items():
+			ServerMaid.channel_settings_store.set(guild_id, channel_id, limit)
+		limiter = ServerMaid.rate_limiter = RateLimiter(global_limit=args.global_limit)
+		scheduler = ServerMaid.trim_scheduler
+		scheduler.workers = args.workers
+		scheduler.debounce = args.debounce
+		lag = LoopLagMonitor(interval=LAG_INTERVAL, window=1)
+		lag.start()
+		scheduler.start()
+		if args.tracemalloc:
+			tracemalloc.start()
+
+		handlers = set()
+		sent = 0
+		start = time.perf_counter()
+		while (elapsed := time.perf_counter() - start) < args.duration:
+			due = int(elapsed * args.rate) - sent
+			for _ in range(due):
+				channel = channels[rng.randrange(len(channels))]
+				message = channel.post(pinned=rng.random() < args.pinned, author=authors[rng.randrange(len(authors))])
+				# discord.py runs every event handler in its own task
+				task = asyncio.create_task(ServerMaid.on_message(message))
+				handlers.add(task)
+				task.add_done_callback(handlers.discard)
+			sent += max(due, 0)
+			await asyncio.sleep(TICK)
+		load_seconds = time.perf_counter() - start
+		await asyncio.gather(*handlers)
+
+		drain_deadline = time.perf_counter() + args.drain_timeout
+		while not idle() and time.perf_counter() < drain_deadline:
+			await asyncio.sleep(0.05)
+		total_seconds = time.perf_counter() - start
+		drained = idle()
+
+		traced_peak = tracemalloc.get_traced_memory()[1] if args.tracemalloc else None
+		await scheduler.stop()
+		lag.stop()
+		ServerMaid.db.close()
+
+	over_limit = [
+		channel for channel in channels
+		if str(channel.id) in settings and channel.count(keep_pinned=True) > args.max_messages
+	]
+	stats = scheduler.stats()
+	seen = counted(ServerMaid.MESSAGES_SEEN, "true", "false")
+	deleted = counted(ServerMaid.MESSAGES_DELETED, "bulk", "single")
+	failed = counted(ServerMaid.DELETE_FAILURES, "bulk", "single")
+	handler = ServerMaid.ON_MESSAGE_SECONDS.labels()
+	print(f"{args.guilds} guilds x {args.channels} channels ({len(settings)} managed), "
+		  f"{args.rate:.0f} msg/s for {args.duration:.0f}s, backlog {args.backlog}/channel "
+		  f"({args.old:.0%} older than 14 days), {args.pinned:.0%} pinned, API latency {args.latency * 1000:.0f} ms")
+	print(f"  messages handled   {seen:.0f} ({seen / load_seconds:,.0f}/s), "
+		  f"mean on_message {handler.sum / max(handler.count, 1) * 1e6:.1f} us (managed only)")
+	print(f"  messages deleted   {deleted:.0f} ({deleted / total_seconds:,.0f}/s), failed {failed:.0f}, "
+		  f"{'drained' if drained else 'NOT drained'} after {total_seconds:.1f}s")
+	print(f"  trim passes        {stats['passes']} ({stats['coalesced']} marks coalesced, "
+		  f"{stats['failures']} failed)")
+	print(f"  API calls          {api.total()}: {api.history_pages} history pages, {api.bulk_deletes} bulk deletes, "
+		  f"{api.single_deletes} single deletes, {api.pins} pins ({api.errors} errors)")
+	print(f"  rate limiter       {limiter.waits} waits, {limiter.wait_seconds:.1f}s waited")
+	print(f"  loop lag           max {lag.max_lag * 1000:.1f} ms, mean {lag.total_lag / max(lag.ticks, 1) * 1000:.2f} ms")
+	peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+	print(f"  peak memory        {peak_rss_mb:.1f} MB RSS"
+		  + (f", {traced_peak / 1024 / 1024:.1f} MB traced Python heap" if traced_peak is not None else ""))
+	print(f"  channels over limit {len(over_limit)}")
+	return 0 if drained and not over_limit else 1
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--guilds", type=int, default=20)
+	parser.add_argument("--channels", type=int, default=5, help="channels per guild")
+	parser.add_argument("--managed", type=float, default=0.6, help="fraction of each guild's channels that are managed")
+	parser.add_argument("--rate", type=float, default=500, help="new messages per second across all channels")
+	parser.add_argument("--duration", type=float, default=10, help="seconds of message traffic")
+	parser.add_argument("--pinned", type=float, default=0.02, help="fraction of messages that are pinned")
+	parser.add_argument("--backlog", type=int, default=300, help="messages already in each channel")
+	parser.add_argument("--old", type=float, default=0.0, help="fraction of the backlog older than 14 days")
+	parser.add_argument("--max-messages", type=int, default=100, help="limit for managed channels")
+	parser.add_argument("--latency", type=float, default=0.0, help="seconds each fake API call takes")
+	parser.add_argument("--global-limit", type=int, default=50, help="global REST requests per second")
+	parser.add_argument("--workers", type=int, default=4, help="trim workers")
+	parser.add_argument("--debounce", type=float, default=1.0, help="trim debounce in seconds")
+	parser.add_argument("--drain-timeout", type=float, default=120, help="seconds to wait for trims to finish")
+	parser.add_argument("--seed", type=int, default=1)
+	parser.add_argument("--tracemalloc", action="store_true", help="also trace the Python heap (slower)")
+	parser.add_argument("--verbose", action="store_true", help="show ServerMaid's info logging")
+	args = parser.parse_args()
+	if not args.verbose:
+		logging.getLogger().setLevel(logging.WARNING)
+	sys.exit(asyncio.run(run(args)))
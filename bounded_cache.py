@@ -0,0 +1,108 @@
+"""A size-bounded LRU cache with idle TTL and hit/miss/eviction counters.
+
+Entries expire after ttl seconds without being read or written. Every
+access moves an entry to the back of the LRU order and refreshes its
+expiry, so LRU order and expiry order are the same. That lets sweep()
+stop at the first live entry instead of scanning the whole cache.
+"""
+import time
+from collections import OrderedDict
+
+class _Entry:
+	__slots__ = ("value", "expires_at")
+
+	def __init__(self, value, expires_at: float):
+		self.value = value
+		self.expires_at = expires_at
+
+class BoundedCache:
+	def __init__(self, max_size: int, ttl: float | None = None, clock=time.monotonic):
+		self.max_size = max_size
+		self.ttl = ttl
+		self._clock = clock
+		self._entries = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self.expirations = 0
+
+	def __len__(self) -> int:
+		return len(self._entries)
+
+	def __contains__(self, key) -> bool:
+		return self.peek(key) is not None
+
+	def _expires_at(self, now: float) -> float:
+		return now + self.ttl if self.ttl is not None else float("inf")
+
+	def get(self, key, default=None):
+		"""Look up key, counting a hit or miss and refreshing its LRU position and expiry"""
+		entry = self._entries.get(key)
+		if entry is None:
+			self.misses += 1
+			return default
+		now = self._clock()
+		if entry.expires_at <= now:
+			del self._entries[key]
+			self.expirations += 1
+			self.misses += 1
+			return default
+		entry.expires_at = self._expires_at(now)
+		self._entries.move_to_end(key)
+		self.hits += 1
+		return entry.value
+
+	def peek(self, key, default=None):
+		"""Look up key without touching stats, LRU order or expiry"""
+		entry = self._entries.get(key)
+		if entry is None or entry.expires_at <= self._clock():
+			return default
+		return entry.value
+
+	def set(self, key, value):
+		now = self._clock()
+		entry = self._entries.get(key)
+		if entry is not None:
+			entry.value = value
+			entry.expires_at = self._expires_at(now)
+			self._entries.move_to_end(key)
+			return
+		self._entries[key] = _Entry(value, self._expires_at(now))
+		while len(self._entries) > self.max_size:
+			self._entries.popitem(last=False)
+			self.evictions += 1
+
+	def pop(self, key, default=None):
+		entry = self._entries.pop(key, None)
+		return default if entry is None else entry.value
+
+	def clear(self):
+		self._entries.clear()
+
+	def sweep(self) -> int:
+		"""Drop expired entries. Returns how many were removed."""
+		now = self._clock()
+		removed = 0
+		while self._entries:
+			key, entry = next(iter(self._entries.items()))
+			if entry.expires_at > now:
+				break
+			del self._entries[key]
+			removed += 1
+		self.expirations += removed
+		return removed
+
+	def values(self):
+		return [entry.value for entry in self._entries.values()]
+
+	def stats(self) -> dict:
+		lookups = self.hits + self.misses
+		return {
+			"size": len(self._entries),
+			"max_size": self.max_size,
+			"hits": self.hits,
+			"misses": self.misses,
+			"hit_rate": self.hits / lookups if lookups else 0.0,
+			"evictions": self.evictions,
+			"expirations": self.expirations,
+		}
@@ -0,0 +1,327 @@
+"""Run ServerMaid as several worker processes on one machine.
+
+A single process runs every shard on one event loop, so one core ends up
+doing all the work. The supervisor splits the shards into contiguous ranges
+and starts one ServerMaid.py worker per range. Each worker gets its shard ids
+and its own health port through the environment. Workers that exit are
+restarted with exponential backoff.
+
+Discord allows one IDENTIFY per 5 seconds per token (max_concurrency 1),
+and each worker only paces its own shards. So worker starts are staggered:
+a worker waits until every shard before its range has had its identify slot.
+
+The supervisor also serves the same health endpoints as a single bot, built
+from every worker's health server, so monitoring doesn't have to know how
+many workers there are.
+
+    python cluster.py --workers 3 --shards 6
+"""
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import sys
+import time
+
+import aiohttp
+from aiohttp import web
+
+import metrics
+from rate_budget import RateBudgetServer
+from invalidation_bus import InvalidationBusServer
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ServerMaid.py")
+DEFAULT_PORT = 5000  # Supervisor health server port
+DEFAULT_BASE_PORT = 5100  # Worker N listens on base port + N
+RESTART_BACKOFF_MIN = 1.0  # First restart delay in seconds
+RESTART_BACKOFF_MAX = 60.0  # Longest restart delay in seconds
+STABLE_UPTIME = 300.0  # A worker up this long gets its backoff reset
+WORKER_REQUEST_TIMEOUT = 3.0  # Timeout for scraping a worker's health server
+SHUTDOWN_GRACE = 10.0  # Seconds workers get to exit before being killed
+IDENTIFY_INTERVAL = 5.0  # Seconds Discord requires between IDENTIFYs for one token
+RATE_BUDGET_SOCKET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "servermaid-ratelimit.sock")
+INVALIDATION_BUS_SOCKET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "servermaid-invalidation.sock")
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s [cluster] %(levelname)s: %(message)s')
+
+def split_shards(shard_count: int, workers: int) -> list[list[int]]:
+	"""Split shard ids into contiguous, nearly equal ranges.
+
+	>>> split_shards(6, 4)
+	[[0, 1], [2, 3], [4], [5]]
+	"""
+	size, extra = divmod(shard_count, workers)
+	ranges = []
+	start = 0
+	for worker_id in range(workers):
+		end = start + size + (1 if worker_id < extra else 0)
+		ranges.append(list(range(start, end)))
+		start = end
+	return ranges
+
+class Worker:
+	"""One ServerMaid.py process and its restart state"""
+
+	def __init__(self, worker_id: int, shard_ids: list[int], shard_count: int, port: int, env: dict,
+				 start_delay: float = 0.0):
+		"""start_delay: seconds to wait before the first start, so identifies don't overlap other workers'"""
+		self.worker_id = worker_id
+		self.start_delay = start_delay
+		self.env = env
+		self.shard_ids = shard_ids
+		self.shard_count = shard_count
+		self.port = port
+		self.process = None
+		self.started_at = None
+		self.restarts = 0
+		self.backoff = RESTART_BACKOFF_MIN
+
+	@property
+	def alive(self) -> bool:
+		return self.process is not None and self.process.returncode is None
+
+	@property
+	def url(self) -> str:
+		return f"http://127.0.0.1:{self.port}"
+
+	async def start(self):
+		env = dict(
+			os.environ,
+			**self.env,
+			SERVERMAID_WORKER_ID=str(self.worker_id),
+			SERVERMAID_SHARD_IDS=",".join(map(str, self.shard_ids)),
+			SERVERMAID_SHARD_COUNT=str(self.shard_count),
+			SERVERMAID_HEALTH_PORT=str(self.port),
+		)
+		self.process = await asyncio.create_subprocess_exec(sys.executable, WORKER_SCRIPT, env=env)
+		self.started_at = time.monotonic()
+		logging.info(f"Started worker {self.worker_id} (pid {self.process.pid}) for shards {self.shard_ids}")
+
+	async def supervise(self, stopping: asyncio.Event):
+		"""Keep the worker running until the cluster stops"""
+		if self.start_delay:
+			logging.info(f"Starting worker {self.worker_id} in {self.start_delay:.0f}s, after earlier shards identify")
+			try:
+				await asyncio.wait_for(stopping.wait(), self.start_delay)
+				return
+			except asyncio.TimeoutError:
+				pass
+		while not stopping.is_set():
+			await self.start()
+			returncode = await self.process.wait()
+			if stopping.is_set():
+				break
+			uptime = time.monotonic() - self.started_at
+			if uptime >= STABLE_UPTIME:
+				self.backoff = RESTART_BACKOFF_MIN
+			logging.warning(
+				f"Worker {self.worker_id} exited with code {returncode} after {uptime:.0f}s, "
+				f"restarting in {self.backoff:.0f}s"
+			)
+			try:
+				await asyncio.wait_for(stopping.wait(), self.backoff)
+				break
+			except asyncio.TimeoutError:
+				pass
+			self.backoff = min(self.backoff * 2, RESTART_BACKOFF_MAX)
+			self.restarts += 1
+
+	async def stop(self):
+		if not self.alive:
+			return
+		self.process.terminate()
+		try:
+			await asyncio.wait_for(self.process.wait(), SHUTDOWN_GRACE)
+		except asyncio.TimeoutError:
+			logging.warning(f"Worker {self.worker_id} didn't exit in time, killing it")
+			self.process.kill()
+			await self.process.wait()
+
+class Cluster:
+	def __init__(self, workers: int, shard_count: int, port: int, base_port: int):
+		self.shard_count = shard_count
+		self.port = port
+		self.rate_budget = RateBudgetServer(RATE_BUDGET_SOCKET)
+		self.invalidation_bus = InvalidationBusServer(INVALIDATION_BUS_SOCKET)
+		shared_env = {
+			"SERVERMAID_RATE_BUDGET": RATE_BUDGET_SOCKET,
+			"SERVERMAID_INVALIDATION_BUS": INVALIDATION_BUS_SOCKET,
+			"SERVERMAID_WORKERS": str(workers),
+		}
+		# Ranges are contiguous from shard 0, so a range's first id is the number of shards before it.
+		# A worker identifies its own shards one slot apart, so the next one starts after all of them.
+		self.workers = [
+			Worker(worker_id, shard_ids, shard_count, base_port + worker_id, shared_env,
+				   start_delay=shard_ids[0] * IDENTIFY_INTERVAL)
+			for worker_id, shard_ids in enumerate(split_shards(shard_count, workers))
+		]
+		self.stopping = asyncio.Event()
+		self.session = None
+
+	async def fetch(self, worker: Worker, path: str):
+		"""GET path from a worker. Returns (status, body), or (None, None) when it can't be reached."""
+		if not worker.alive:
+			return None, None
+		try:
+			async with self.session.get(worker.url + path) as response:
+				if response.content_type == "application/json":
+					return response.status, await response.json()
+				return response.status, await response.text()
+		except (aiohttp.ClientError, asyncio.TimeoutError):
+			return None, None
+
+	async def fetch_all(self, path: str):
+		return await asyncio.gather(*(self.fetch(worker, path) for worker in self.workers))
+
+	async def health_home(self, request):
+		return web.Response(text="Cluster supervisor is running!")
+
+	async def health_live(self, request):
+		"""Liveness: every worker process is running"""
+		workers = [
+			{"worker": worker.worker_id, "pid": worker.process.pid if worker.process else None,
+			 "alive": worker.alive, "restarts": worker.restarts}
+			for worker in self.workers
+		]
+		live = all(worker["alive"] for worker in workers)
+		return web.json_response({"status": "ok" if live else "degraded", "workers": workers}, status=200 if live else 503)
+
+	async def health_ready(self, request):
+		"""Readiness: every worker reports ready"""
+		results = await self.fetch_all("/readyz")
+		workers = [
+			{"worker": worker.worker_id, "ready": status == 200, "checks": body.get("checks") if isinstance(body, dict) else None}
+			for worker, (status, body) in zip(self.workers, results)
+		]
+		ready = all(worker["ready"] for worker in workers)
+		return web.json_response(
+			{"status": "ready" if ready else "not ready", "workers": workers},
+			status=200 if ready else 503
+		)
+
+	async def health_shards(self, request):
+		results = await self.fetch_all("/shards")
+		reported = {}
+		for worker, (status, body) in zip(self.workers, results):
+			for shard in body.get("shards", []) if isinstance(body, dict) else []:
+				reported[shard["shard"]] = dict(shard, worker=worker.worker_id)
+		shards = []
+		for worker in self.workers:
+			for shard_id in worker.shard_ids:
+				shards.append(reported.get(shard_id) or {
+					"shard": shard_id, "connected": False, "latency_ms": None, "guilds": 0, "worker": worker.worker_id
+				})
+		return web.json_response({"shard_count": self.shard_count, "shards": shards})
+
+	async def metrics_endpoint(self, request):
+		results = await self.fetch_all("/metrics")
+		families = {}
+		for worker, (status, body) in zip(self.workers, results):
+			if status == 200 and isinstance(body, str):
+				merge_metrics(families, body, str(worker.worker_id))
+		lines = [
+			"# HELP servermaid_cluster_worker_up Whether each worker process is running",
+			"# TYPE servermaid_cluster_worker_up gauge",
+		]
+		lines += [f'servermaid_cluster_worker_up{{worker="{w.worker_id}"}} {int(w.alive)}' for w in self.workers]
+		lines += [
+			"# HELP servermaid_cluster_worker_restarts_total Times each worker has been restarted",
+			"# TYPE servermaid_cluster_worker_restarts_total counter",
+		]
+		lines += [f'servermaid_cluster_worker_restarts_total{{worker="{w.worker_id}"}} {w.restarts}' for w in self.workers]
+		budget = self.rate_budget.stats()
+		lines += [
+			"# HELP servermaid_cluster_rate_budget_tokens_total Global rate limit tokens handed out to workers",
+			"# TYPE servermaid_cluster_rate_budget_tokens_total counter",
+			f"servermaid_cluster_rate_budget_tokens_total {budget['granted']}",
+			"# HELP servermaid_cluster_rate_budget_refusals_total Leases refused because a worker had used its share",
+			"# TYPE servermaid_cluster_rate_budget_refusals_total counter",
+			f"servermaid_cluster_rate_budget_refusals_total {budget['refused']}",
+		]
+		for header, samples in families.values():
+			lines += header
+			lines += samples
+		return web.Response(body=("\n".join(lines) + "\n").encode(), headers={"Content-Type": metrics.CONTENT_TYPE})
+
+	async def start_health_server(self):
+		app = web.Application()
+		app.add_routes([
+			web.get("/", self.health_home),
+			web.get("/livez", self.health_live),
+			web.get("/readyz", self.health_ready),
+			web.get("/shards", self.health_shards),
+			web.get("/metrics", self.metrics_endpoint),
+		])
+		runner = web.AppRunner(app, access_log=None)
+		await runner.setup()
+		await web.TCPSite(runner, "0.0.0.0", self.port).start()
+		logging.info(f"Cluster health server listening on port {self.port}")
+		return runner
+
+	async def run(self):
+		loop = asyncio.get_running_loop()
+		for sig in (signal.SIGINT, signal.SIGTERM):
+			loop.add_signal_handler(sig, self.stopping.set)
+		self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=WORKER_REQUEST_TIMEOUT))
+		for socket_path in (RATE_BUDGET_SOCKET, INVALIDATION_BUS_SOCKET):
+			if os.path.exists(socket_path):
+				os.unlink(socket_path)
+		await self.rate_budget.start()
+		await self.invalidation_bus.start()
+		runner = await self.start_health_server()
+		supervisors = [asyncio.create_task(worker.supervise(self.stopping)) for worker in self.workers]
+		try:
+			await self.stopping.wait()
+			logging.info("Stopping workers")
+		finally:
+			self.stopping.set()
+			await asyncio.gather(*(worker.stop() for worker in self.workers))
+			await asyncio.gather(*supervisors, return_exceptions=True)
+			await runner.cleanup()
+			await self.rate_budget.stop()
+			await self.invalidation_bus.stop()
+			await self.session.close()
+
+def merge_metrics(families: dict, text: str, worker_id: str):
+	"""Fold one worker's exposition into families, adding a worker label to every sample.
+
+	families maps a metric name to ([HELP/TYPE lines], [samples]); the
+	header is kept from the first worker that reports the family.
+	"""
+	family = None
+	for line in text.splitlines():
+		if not line:
+			continue
+		if line.startswith("#"):
+			parts = line.split(" ", 3)
+			if len(parts) >= 3 and parts[1] in ("HELP", "TYPE"):
+				family = parts[2]
+				header, samples = families.setdefault(family, ([], []))
+				if not any(h.startswith(f"# {parts[1]} ") for h in header):
+					header.append(line)
+			continue
+		if family is None:
+			continue
+		name, _, value = line.rpartition(" ")
+		label = f'worker="{worker_id}"'
+		if name.endswith("}"):
+			name = f"{name[:-1]},{label}}}"
+		else:
+			name = f"{name}{{{label}}}"
+		families[family][1].append(f"{name} {value}")
+
+def main():
+	parser = argparse.ArgumentParser(description="Run ServerMaid shards across several worker processes")
+	parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="number of worker processes (default: CPU count)")
+	parser.add_argument("--shards", type=int, default=6, help="total shard count (default: 6)")
+	parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="supervisor health server port")
+	parser.add_argument("--base-port", type=int, default=DEFAULT_BASE_PORT, help="worker N serves health checks on base port + N")
+	args = parser.parse_args()
+	if args.workers < 1 or args.shards < 1:
+		parser.error("--workers and --shards must be at least 1")
+	workers = min(args.workers, args.shards)
+	asyncio.run(Cluster(workers, args.shards, args.port, args.base_port).run())
+
+if __name__ == "__main__":
+	main()
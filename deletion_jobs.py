@@ -0,0 +1,90 @@
+"""Persistent deletion jobs.
+
+A job asks for every message in a channel with a snowflake at or below
+upto_id to be deleted (pinned messages are skipped if keep_pinned is set).
+Work proceeds oldest-first, and checkpoint_id records the newest message
+already handled, so a restart resumes where it stopped instead of
+rescanning. There is at most one job per channel: a new request for the
+same channel is merged into the existing job by extending upto_id.
+"""
+import asyncio
+import time
+from typing import NamedTuple
+
+class DeletionJob(NamedTuple):
+	channel_id: str
+	server_id: str
+	upto_id: int
+	keep_pinned: bool
+	checkpoint_id: int
+	deleted: int
+	failed: int
+
+	@property
+	def done(self) -> bool:
+		return self.checkpoint_id >= self.upto_id
+
+_JOB_COLUMNS = 'channel_id, server_id, upto_id, keep_pinned, checkpoint_id, deleted, failed'
+
+def _row_to_job(row) -> DeletionJob | None:
+	if row is None:
+		return None
+	channel_id, server_id, upto_id, keep_pinned, checkpoint_id, deleted, failed = row
+	return DeletionJob(channel_id, server_id, upto_id, bool(keep_pinned), checkpoint_id, deleted, failed)
+
+def _enqueue(conn, channel_id, server_id, upto_id, keep_pinned, checkpoint_id, now):
+	conn.execute(f'''INSERT INTO deletion_jobs ({_JOB_COLUMNS}, created_at, updated_at)
+					 VALUES (?, ?, ?, ?, ?, 0, 0, ?, ?)
+					 ON CONFLICT (channel_id) DO UPDATE SET
+						upto_id = MAX(upto_id, excluded.upto_id),
+						keep_pinned = excluded.keep_pinned,
+						updated_at = excluded.updated_at''',
+				 (channel_id, server_id, upto_id, keep_pinned, checkpoint_id, now, now))
+	row = conn.execute(f'SELECT {_JOB_COLUMNS} FROM deletion_jobs WHERE channel_id = ?', (channel_id,)).fetchone()
+	return _row_to_job(row)
+
+class DeletionJobStore:
+	"""Deletion jobs kept in the deletion_jobs table"""
+
+	def __init__(self, db):
+		self.db = db
+		self._locks = {}
+
+	def lock_for(self, channel_id: str) -> asyncio.Lock:
+		"""Lock held while a job for the channel is being worked on"""
+		lock = self._locks.get(channel_id)
+		if lock is None:
+			lock = self._locks[channel_id] = asyncio.Lock()
+		return lock
+
+	async def enqueue(self, channel_id: str, server_id: str, upto_id: int, keep_pinned: bool,
+					  after_id: int = 0) -> DeletionJob:
+		"""Create a job, or merge into the channel's existing one.
+
+		after_id starts a new job past messages already known to be handled; a merge keeps the existing checkpoint.
+		"""
+		return await self.db.transaction(_enqueue, channel_id, server_id, upto_id, keep_pinned, after_id, time.time())
+
+	async def get(self, channel_id: str) -> DeletionJob | None:
+		row = await self.db.fetchone(f'SELECT {_JOB_COLUMNS} FROM deletion_jobs WHERE channel_id = ?', (channel_id,))
+		return _row_to_job(row)
+
+	async def pending(self) -> list[DeletionJob]:
+		rows = await self.db.fetchall(f'SELECT {_JOB_COLUMNS} FROM deletion_jobs ORDER BY created_at')
+		return [_row_to_job(row) for row in rows]
+
+	async def checkpoint(self, channel_id: str, checkpoint_id: int, deleted: int, failed: int):
+		"""Record progress after a batch. Counts are added to the job's totals."""
+		await self.db.execute('''UPDATE deletion_jobs
+								 SET checkpoint_id = MAX(checkpoint_id, ?), deleted = deleted + ?, failed = failed + ?, updated_at = ?
+								 WHERE channel_id = ?''',
+							  (checkpoint_id, deleted, failed, time.time(), channel_id))
+
+	async def complete(self, channel_id: str, upto_id: int) -> bool:
+		"""Remove the job unless it was extended past upto_id while running"""
+		removed = await self.db.execute('DELETE FROM deletion_jobs WHERE channel_id = ? AND upto_id <= ?',
+										(channel_id, upto_id))
+		return removed > 0
+
+	async def cancel(self, channel_id: str):
+		await self.db.execute('DELETE FROM deletion_jobs WHERE channel_id = ?', (channel_id,))
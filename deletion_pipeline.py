@@ -0,0 +1,138 @@
+"""Streaming fetch-and-delete pipeline.
+
+Three stages connected by bounded queues:
+
+  fetcher     pulls pages of messages (oldest first) and queues them
+  classifier  splits each page into one bulk-deletable chunk and the
+              messages that are too old for bulk delete
+  deleters    a bulk deleter and a single-message deleter run side by side
+
+Deletion starts as soon as the first page arrives, and the bounded queues
+stop the fetcher from running far ahead of the deleters. A page counts as
+done once every message in it has been handled. The checkpoint only moves
+forward over a contiguous run of done pages, so a resumed job never skips
+work.
+"""
+import asyncio
+
+DEFAULT_QUEUED_PAGES = 4
+
+class DeletionPipeline:
+	def __init__(self, fetch_page, delete_bulk, delete_single, checkpoint, is_recent, skip=None,
+				 queued_pages: int = DEFAULT_QUEUED_PAGES):
+		"""
+		fetch_page(after_id) -> list of messages newer than after_id, oldest first; empty when done
+		delete_bulk(messages) / delete_single([message]) -> (deleted, failed)
+		checkpoint(checkpoint_id, deleted, failed) is awaited as pages complete
+		is_recent(message) says whether the message can be bulk deleted
+		skip(message) says whether to leave the message alone (e.g. pinned)
+		"""
+		self._fetch_page = fetch_page
+		self._delete_bulk = delete_bulk
+		self._delete_single = delete_single
+		self._checkpoint = checkpoint
+		self._is_recent = is_recent
+		self._skip = skip
+		self._pages = asyncio.Queue(maxsize=queued_pages)
+		self._bulk = asyncio.Queue(maxsize=queued_pages)
+		self._single = asyncio.Queue(maxsize=queued_pages * 100)
+		# Page bookkeeping for checkpoints
+		self._page_last_id = {}
+		self._page_pending = {}
+		self._next_checkpoint_page = 0
+		self._unflushed = [0, 0]
+		self.deleted = 0
+		self.failed = 0
+		self.pages_fetched = 0
+		self.exhausted = False
+
+	async def run(self, after_id: int, budget: int | None = None) -> tuple[int, int, bool]:
+		"""Delete everything the fetcher yields after after_id.
+
+		Stops fetching once budget messages have been scanned. Returns
+		(deleted, failed, exhausted), where exhausted means the source ran dry.
+		"""
+		tasks = [
+			asyncio.create_task(self._fetcher(after_id, budget)),
+			asyncio.create_task(self._classifier()),
+			asyncio.create_task(self._bulk_deleter()),
+			asyncio.create_task(self._single_deleter()),
+		]
+		try:
+			await asyncio.gather(*tasks)
+		except BaseException:
+			for task in tasks:
+				task.cancel()
+			await asyncio.gather(*tasks, return_exceptions=True)
+			raise
+		return self.deleted, self.failed, self.exhausted
+
+	async def _fetcher(self, after_id: int, budget: int | None):
+		scanned = 0
+		page_number = 0
+		while budget is None or scanned < budget:
+			page = await self._fetch_page(after_id)
+			if not page:
+				self.exhausted = True
+				break
+			self.pages_fetched += 1
+			scanned += len(page)
+			after_id = page[-1].id
+			await self._pages.put((page_number, page))
+			page_number += 1
+		await self._pages.put(None)
+
+	async def _classifier(self):
+		while (item := await self._pages.get()) is not None:
+			page_number, page = item
+			recent = []
+			old = []
+			for msg in page:
+				if self._skip is not None and self._skip(msg):
+					continue
+				(recent if self._is_recent(msg) else old).append(msg)
+
+			self._page_last_id[page_number] = page[-1].id
+			self._page_pending[page_number] = (1 if recent else 0) + len(old)
+			if self._page_pending[page_number] == 0:
+				await self._page_done(page_number)
+				continue
+			if recent:
+				await self._bulk.put((page_number, recent))
+			for msg in old:
+				await self._single.put((page_number, msg))
+		await self._bulk.put(None)
+		await self._single.put(None)
+
+	async def _bulk_deleter(self):
+		while (item := await self._bulk.get()) is not None:
+			page_number, chunk = item
+			await self._record(page_number, await self._delete_bulk(chunk))
+
+	async def _single_deleter(self):
+		while (item := await self._single.get()) is not None:
+			page_number, msg = item
+			await self._record(page_number, await self._delete_single([msg]))
+
+	async def _record(self, page_number: int, result: tuple[int, int]):
+		deleted, failed = result
+		self.deleted += deleted
+		self.failed += failed
+		self._unflushed[0] += deleted
+		self._unflushed[1] += failed
+		self._page_pending[page_number] -= 1
+		if self._page_pending[page_number] == 0:
+			await self._page_done(page_number)
+
+	async def _page_done(self, page_number: int):
+		if page_number != self._next_checkpoint_page:
+			return
+		# Advance over every contiguous finished page
+		checkpoint_id = None
+		while self._page_pending.get(self._next_checkpoint_page) == 0:
+			del self._page_pending[self._next_checkpoint_page]
+			checkpoint_id = self._page_last_id.pop(self._next_checkpoint_page)
+			self._next_checkpoint_page += 1
+		deleted, failed = self._unflushed
+		self._unflushed = [0, 0]
+		await self._checkpoint(checkpoint_id, deleted, failed)
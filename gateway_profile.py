@@ -0,0 +1,38 @@
+"""Gateway intents and client cache settings.
+
+ServerMaid never reads message content or member lists. It needs guild
+and channel state, message create/delete/update events (IDs and pinned
+flags only) and pin updates. Interactions carry their own member data.
+
+  lean  only the guilds and guild_messages intents, no message cache,
+        no member cache beyond the bot itself, no member chunking
+  full  discord.py's defaults plus message_content, as the bot used to run
+
+Pick one with SERVERMAID_GATEWAY_PROFILE (default lean).
+"""
+import discord
+
+PROFILES = ("lean", "full")
+DEFAULT_PROFILE = "lean"
+
+def intents_for(profile: str) -> discord.Intents:
+	if profile == "full":
+		intents = discord.Intents.default()
+		intents.message_content = True
+		intents.dm_messages = False
+		return intents
+	if profile == "lean":
+		return discord.Intents(guilds=True, guild_messages=True)
+	raise ValueError(f"Unknown gateway profile {profile!r}, expected one of {', '.join(PROFILES)}")
+
+def client_options(profile: str) -> dict:
+	"""Keyword arguments for discord.Client (or a Bot) that apply the profile"""
+	intents = intents_for(profile)
+	if profile == "full":
+		return {"intents": intents}
+	return {
+		"intents": intents,
+		"max_messages": None,  # Trimming works from raw events and its own index
+		"member_cache_flags": discord.MemberCacheFlags.none(),
+		"chunk_guilds_at_startup": False,
+	}
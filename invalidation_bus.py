@@ -0,0 +1,149 @@
+"""Cross-process cache invalidation for clustered deployments.
+
+Each worker keeps settings, timezones and premium state in memory. A change
+made by one worker has to reach the others. Otherwise they keep using the
+old values, for example when an entitlement event arrives on a different
+worker than the one running the guild's shard.
+
+The cluster supervisor runs an InvalidationBusServer on a Unix socket that
+forwards every message to all other connected workers. Workers publish a
+(topic, key) pair after writing a change to the database, and subscribers
+reload or drop that key. A message only says what changed, never the new
+value, so the database stays the single source of truth.
+
+A worker that loses its connection (or couldn't connect at startup) might
+miss messages. So when it reconnects, every subscriber is called with key
+None, meaning "anything may be stale". Messages published while
+disconnected are queued and sent on reconnect.
+
+Without a socket path (a single process), publish() does nothing: the
+process already updated its own caches when it made the change.
+"""
+import asyncio
+import json
+import logging
+from collections import deque
+
+RECONNECT_INTERVAL = 5.0  # Seconds between reconnect attempts
+MAX_QUEUED = 1000  # Messages kept while disconnected; older ones are dropped
+
+class InvalidationBusServer:
+	"""Forwards each published message to every other connected worker"""
+
+	def __init__(self, path: str):
+		self.path = path
+		self._server = None
+		self._writers = set()
+		self.forwarded = 0
+
+	async def start(self):
+		self._server = await asyncio.start_unix_server(self._handle, path=self.path)
+		logging.info(f"Invalidation bus listening on {self.path}")
+
+	async def stop(self):
+		if self._server is not None:
+			self._server.close()
+			for writer in list(self._writers):
+				writer.close()
+			await self._server.wait_closed()
+			self._server = None
+
+	async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+		self._writers.add(writer)
+		try:
+			while line := await reader.readline():
+				for other in list(self._writers):
+					if other is not writer and not other.is_closing():
+						other.write(line)
+						self.forwarded += 1
+		except ConnectionError:
+			pass
+		finally:
+			self._writers.discard(writer)
+			writer.close()
+
+class InvalidationBus:
+	"""A worker's connection to the bus"""
+
+	def __init__(self, path: str | None, worker: str | None = None):
+		self.path = path
+		self.worker = worker
+		self._handlers = {}
+		self._queue = deque(maxlen=MAX_QUEUED)
+		self._writer = None
+		self._task = None
+		# Stats
+		self.published = 0
+		self.received = 0
+		self.resyncs = 0
+
+	def subscribe(self, topic: str, handler):
+		"""Call await handler(key) for changes on topic; key None means reload everything"""
+		self._handlers.setdefault(topic, []).append(handler)
+
+	def publish(self, topic: str, key):
+		"""Tell the other workers that key changed under topic"""
+		if self.path is None:
+			return
+		self.published += 1
+		line = json.dumps({"topic": topic, "key": key, "origin": self.worker}).encode() + b"\n"
+		if self._writer is not None and not self._writer.is_closing():
+			self._writer.write(line)
+		else:
+			self._queue.append(line)
+
+	def start(self):
+		if self.path is not None and self._task is None:
+			self._task = asyncio.create_task(self._run(), name="invalidation-bus")
+
+	def stop(self):
+		if self._task is not None:
+			self._task.cancel()
+			self._task = None
+		if self._writer is not None:
+			self._writer.close()
+			self._writer = None
+
+	async def _run(self):
+		missed = False
+		while True:
+			try:
+				reader, writer = await asyncio.open_unix_connection(self.path)
+			except OSError as e:
+				logging.warning(f"Invalidation bus unavailable ({e}), retrying in {RECONNECT_INTERVAL:.0f}s")
+				missed = True
+				await asyncio.sleep(RECONNECT_INTERVAL)
+				continue
+			self._writer = writer
+			while self._queue:
+				writer.write(self._queue.popleft())
+			if missed:
+				await self._dispatch_all(None)
+			try:
+				while line := await reader.readline():
+					message = json.loads(line)
+					self.received += 1
+					await self._dispatch(message["topic"], message["key"])
+			except (ConnectionError, ValueError, KeyError) as e:
+				logging.warning(f"Invalidation bus connection error: {e}")
+			finally:
+				self._writer = None
+				writer.close()
+			logging.warning("Lost invalidation bus connection, reconnecting")
+			missed = True
+			await asyncio.sleep(RECONNECT_INTERVAL)
+
+	async def _dispatch_all(self, key):
+		self.resyncs += 1
+		for topic in list(self._handlers):
+			await self._dispatch(topic, key)
+
+	async def _dispatch(self, topic: str, key):
+		for handler in self._handlers.get(topic, ()):
+			try:
+				await handler(key)
+			except Exception as e:
+				logging.warning(f"Invalidation handler for {topic} failed: {e}")
+
+	def stats(self) -> dict:
+		return {"published": self.published, "received": self.received, "resyncs": self.resyncs}
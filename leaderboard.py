@@ -0,0 +1,90 @@
+"""Per-guild thanks leaderboards.
+
+Streaks are per user (user_thanks), but a leaderboard only lists members of
+the guild it was asked for. guild_thanks records the guilds each user has
+thanked from. guild_leaderboard keeps each guild's top LEADERBOARD_SIZE
+users and is updated in the same transaction as the streak itself, so
+showing a leaderboard is one indexed read of a few rows.
+
+A full top-N table can't tell who should move up when one of its users
+drops or leaves, so in that case the guild's table is rebuilt from
+guild_thanks. Rebuilds only happen then; growing streaks are applied in
+place.
+"""
+
+LEADERBOARD_SIZE = 25  # Rows kept per guild; more than are shown, so members who left can be skipped
+
+def _top(conn, guild_id, size):
+	return conn.execute('''SELECT user_id, streak FROM guild_leaderboard
+						   WHERE guild_id = ? ORDER BY streak DESC, user_id LIMIT ?''', (guild_id, size)).fetchall()
+
+def _rebuild(conn, guild_id, size):
+	conn.execute('DELETE FROM guild_leaderboard WHERE guild_id = ?', (guild_id,))
+	conn.execute('''INSERT INTO guild_leaderboard (guild_id, user_id, streak)
+					SELECT g.guild_id, g.user_id, u.streak
+					FROM guild_thanks g JOIN user_thanks u ON u.user_id = g.user_id
+					WHERE g.guild_id = ?
+					ORDER BY u.streak DESC, g.user_id LIMIT ?''', (guild_id, size))
+
+def _update_guild(conn, guild_id, user_id, streak, size):
+	row = conn.execute('SELECT streak FROM guild_leaderboard WHERE guild_id = ? AND user_id = ?',
+					   (guild_id, user_id)).fetchone()
+	count, lowest = conn.execute('SELECT COUNT(*), MIN(streak) FROM guild_leaderboard WHERE guild_id = ?',
+								 (guild_id,)).fetchone()
+	if row is not None:
+		if streak < row[0] and count >= size:
+			# Someone outside the table may now rank higher
+			_rebuild(conn, guild_id, size)
+		else:
+			conn.execute('UPDATE guild_leaderboard SET streak = ? WHERE guild_id = ? AND user_id = ?',
+						 (streak, guild_id, user_id))
+		return
+	if count < size or streak > lowest:
+		conn.execute('INSERT INTO guild_leaderboard (guild_id, user_id, streak) VALUES (?, ?, ?)',
+					 (guild_id, user_id, streak))
+		if count >= size:
+			conn.execute('''DELETE FROM guild_leaderboard WHERE guild_id = ? AND user_id IN
+							(SELECT user_id FROM guild_leaderboard WHERE guild_id = ?
+							 ORDER BY streak DESC, user_id LIMIT -1 OFFSET ?)''', (guild_id, guild_id, size))
+
+def record_streak(conn, user_id: str, streak: int, guild_id: str | None = None, size: int = LEADERBOARD_SIZE):
+	"""Apply a user's new streak to every leaderboard they are on.
+
+	Must run inside the transaction that wrote the streak to user_thanks.
+	guild_id adds the user to that guild's leaderboard first.
+	"""
+	if guild_id is not None:
+		conn.execute('INSERT OR IGNORE INTO guild_thanks (guild_id, user_id) VALUES (?, ?)', (guild_id, user_id))
+	guild_ids = [row[0] for row in conn.execute('SELECT guild_id FROM guild_thanks WHERE user_id = ?', (user_id,))]
+	for member_guild_id in guild_ids:
+		_update_guild(conn, member_guild_id, user_id, streak, size)
+
+def _add_members(conn, guild_id, user_ids, size):
+	conn.executemany('INSERT OR IGNORE INTO guild_thanks (guild_id, user_id) VALUES (?, ?)',
+					 [(guild_id, user_id) for user_id in user_ids])
+	_rebuild(conn, guild_id, size)
+
+def _forget(conn, guild_id, user_ids, size):
+	conn.executemany('DELETE FROM guild_thanks WHERE guild_id = ? AND user_id = ?',
+					 [(guild_id, user_id) for user_id in user_ids])
+	_rebuild(conn, guild_id, size)
+	return _top(conn, guild_id, size)
+
+class Leaderboard:
+	"""Reads and maintenance for the guild_leaderboard table"""
+
+	def __init__(self, db, size: int = LEADERBOARD_SIZE):
+		self.db = db
+		self.size = size
+
+	async def top(self, guild_id: str) -> list[tuple[str, int]]:
+		"""The guild's top users as (user_id, streak), best first"""
+		return await self.db.run(_top, guild_id, self.size)
+
+	async def add_members(self, guild_id: str, user_ids: list[str]):
+		"""Put users who thanked before membership was tracked onto the guild's leaderboard"""
+		await self.db.transaction(_add_members, guild_id, user_ids, self.size)
+
+	async def forget(self, guild_id: str, user_ids: list[str]) -> list[tuple[str, int]]:
+		"""Take users who left the guild off its leaderboard. Returns the new top rows."""
+		return await self.db.transaction(_forget, guild_id, user_ids, self.size)
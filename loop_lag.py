@@ -0,0 +1,42 @@
+"""Event-loop lag monitor.
+
+A background task sleeps for a fixed interval and records how late the loop
+wakes it up. Sustained lag means something is blocking the loop, and then
+gateway heartbeats and every handler are delayed too.
+"""
+import asyncio
+from collections import deque
+
+class LoopLagMonitor:
+	def __init__(self, interval: float = 0.5, window: int = 20):
+		self.interval = interval
+		self._samples = deque(maxlen=window)
+		self._task = None
+		self.max_lag = 0.0
+		self.total_lag = 0.0
+		self.ticks = 0
+
+	def start(self):
+		if self._task is None:
+			self._task = asyncio.create_task(self._run(), name="loop-lag-monitor")
+
+	def stop(self):
+		if self._task is not None:
+			self._task.cancel()
+			self._task = None
+
+	async def _run(self):
+		loop = asyncio.get_running_loop()
+		while True:
+			expected = loop.time() + self.interval
+			await asyncio.sleep(self.interval)
+			lag = max(0.0, loop.time() - expected)
+			self._samples.append(lag)
+			self.max_lag = max(self.max_lag, lag)
+			self.total_lag += lag
+			self.ticks += 1
+
+	@property
+	def lag(self) -> float:
+		"""Worst lag over the recent window, in seconds"""
+		return max(self._samples, default=0.0)
@@ -0,0 +1,140 @@
+"""In-memory index of the messages in a managed channel.
+
+Each ChannelIndex keeps the channel's message IDs in snowflake (oldest first)
+order together with the set of pinned IDs. It is seeded once from channel
+history and then kept current from gateway events, so deciding what to trim
+never needs another history scan.
+
+An index can be bounded: seeding stops once the channel's limit is reached,
+and only messages at or above floor_id are tracked. overflow then marks that
+older messages exist below the floor. They are all past the limit by
+definition, so they can be paged out with history(before=floor) without
+ever downloading the retained window again.
+"""
+from bisect import bisect_left, bisect_right, insort
+
+class ChannelIndex:
+	"""Ordered message IDs and pinned flags for one channel"""
+
+	__slots__ = ("ids", "pinned", "seeding", "floor_id", "overflow", "_tombstones")
+
+	def __init__(self):
+		self.ids = []
+		self.pinned = set()
+		self.seeding = True
+		self.floor_id = 0
+		self.overflow = False
+		self._tombstones = set()
+
+	def __len__(self) -> int:
+		return len(self.ids)
+
+	def __contains__(self, message_id: int) -> bool:
+		i = bisect_left(self.ids, message_id)
+		return i < len(self.ids) and self.ids[i] == message_id
+
+	def seed(self, messages, overflow: bool = False):
+		"""Merge (message_id, pinned) pairs from a history scan and finish seeding.
+
+		Pass overflow=True if the scan stopped early with older messages left
+		unread; the oldest scanned message becomes the floor. Messages deleted
+		while the scan was running are skipped so the scan cannot resurrect them.
+		"""
+		floor_id = None
+		for message_id, pinned in messages:
+			floor_id = message_id if floor_id is None else min(floor_id, message_id)
+			if message_id in self._tombstones:
+				continue
+			self._insert(message_id)
+			if pinned:
+				self.pinned.add(message_id)
+		if overflow and floor_id is not None:
+			self.floor_id = floor_id
+			self.overflow = True
+		self._tombstones.clear()
+		self.seeding = False
+
+	def _insert(self, message_id: int):
+		ids = self.ids
+		# New messages almost always arrive in snowflake order
+		if not ids or ids[-1] < message_id:
+			ids.append(message_id)
+		elif message_id not in self:
+			insort(ids, message_id)
+
+	def add(self, message_id: int, pinned: bool = False):
+		self._insert(message_id)
+		if pinned:
+			self.pinned.add(message_id)
+
+	def remove(self, message_id: int):
+		if self.seeding:
+			self._tombstones.add(message_id)
+		i = bisect_left(self.ids, message_id)
+		if i < len(self.ids) and self.ids[i] == message_id:
+			del self.ids[i]
+		self.pinned.discard(message_id)
+
+	def remove_many(self, message_ids):
+		message_ids = set(message_ids)
+		if not message_ids:
+			return
+		if self.seeding:
+			self._tombstones.update(message_ids)
+		self.ids = [i for i in self.ids if i not in message_ids]
+		self.pinned.difference_update(message_ids)
+
+	def set_pinned(self, message_id: int, pinned: bool):
+		if pinned and message_id in self:
+			self.pinned.add(message_id)
+		elif not pinned:
+			self.pinned.discard(message_id)
+
+	def replace_pins(self, pinned_ids):
+		"""Replace the pinned set with the channel's current pins"""
+		self.pinned = {i for i in pinned_ids if i in self}
+
+	def ids_between(self, after_id: int, upto_id: int, keep_pinned: bool) -> list[int]:
+		"""Message IDs with after_id < id <= upto_id, oldest first"""
+		ids = self.ids[bisect_right(self.ids, after_id):bisect_right(self.ids, upto_id)]
+		if keep_pinned and self.pinned:
+			return [i for i in ids if i not in self.pinned]
+		return ids
+
+	def excess(self, max_messages: int, keep_pinned: bool) -> int:
+		"""How many messages are over the limit"""
+		count = len(self.ids) - len(self.pinned) if keep_pinned else len(self.ids)
+		return max(0, count - max_messages)
+
+	def trim_cutoff(self, max_messages: int, keep_pinned: bool) -> int | None:
+		"""Plan a trim: the snowflake at or below which every message should go.
+
+		Returns None if the channel is within its limit.
+		"""
+		candidates = self.trim_candidates(max_messages, keep_pinned)
+		if candidates:
+			return candidates[-1]
+		if self.overflow:
+			return self.floor_id - 1
+		return None
+
+	def trim_candidates(self, max_messages: int, keep_pinned: bool) -> list[int]:
+		"""Return the oldest message IDs that exceed max_messages, oldest first.
+
+		When keep_pinned is set, pinned messages are never selected and do not
+		count towards the limit.
+		"""
+		excess = self.excess(max_messages, keep_pinned)
+		if excess == 0:
+			return []
+		if not keep_pinned:
+			return self.ids[:excess]
+
+		candidates = []
+		for message_id in self.ids:
+			if message_id in self.pinned:
+				continue
+			candidates.append(message_id)
+			if len(candidates) == excess:
+				break
+		return candidates
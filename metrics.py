@@ -0,0 +1,158 @@
+"""Minimal Prometheus-style metrics.
+
+Counters, gauges and histograms cheap enough for hot paths: a labelled child
+is looked up once and then updating it is a single attribute add. Values
+owned by other components (cache stats, rate limiter state, shard latency)
+are read at scrape time through registered collectors, so those components
+don't need to know about metrics at all.
+
+render() produces the Prometheus text exposition format (version 0.0.4).
+"""
+from bisect import bisect_left
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _format_labels(labelnames, labelvalues, extra=()) -> str:
+	pairs = list(zip(labelnames, labelvalues)) + list(extra)
+	if not pairs:
+		return ""
+	escaped = (
+		(name, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+		for name, value in pairs
+	)
+	return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+def _format_value(value) -> str:
+	if isinstance(value, bool):
+		return "1" if value else "0"
+	if value != value:
+		return "NaN"
+	if value in (float("inf"), float("-inf")):
+		return "+Inf" if value > 0 else "-Inf"
+	if isinstance(value, float) and value.is_integer():
+		return str(int(value))
+	return repr(value) if isinstance(value, float) else str(value)
+
+class _Value:
+	__slots__ = ("value",)
+
+	def __init__(self):
+		self.value = 0
+
+	def inc(self, amount=1):
+		self.value += amount
+
+	def set(self, value):
+		self.value = value
+
+class _HistogramValue:
+	__slots__ = ("buckets", "counts", "sum", "count")
+
+	def __init__(self, buckets):
+		self.buckets = buckets
+		self.counts = [0] * (len(buckets) + 1)
+		self.sum = 0.0
+		self.count = 0
+
+	def observe(self, value: float):
+		self.counts[bisect_left(self.buckets, value)] += 1
+		self.sum += value
+		self.count += 1
+
+class _Metric:
+	kind = "untyped"
+
+	def __init__(self, name: str, documentation: str, labelnames=(), registry=None):
+		self.name = name
+		self.documentation = documentation
+		self.labelnames = tuple(labelnames)
+		self._children = {}
+		if not self.labelnames:
+			self._default = self._children[()] = self._new_value()
+		(registry or REGISTRY).register(self)
+
+	def _new_value(self):
+		return _Value()
+
+	def labels(self, *labelvalues):
+		"""Get the child for these label values. Keep the result around on hot paths."""
+		child = self._children.get(labelvalues)
+		if child is None:
+			if len(labelvalues) != len(self.labelnames):
+				raise ValueError(f"{self.name} expects labels {self.labelnames}")
+			child = self._children[labelvalues] = self._new_value()
+		return child
+
+	def samples(self):
+		for labelvalues, child in self._children.items():
+			yield self.name, _format_labels(self.labelnames, labelvalues), child.value
+
+class Counter(_Metric):
+	kind = "counter"
+
+	def inc(self, amount=1):
+		self._default.value += amount
+
+class Gauge(_Metric):
+	kind = "gauge"
+
+	def inc(self, amount=1):
+		self._default.value += amount
+
+	def set(self, value):
+		self._default.value = value
+
+class Histogram(_Metric):
+	kind = "histogram"
+
+	def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+		self.buckets = tuple(sorted(buckets))
+		super().__init__(name, documentation, labelnames, registry)
+
+	def _new_value(self):
+		return _HistogramValue(self.buckets)
+
+	def observe(self, value: float):
+		self._default.observe(value)
+
+	def samples(self):
+		for labelvalues, child in self._children.items():
+			cumulative = 0
+			for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+				cumulative += count
+				yield f"{self.name}_bucket", _format_labels(self.labelnames, labelvalues, [("le", _format_value(float(bound)))]), cumulative
+			yield f"{self.name}_sum", _format_labels(self.labelnames, labelvalues), child.sum
+			yield f"{self.name}_count", _format_labels(self.labelnames, labelvalues), child.count
+
+class Registry:
+	def __init__(self):
+		self._metrics = []
+		self._collectors = []
+
+	def register(self, metric):
+		self._metrics.append(metric)
+
+	def register_collector(self, collect):
+		"""collect() returns (name, kind, documentation, [(labels dict, value), ...]) tuples"""
+		self._collectors.append(collect)
+
+	def render(self) -> str:
+		lines = []
+		for metric in self._metrics:
+			lines.append(f"# HELP {metric.name} {metric.documentation}")
+			lines.append(f"# TYPE {metric.name} {metric.kind}")
+			for name, labels, value in metric.samples():
+				lines.append(f"{name}{labels} {_format_value(value)}")
+		for collect in self._collectors:
+			for name, kind, documentation, samples in collect():
+				lines.append(f"# HELP {name} {documentation}")
+				lines.append(f"# TYPE {name} {kind}")
+				for labels, value in samples:
+					lines.append(f"{name}{_format_labels(labels.keys(), labels.values())} {_format_value(value)}")
+		return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+def render() -> str:
+	return REGISTRY.render()
@@ -0,0 +1,240 @@
+"""A request budget shared by every worker process on the host.
+
+Discord's global rate limit applies to the bot token, not to a process, so
+workers that each keep their own global bucket would together go over it.
+The cluster supervisor runs a RateBudgetServer on a Unix socket and every
+worker's RateLimiter takes its global tokens from it through a
+RateBudgetClient.
+
+Each request for tokens costs a round trip to the supervisor, so clients
+lease a few tokens at a time and spend them locally until the window resets.
+Within a window, a worker that has used its fair share (the limit divided by
+the workers active in the last few windows) is refused until the next one.
+An idle worker doesn't hold back the others, and a busy one can't starve them.
+
+Buckets are named, so token-wide route limits can be shared the same way as
+the global one. Per-channel route buckets stay in each worker's RateLimiter:
+a channel's guild lives on exactly one shard, so only one worker uses them.
+
+The protocol is one JSON object per line:
+
+    {"op": "lease", "bucket": "global", "want": 5, "worker": "0"}
+        -> {"granted": 5, "reset_after": 0.42}
+    {"op": "block", "bucket": "global", "seconds": 3.0}
+        -> {"ok": true}
+
+A block (after a global 429) empties the shared bucket at once, but workers
+may still spend the few tokens they already leased for the current window.
+
+If the supervisor can't be reached, a client falls back to a local bucket
+holding its share of the limit, so workers never run unthrottled.
+"""
+import asyncio
+import json
+import logging
+import math
+import time
+
+from rate_limiter import Bucket, GLOBAL_LIMIT
+
+GLOBAL = "global"
+LEASE_SIZE = 5  # Tokens a client asks for per round trip
+ACTIVE_WINDOWS = 3  # Workers that leased within this many windows count toward fair shares
+RECONNECT_INTERVAL = 5.0  # Seconds between reconnect attempts while using the local fallback
+
+class _SharedBucket:
+	__slots__ = ("limit", "window", "used", "reset_at", "used_by", "last_seen")
+
+	def __init__(self, limit: int, window: float):
+		self.limit = limit
+		self.window = window
+		self.used = 0
+		self.reset_at = 0.0
+		self.used_by = {}
+		self.last_seen = {}
+
+	def lease(self, worker: str, want: int, now: float) -> tuple[int, float]:
+		if now >= self.reset_at:
+			self.used = 0
+			self.used_by.clear()
+			self.reset_at = now + self.window
+		self.last_seen[worker] = now
+		horizon = now - self.window * ACTIVE_WINDOWS
+		for other, seen in list(self.last_seen.items()):
+			if seen < horizon:
+				del self.last_seen[other]
+		share = math.ceil(self.limit / len(self.last_seen))
+		granted = max(0, min(want, self.limit - self.used, share - self.used_by.get(worker, 0)))
+		self.used += granted
+		self.used_by[worker] = self.used_by.get(worker, 0) + granted
+		return granted, self.reset_at - now
+
+	def block(self, seconds: float, now: float):
+		self.used = self.limit
+		self.reset_at = max(self.reset_at, now + seconds)
+
+class RateBudgetServer:
+	"""Hands out shared rate limit tokens to the workers of one cluster"""
+
+	def __init__(self, path: str, limits: dict | None = None):
+		self.path = path
+		self.limits = limits or {GLOBAL: (GLOBAL_LIMIT, 1.0)}
+		self._buckets = {name: _SharedBucket(limit, window) for name, (limit, window) in self.limits.items()}
+		self._server = None
+		self._writers = set()
+		# Stats
+		self.leases = 0
+		self.granted = 0
+		self.refused = 0
+
+	async def start(self):
+		self._server = await asyncio.start_unix_server(self._handle, path=self.path)
+		logging.info(f"Rate budget server listening on {self.path}")
+
+	async def stop(self):
+		if self._server is not None:
+			self._server.close()
+			for writer in list(self._writers):
+				writer.close()
+			await self._server.wait_closed()
+			self._server = None
+
+	def _reply(self, request: dict) -> dict:
+		bucket = self._buckets.get(request.get("bucket"))
+		if bucket is None:
+			return {"error": f"unknown bucket {request.get('bucket')!r}"}
+		now = time.monotonic()
+		if request.get("op") == "lease":
+			granted, reset_after = bucket.lease(str(request.get("worker")), int(request.get("want", 1)), now)
+			self.leases += 1
+			self.granted += granted
+			if granted == 0:
+				self.refused += 1
+			return {"granted": granted, "reset_after": reset_after}
+		if request.get("op") == "block":
+			bucket.block(float(request["seconds"]), now)
+			return {"ok": True}
+		return {"error": f"unknown op {request.get('op')!r}"}
+
+	async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+		self._writers.add(writer)
+		try:
+			while line := await reader.readline():
+				try:
+					reply = self._reply(json.loads(line))
+				except (ValueError, KeyError, TypeError) as e:
+					reply = {"error": str(e)}
+				writer.write(json.dumps(reply).encode() + b"\n")
+				await writer.drain()
+		except ConnectionError:
+			pass
+		finally:
+			self._writers.discard(writer)
+			writer.close()
+
+	def stats(self) -> dict:
+		return {"leases": self.leases, "granted": self.granted, "refused": self.refused}
+
+class RateBudgetClient:
+	"""A worker's view of the shared budget, with tokens leased in small batches"""
+
+	def __init__(self, path: str, worker: str, workers: int = 1, limits: dict | None = None):
+		self.path = path
+		self.worker = str(worker)
+		limits = limits or {GLOBAL: (GLOBAL_LIMIT, 1.0)}
+		# Used while the supervisor is unreachable: this worker's share of each limit
+		self._fallback = {
+			name: Bucket(max(1, limit // max(1, workers)), window) for name, (limit, window) in limits.items()
+		}
+		self._leased = {name: [0, 0.0] for name in limits}
+		self._locks = {name: asyncio.Lock() for name in limits}
+		self._io_lock = asyncio.Lock()
+		self._reader = None
+		self._writer = None
+		self._retry_connect_at = 0.0
+		self._pending = set()
+		# Stats
+		self.round_trips = 0
+		self.refusals = 0
+		self.fallback_acquires = 0
+
+	async def _connect(self) -> bool:
+		if self._writer is not None:
+			return True
+		now = time.monotonic()
+		if now < self._retry_connect_at:
+			return False
+		try:
+			self._reader, self._writer = await asyncio.open_unix_connection(self.path)
+			logging.info(f"Connected to rate budget server at {self.path}")
+			return True
+		except OSError as e:
+			self._retry_connect_at = now + RECONNECT_INTERVAL
+			logging.warning(f"Rate budget server unavailable ({e}), using this worker's share of the limit")
+			return False
+
+	def _disconnect(self):
+		if self._writer is not None:
+			self._writer.close()
+		self._reader = self._writer = None
+		self._retry_connect_at = time.monotonic() + RECONNECT_INTERVAL
+
+	async def _request(self, request: dict) -> dict | None:
+		async with self._io_lock:
+			if not await self._connect():
+				return None
+			try:
+				self._writer.write(json.dumps(request).encode() + b"\n")
+				await self._writer.drain()
+				line = await self._reader.readline()
+				if not line:
+					raise ConnectionError("rate budget server closed the connection")
+				self.round_trips += 1
+				return json.loads(line)
+			except (OSError, ValueError) as e:
+				logging.warning(f"Lost rate budget server connection: {e}")
+				self._disconnect()
+				return None
+
+	async def acquire(self, bucket: str = GLOBAL) -> float:
+		"""Take one token from the shared bucket, sleeping until one is available. Returns seconds waited."""
+		waited = 0.0
+		async with self._locks[bucket]:
+			leased = self._leased[bucket]
+			while True:
+				if leased[0] > 0 and time.monotonic() < leased[1]:
+					leased[0] -= 1
+					return waited
+				reply = await self._request({"op": "lease", "bucket": bucket, "want": LEASE_SIZE, "worker": self.worker})
+				if reply is None or "error" in reply:
+					if reply is not None:
+						logging.warning(f"Rate budget server error: {reply['error']}")
+					self.fallback_acquires += 1
+					return waited + await self._fallback[bucket].acquire()
+				reset_after = float(reply["reset_after"])
+				leased[0] = int(reply["granted"])
+				leased[1] = time.monotonic() + reset_after
+				if leased[0] == 0:
+					self.refusals += 1
+					waited += reset_after
+					await asyncio.sleep(reset_after)
+
+	def block(self, seconds: float, bucket: str = GLOBAL):
+		"""Tell every worker to stop using the bucket for seconds, e.g. after a global 429"""
+		self._leased[bucket][0] = 0
+		self._fallback[bucket].block_for(seconds)
+		task = asyncio.get_running_loop().create_task(
+			self._request({"op": "block", "bucket": bucket, "seconds": seconds})
+		)
+		self._pending.add(task)
+		task.add_done_callback(self._pending.discard)
+
+	def close(self):
+		self._disconnect()
+
+	def stats(self) -> dict:
+		return {
+			"round_trips": self.round_trips,
+			"refusals": self.refusals,
+			"fallback_acquires": self.fallback_acquires,
+		}
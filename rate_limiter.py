@@ -0,0 +1,227 @@
+"""Route- and bucket-aware rate limiting for Discord REST calls.
+
+Requests are limited per (route, major parameter) bucket, mirroring how
+Discord itself buckets them, plus one global bucket for the whole token.
+Bucket sizes start from conservative defaults and are corrected from the
+X-RateLimit-* headers on every response and from 429 retry_after values.
+Every response passes through update_from_headers (ServerMaid feeds it
+from an aiohttp trace hook), so that is the one place 429s are handled.
+
+When the bot runs as a cluster, the global bucket is replaced by a budget
+shared with the other worker processes (see rate_budget.py).
+"""
+import asyncio
+import logging
+import re
+import time
+
+ROUTE_HISTORY = "GET /channels/{channel_id}/messages"
+ROUTE_BULK_DELETE = "POST /channels/{channel_id}/messages/bulk-delete"
+ROUTE_DELETE = "DELETE /channels/{channel_id}/messages/{message_id}"
+
+GLOBAL_LIMIT = 50  # Requests per second allowed for the whole bot
+MAX_IDLE_BUCKETS = 10000  # Idle buckets kept before pruning
+DEFAULT_LIMIT = (5, 5.0)  # Requests per window (seconds) for routes we haven't learned yet
+ROUTE_DEFAULTS = {
+	ROUTE_HISTORY: (5, 5.0),
+	ROUTE_BULK_DELETE: (1, 1.0),
+	ROUTE_DELETE: (5, 5.0),
+}
+
+_API_PREFIX = re.compile(r"^/api(?:/v\d+)?")
+_MAJOR_RESOURCES = ("channels", "guilds", "webhooks")
+
+def route_key(method: str, path: str) -> tuple[str, int | None]:
+	"""Turn a request into (route template, major parameter).
+
+	>>> route_key("DELETE", "/api/v10/channels/123456789012345678/messages/223456789012345678")
+	('DELETE /channels/{channel_id}/messages/{message_id}', 123456789012345678)
+	"""
+	path = _API_PREFIX.sub("", path)
+	parts = path.strip("/").split("/")
+	major = None
+	template = []
+	for i, part in enumerate(parts):
+		if part.isdigit() and i > 0:
+			resource = parts[i - 1]
+			if major is None and resource in _MAJOR_RESOURCES:
+				major = int(part)
+			template.append("{" + resource.rstrip("s") + "_id}")
+		else:
+			template.append(part)
+	return f"{method.upper()} /" + "/".join(template), major
+
+class Bucket:
+	"""A fixed-window token bucket: limit requests per window seconds"""
+
+	__slots__ = ("limit", "window", "remaining", "reset_at", "lock")
+
+	def __init__(self, limit: int, window: float):
+		self.limit = limit
+		self.window = window
+		self.remaining = limit
+		self.reset_at = 0.0
+		self.lock = asyncio.Lock()
+
+	def _refill(self, now: float):
+		if now >= self.reset_at:
+			self.remaining = self.limit
+			self.reset_at = now + self.window
+
+	async def acquire(self) -> float:
+		"""Take one token, sleeping until one is available. Returns seconds waited."""
+		waited = 0.0
+		async with self.lock:
+			while True:
+				now = time.monotonic()
+				self._refill(now)
+				if self.remaining > 0:
+					self.remaining -= 1
+					return waited
+				delay = self.reset_at - now
+				waited += delay
+				await asyncio.sleep(delay)
+
+	def block_for(self, seconds: float):
+		"""Exhaust the bucket until seconds from now"""
+		self.remaining = 0
+		self.reset_at = max(self.reset_at, time.monotonic() + seconds)
+
+	def update(self, limit: int | None, remaining: int | None, reset_after: float | None):
+		now = time.monotonic()
+		if limit is not None and limit > 0:
+			self.limit = limit
+		if reset_after is not None:
+			self.reset_at = now + reset_after
+			# First request of a fresh window tells us the window length
+			if limit is not None and remaining == limit - 1:
+				self.window = reset_after
+		if remaining is not None:
+			self.remaining = remaining
+
+class RateLimiter:
+	"""Per-route, per-channel buckets plus the bot-wide global bucket"""
+
+	def __init__(self, global_limit: int = GLOBAL_LIMIT, max_backoff: float = 300.0, budget=None):
+		"""budget: a RateBudgetClient to take global tokens from instead of the local global bucket"""
+		self.max_backoff = max_backoff
+		self.global_bucket = Bucket(global_limit, 1.0)
+		self.budget = budget
+		self._buckets = {}
+		self._route_hashes = {}
+		# Stats
+		self.requests = 0
+		self.waits = 0
+		self.wait_seconds = 0.0
+		self.rate_limited = 0
+		self.global_rate_limited = 0
+		self.shared_rate_limited = 0
+		self.consecutive_429s = 0
+
+	def _bucket(self, route: str, major) -> Bucket:
+		key = (self._route_hashes.get(route, route), major)
+		bucket = self._buckets.get(key)
+		if bucket is None:
+			if len(self._buckets) >= MAX_IDLE_BUCKETS:
+				self._prune()
+			limit, window = ROUTE_DEFAULTS.get(route, DEFAULT_LIMIT)
+			bucket = self._buckets[key] = Bucket(limit, window)
+		return bucket
+
+	def _prune(self):
+		"""Drop buckets whose window has passed; they would start full again anyway"""
+		now = time.monotonic()
+		self._buckets = {
+			key: bucket for key, bucket in self._buckets.items()
+			if bucket.reset_at > now or bucket.lock.locked()
+		}
+
+	async def acquire(self, route: str, major=None):
+		"""Wait for a token on the route's bucket and on the global bucket"""
+		self.requests += 1
+		waited = await self._bucket(route, major).acquire()
+		if self.budget is not None:
+			waited += await self.budget.acquire()
+		else:
+			waited += await self.global_bucket.acquire()
+		if waited > 0:
+			self.waits += 1
+			self.wait_seconds += waited
+			if waited >= 1.0:
+				logging.info(f"Rate limiter waited {waited:.2f} seconds for {route}")
+
+	def update_from_headers(self, method: str, path: str, status: int, headers):
+		"""Learn bucket state from a response's X-RateLimit-* headers"""
+		route, major = route_key(method, path)
+		bucket_hash = headers.get("X-RateLimit-Bucket")
+		if bucket_hash:
+			self._route_hashes[route] = bucket_hash
+
+		if status == 429:
+			# Shared limits are per resource, across every bot: discord.py waits and retries,
+			# but they say nothing about this bucket and don't count against the token
+			if headers.get("X-RateLimit-Scope", "").lower() == "shared":
+				self.rate_limited += 1
+				self.shared_rate_limited += 1
+				logging.info(f"Shared rate limit on {route} (major {major}), not backing off")
+				return
+			# Reset-After has millisecond precision, Retry-After is rounded up to whole seconds
+			retry_after = _float(headers.get("X-RateLimit-Reset-After"))
+			if retry_after is None:
+				retry_after = _float(headers.get("Retry-After"))
+			is_global = headers.get("X-RateLimit-Global", "").lower() == "true"
+			self.increase_backoff(route, major, retry_after, is_global)
+			return
+
+		self._bucket(route, major).update(
+			_int(headers.get("X-RateLimit-Limit")),
+			_int(headers.get("X-RateLimit-Remaining")),
+			_float(headers.get("X-RateLimit-Reset-After"))
+		)
+
+	def increase_backoff(self, route: str, major=None, retry_after: float = None, is_global: bool = False):
+		"""Block the bucket (or everything, for a global limit) after a 429"""
+		self.rate_limited += 1
+		self.consecutive_429s += 1
+		if retry_after is None:
+			bucket = self._bucket(route, major)
+			retry_after = bucket.window * (2 ** self.consecutive_429s)
+		retry_after = min(retry_after, self.max_backoff)
+
+		if is_global:
+			self.global_rate_limited += 1
+			self.global_bucket.block_for(retry_after)
+			if self.budget is not None:
+				self.budget.block(retry_after)
+		else:
+			self._bucket(route, major).block_for(retry_after)
+		logging.warning(f"Rate limited on {'global' if is_global else route} (major {major}), backing off {retry_after:.2f} seconds")
+
+	def reset_backoff(self):
+		if self.consecutive_429s > 0:
+			logging.info("Resetting rate limit backoff")
+			self.consecutive_429s = 0
+
+	def stats(self) -> dict:
+		return {
+			"buckets": len(self._buckets),
+			"requests": self.requests,
+			"waits": self.waits,
+			"wait_seconds": self.wait_seconds,
+			"rate_limited": self.rate_limited,
+			"global_rate_limited": self.global_rate_limited,
+			"shared_rate_limited": self.shared_rate_limited,
+			"consecutive_429s": self.consecutive_429s,
+		}
+
+def _int(value):
+	try:
+		return int(value) if value is not None else None
+	except ValueError:
+		return None
+
+def _float(value):
+	try:
+		return float(value) if value is not None else None
+	except ValueError:
+		return None
@@ -0,0 +1,121 @@
+"""Debounced writer for the server roster files.
+
+Guild joins, leaves and reconnects only mark the roster dirty. At most one
+write happens per interval: the guild list is snapshotted on the event loop,
+then formatted and written in a worker thread. Each file is written to a
+temporary file next to it and renamed over the old one, so readers never
+see a half-written roster.
+
+Two files are written: the human-readable text roster, and the same data
+as JSON for tooling.
+"""
+import asyncio
+import datetime
+import json
+import logging
+import os
+import tempfile
+
+DEFAULT_INTERVAL = 30.0  # Seconds between roster writes
+
+def _write_atomic(path: str, content: str):
+	directory = os.path.dirname(os.path.abspath(path))
+	fd, tmp_path = tempfile.mkstemp(prefix=".roster-", dir=directory)
+	try:
+		os.fchmod(fd, 0o644)
+		with os.fdopen(fd, "w", encoding="utf-8") as f:
+			f.write(content)
+		os.replace(tmp_path, path)
+	except BaseException:
+		try:
+			os.unlink(tmp_path)
+		except OSError:
+			pass
+		raise
+
+def render_text(servers: list[dict], updated_at: datetime.datetime) -> str:
+	lines = sorted(f"{s['name']} (ID: {s['id']}) - Members: {s['member_count']}" for s in servers)
+	header = [
+		"=== Server Maid Monitored Servers ===",
+		f"Last Updated: {updated_at.strftime('%Y-%m-%d %H:%M:%S')}",
+		f"Total Servers: {len(servers)}",
+		"",
+	]
+	return "\n".join(header + lines) + "\n"
+
+def render_json(servers: list[dict], updated_at: datetime.datetime, extra: dict | None = None) -> str:
+	document = {
+		"updated_at": updated_at.isoformat(),
+		"total": len(servers),
+		**(extra or {}),
+		"servers": sorted(servers, key=lambda s: int(s["id"])),
+	}
+	return json.dumps(document, ensure_ascii=False, indent=1) + "\n"
+
+class RosterWriter:
+	def __init__(self, text_path: str, json_path: str, snapshot, interval: float = DEFAULT_INTERVAL, extra: dict | None = None):
+		"""snapshot() returns a list of {"id", "name", "member_count", "shard_id"} dicts.
+
+		extra is merged into the top level of the JSON roster.
+		"""
+		self.text_path = text_path
+		self.json_path = json_path
+		self._snapshot = snapshot
+		self.interval = interval
+		self.extra = extra
+		self._handle = None
+		self._writing = None
+		self._dirty = False
+		# Stats
+		self.marks = 0
+		self.writes = 0
+
+	def mark_dirty(self):
+		"""Ask for a roster write within the next interval. Returns immediately."""
+		self.marks += 1
+		self._dirty = True
+		if self._writing is None:
+			self._schedule()
+
+	def _schedule(self):
+		if self._handle is None:
+			self._handle = asyncio.get_running_loop().call_later(self.interval, self._start_write)
+
+	def _start_write(self):
+		self._handle = None
+		self._writing = asyncio.create_task(self._write())
+
+	async def _write(self):
+		try:
+			await self.flush()
+		finally:
+			self._writing = None
+			# Marks that came in during the write get the next slot
+			if self._dirty:
+				self._schedule()
+
+	async def flush(self):
+		"""Write the roster now"""
+		self._dirty = False
+		servers = self._snapshot()
+		updated_at = datetime.datetime.now()
+		try:
+			await asyncio.to_thread(self._write_files, servers, updated_at)
+			self.writes += 1
+			logging.info(f"✍️ Updated servers list in {self.text_path}")
+		except Exception as e:
+			logging.warning(f"❌ Error writing servers file: {e}")
+
+	def _write_files(self, servers, updated_at):
+		_write_atomic(self.text_path, render_text(servers, updated_at))
+		_write_atomic(self.json_path, render_json(servers, updated_at, self.extra))
+
+	async def close(self):
+		"""Cancel any pending write and write once more if anything changed"""
+		if self._handle is not None:
+			self._handle.cancel()
+			self._handle = None
+		if self._writing is not None:
+			await self._writing
+		if self._dirty:
+			await self.flush()
@@ -0,0 +1,49 @@
+"""Start-up phase timing.
+
+Records when each start-up phase first completes, measured from when this
+module was imported (ServerMaid imports it before anything heavy). Once every
+phase has been reached, a single report line is logged. The timings are also
+exported as metrics, so a slow deploy shows up on a dashboard.
+
+Phases, in the order they normally complete:
+
+  import             module-level setup finished
+  db_init            schema created and the connection pool started
+  cache_warmup       settings and premium state loaded into memory
+  first_shard_ready  the first gateway shard is ready
+  first_trim         the first trim pass finished
+"""
+import logging
+import time
+
+PROCESS_START = time.monotonic()
+PHASES = ("import", "db_init", "cache_warmup", "first_shard_ready", "first_trim")
+
+class StartupTimer:
+	def __init__(self, phases=PHASES, start: float = PROCESS_START, clock=time.monotonic):
+		self.phases = tuple(phases)
+		self.start = start
+		self._clock = clock
+		self.marks = {}
+		self.reported = False
+
+	def mark(self, phase: str):
+		"""Record that phase completed. Only the first call per phase counts."""
+		if phase in self.marks:
+			return
+		self.marks[phase] = self._clock() - self.start
+		logging.info(f"⏱️ Startup phase {phase} reached after {self.marks[phase]:.2f}s")
+		if not self.reported and all(p in self.marks for p in self.phases):
+			self.reported = True
+			logging.info(f"⏱️ Startup report: {self.summary()}")
+
+	def summary(self) -> str:
+		return ", ".join(
+			f"{phase} {self.marks[phase]:.2f}s" if phase in self.marks else f"{phase} pending"
+			for phase in self.phases
+		)
+
+	def collect(self):
+		"""Metrics collector for the phases reached so far"""
+		yield ("servermaid_startup_phase_seconds", "gauge", "Seconds from process start until each start-up phase completed",
+			   [({"phase": phase}, seconds) for phase, seconds in self.marks.items()])
@@ -0,0 +1,181 @@
+"""Async SQLite storage for ServerMaid.
+
+All database work runs on a small dedicated thread pool. Each worker thread
+owns one long-lived WAL-mode connection, so the event loop never blocks on
+disk I/O and statements are served from sqlite3's per-connection statement
+cache instead of being re-prepared on every call.
+"""
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import Histogram
+
+DB_QUERY_SECONDS = Histogram(
+	"servermaid_db_query_seconds",
+	"Time from submitting a database call to getting its result, including pool queueing",
+	["operation"]
+)
+
+SCHEMA = (
+	'''CREATE TABLE IF NOT EXISTS channel_settings
+		 (server_id TEXT, channel_id TEXT, max_messages INTEGER, keep_pinned BOOLEAN, max_age INTEGER,
+		  PRIMARY KEY (server_id, channel_id))''',
+	'''CREATE TABLE IF NOT EXISTS user_thanks
+		 (user_id TEXT, last_thanks_date TEXT, streak INTEGER,
+		  PRIMARY KEY (user_id))''',
+	'''CREATE TABLE IF NOT EXISTS server_settings
+		 (guild_id TEXT, setting_name TEXT, setting_value TEXT,
+		  PRIMARY KEY (guild_id, setting_name))''',
+	'''CREATE TABLE IF NOT EXISTS user_settings
+		 (user_id TEXT, timezone TEXT DEFAULT 'UTC',
+		  PRIMARY KEY (user_id))''',
+	'''CREATE TABLE IF NOT EXISTS deletion_jobs
+		 (channel_id TEXT, server_id TEXT, upto_id INTEGER, keep_pinned BOOLEAN,
+		  checkpoint_id INTEGER DEFAULT 0, deleted INTEGER DEFAULT 0, failed INTEGER DEFAULT 0,
+		  created_at REAL, updated_at REAL,
+		  PRIMARY KEY (channel_id))''',
+	'''CREATE TABLE IF NOT EXISTS guild_thanks
+		 (guild_id TEXT, user_id TEXT,
+		  PRIMARY KEY (guild_id, user_id))''',
+	'''CREATE INDEX IF NOT EXISTS guild_thanks_user ON guild_thanks (user_id)''',
+	'''CREATE TABLE IF NOT EXISTS guild_leaderboard
+		 (guild_id TEXT, user_id TEXT, streak INTEGER,
+		  PRIMARY KEY (guild_id, user_id))''',
+	'''CREATE INDEX IF NOT EXISTS guild_leaderboard_rank ON guild_leaderboard (guild_id, streak DESC)''',
+	'''CREATE INDEX IF NOT EXISTS user_thanks_streak ON user_thanks (streak DESC)''',
+	'''CREATE TABLE IF NOT EXISTS bot_state
+		 (key TEXT, value TEXT,
+		  PRIMARY KEY (key))''',
+)
+
+# Columns added after their table was first created, as (table, column, type).
+# initialize() adds any that an older database is missing.
+ADDED_COLUMNS = (
+	('channel_settings', 'max_age', 'INTEGER'),
+)
+
+DEFAULT_POOL_SIZE = 2
+STATEMENT_CACHE_SIZE = 256
+
+class Database:
+	"""A pool of long-lived SQLite connections behind an async interface"""
+
+	def __init__(self, path: str, pool_size: int = DEFAULT_POOL_SIZE):
+		self.path = path
+		self.pool_size = pool_size
+		self._local = threading.local()
+		self._connections = []
+		self._connections_lock = threading.Lock()
+		self._executor = None
+
+	def _connect(self) -> sqlite3.Connection:
+		conn = sqlite3.connect(
+			self.path,
+			timeout=30.0,
+			check_same_thread=False,
+			cached_statements=STATEMENT_CACHE_SIZE
+		)
+		conn.execute('PRAGMA journal_mode=WAL')
+		conn.execute('PRAGMA synchronous=NORMAL')
+		conn.execute('PRAGMA busy_timeout=30000')
+		return conn
+
+	def _open_worker_connection(self):
+		conn = self._connect()
+		self._local.conn = conn
+		with self._connections_lock:
+			self._connections.append(conn)
+
+	def initialize(self):
+		"""Create the schema and start the worker pool. Safe to call before the event loop runs."""
+		conn = self._connect()
+		try:
+			for statement in SCHEMA:
+				conn.execute(statement)
+			for table, column, column_type in ADDED_COLUMNS:
+				columns = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+				if column not in columns:
+					conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}')
+			conn.commit()
+		finally:
+			conn.close()
+
+		if self._executor is None:
+			self._executor = ThreadPoolExecutor(
+				max_workers=self.pool_size,
+				thread_name_prefix="servermaid-db",
+				initializer=self._open_worker_connection
+			)
+		return self.path
+
+	def close(self):
+		"""Stop the worker pool and close every pooled connection"""
+		if self._executor is not None:
+			self._executor.shutdown(wait=True)
+			self._executor = None
+		with self._connections_lock:
+			for conn in self._connections:
+				try:
+					conn.close()
+				except sqlite3.Error as e:
+					logging.warning(f"Error closing database connection: {e}")
+			self._connections.clear()
+
+	def _call(self, fn, *args):
+		return fn(self._local.conn, *args)
+
+	async def run(self, fn, *args):
+		"""Run fn(conn, *args) on a pooled connection and return its result"""
+		if self._executor is None:
+			raise RuntimeError("Database.initialize() must be called before use")
+		loop = asyncio.get_running_loop()
+		start = time.perf_counter()
+		try:
+			return await loop.run_in_executor(self._executor, self._call, fn, *args)
+		finally:
+			DB_QUERY_SECONDS.labels(fn.__name__.lstrip("_")).observe(time.perf_counter() - start)
+
+	async def fetchone(self, sql: str, params: tuple = ()):
+		return await self.run(_fetchone, sql, params)
+
+	async def fetchall(self, sql: str, params: tuple = ()):
+		return await self.run(_fetchall, sql, params)
+
+	async def execute(self, sql: str, params: tuple = ()) -> int:
+		"""Execute a single write statement and commit it. Returns the affected row count."""
+		return await self.run(_execute, sql, params)
+
+	async def executemany(self, sql: str, seq_of_params) -> int:
+		return await self.run(_executemany, sql, list(seq_of_params))
+
+	async def transaction(self, fn, *args):
+		"""Run fn(conn, *args) inside BEGIN IMMEDIATE ... COMMIT, rolling back on error"""
+		return await self.run(_transaction, fn, *args)
+
+def _fetchone(conn, sql, params):
+	return conn.execute(sql, params).fetchone()
+
+def _fetchall(conn, sql, params):
+	return conn.execute(sql, params).fetchall()
+
+def _execute(conn, sql, params):
+	with conn:
+		return conn.execute(sql, params).rowcount
+
+def _executemany(conn, sql, seq_of_params):
+	with conn:
+		return conn.executemany(sql, seq_of_params).rowcount
+
+def _transaction(conn, fn, *args):
+	conn.execute('BEGIN IMMEDIATE')
+	try:
+		result = fn(conn, *args)
+	except BaseException:
+		conn.rollback()
+		raise
+	conn.commit()
+	return result
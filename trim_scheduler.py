@@ -0,0 +1,102 @@
+"""Background scheduler that coalesces trim requests per channel.
+
+Handlers only mark a channel dirty, which is a dict write. After a short
+debounce window the channel is queued once, and a bounded pool of workers
+runs the trim. A channel is never trimmed by two workers at once. Marks that
+arrive while a channel is being trimmed cause exactly one follow-up pass.
+"""
+import asyncio
+import logging
+import time
+
+class TrimScheduler:
+	def __init__(self, trim, workers: int = 4, debounce: float = 1.0):
+		"""trim is an async callable trim(key, target) run by the worker pool"""
+		self._trim = trim
+		self.workers = workers
+		self.debounce = debounce
+		self._pending = {}
+		self._scheduled = set()
+		self._running = set()
+		self._queue = None
+		self._tasks = []
+		# Stats
+		self.marks = 0
+		self.coalesced = 0
+		self.passes = 0
+		self.failures = 0
+		self.trim_seconds = 0.0
+
+	def start(self):
+		"""Start the worker pool on the running loop. Calling it again is a no-op."""
+		if self._tasks:
+			return
+		self._queue = asyncio.Queue()
+		self._tasks = [
+			asyncio.create_task(self._worker(), name=f"trim-worker-{i}")
+			for i in range(self.workers)
+		]
+
+	async def stop(self):
+		for task in self._tasks:
+			task.cancel()
+		await asyncio.gather(*self._tasks, return_exceptions=True)
+		self._tasks = []
+
+	def mark_dirty(self, key, target):
+		"""Request a trim pass for key. Returns immediately."""
+		self.marks += 1
+		self._pending[key] = target
+		if key in self._scheduled or key in self._running:
+			self.coalesced += 1
+			return
+		self._schedule(key)
+
+	def discard(self, key):
+		"""Forget any pending trim for key"""
+		self._pending.pop(key, None)
+
+	def _schedule(self, key):
+		self._scheduled.add(key)
+		asyncio.get_running_loop().call_later(self.debounce, self._enqueue, key)
+
+	def _enqueue(self, key):
+		if key not in self._pending:
+			self._scheduled.discard(key)
+			return
+		self._queue.put_nowait(key)
+
+	async def _worker(self):
+		while True:
+			key = await self._queue.get()
+			self._scheduled.discard(key)
+			target = self._pending.pop(key, None)
+			if target is None:
+				continue
+
+			self._running.add(key)
+			start = time.perf_counter()
+			try:
+				await self._trim(key, target)
+			except Exception as e:
+				self.failures += 1
+				logging.warning(f"Trim pass failed for {key}: {e}")
+			finally:
+				self.passes += 1
+				self.trim_seconds += time.perf_counter() - start
+				self._running.discard(key)
+				# Marked again while we were trimming: run one follow-up pass
+				if key in self._pending and key not in self._scheduled:
+					self._schedule(key)
+
+	def stats(self) -> dict:
+		return {
+			"marks": self.marks,
+			"coalesced": self.coalesced,
+			"passes": self.passes,
+			"failures": self.failures,
+			"trim_seconds": self.trim_seconds,
+			"pending": len(self._pending),
+			"running": len(self._running),
+			"queued": self._queue.qsize() if self._queue else 0,
+		}